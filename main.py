@@ -4,31 +4,57 @@ import sys
 from src.async_scanner import main_async_scanner
 # Змінено: import AsyncElasticsearch, а не es
 from elasticsearch import AsyncElasticsearch 
-from src.data_ingester import ingest_scan_results, create_index_if_not_exists 
+from src.data_ingester import INDEX_NAME, ingest_scan_results, create_index_if_not_exists
+from src.change_tracker import ChangeTracker
+from src.spool import Spool
+from src.scheduler import RescanScheduler
+from src.checkpoint import ResultAcknowledgements
+from src.metrics import start_metrics_server
 
 async def main():
     print("--- Запуск ScanEngine ---")
 
+    # Локальний спул результатів (src/spool.py): стиснутий NDJSON у форматі bulk API
+    offline_mode = False # True - сканування без кластера, усі результати лише до спулу
+    spool_dir = "spool" # Каталог спулу; None - без спулу (недоступний кластер тоді зупиняє запуск)
+    spool_all_results = False # True - кожна пачка спершу до спулу (локальний архів), потім до кластера
+
     # 1. Ініціалізація клієнта Elasticsearch
     es_client = None # Ініціалізуємо тут для області видимості
+    spool = None
+    metrics_port = None # Порт HTTP-сервера метрик Prometheus (GET /metrics, src/metrics.py); None - вимкнено
+    metrics_server = None
     try:
-        # Змінено: використовуємо новий хост і порт
-        es_client = AsyncElasticsearch([{'host': '172.18.144.1', 'port': 9200, 'scheme': 'http'}])
-        # Перевірка з'єднання
-        if not await es_client.ping():
-            print("Критична помилка: Не вдалося підключитися до Elasticsearch. Завершення роботи.")
-            sys.exit(1)
-        else:
-            print("Успішно підключено до Elasticsearch.")
+        if metrics_port:
+            metrics_server = await start_metrics_server(metrics_port)
+        if not offline_mode:
+            # Змінено: використовуємо новий хост і порт
+            es_client = AsyncElasticsearch([{'host': '172.18.144.1', 'port': 9200, 'scheme': 'http'}])
+            # Перевірка з'єднання
+            if await es_client.ping():
+                print("Успішно підключено до Elasticsearch.")
+            elif spool_dir:
+                print(f"Попередження: Не вдалося підключитися до Elasticsearch. Продовжуємо офлайн - результати до спулу '{spool_dir}'.")
+                await es_client.close()
+                es_client = None
+                offline_mode = True
+            else:
+                print("Критична помилка: Не вдалося підключитися до Elasticsearch. Завершення роботи.")
+                sys.exit(1)
 
         # 2. Перевірка та створення індексу Elasticsearch
         # Передаємо es_client до create_index_if_not_exists
-        if not await create_index_if_not_exists(es_client): 
+        if es_client is not None and not await create_index_if_not_exists(es_client):
             print("Критична помилка: Не вдалося створити/перевірити індекс Elasticsearch. Завершення роботи.")
             sys.exit(1)
+        if spool_dir:
+            spool = Spool(spool_dir)
 
         # 3. Ініціалізація спільних черг
-        scan_results_queue = asyncio.Queue() # Черга для передачі результатів від сканера до ingester'а
+        # Черга для передачі результатів від сканера до ingester'а. Обмежена: повільний кластер сповільнює сканер
+        # (банер-робітники чекають на місце в черзі), а не збільшує споживання пам'яті
+        scan_results_queue_size = 10000
+        scan_results_queue = asyncio.Queue(maxsize=scan_results_queue_size)
         
         # 4. Налаштування параметрів сканування
         # Важливо: використовуйте IP-діапазони, які ви маєте право сканувати!
@@ -36,37 +62,75 @@ async def main():
         ip_ranges = ["scanme.nmap.org"] 
         # Список портів, які потрібно сканувати. Можна також передати None, щоб використати порти за замовчуванням у scanner.py
         ports = [22, 80, 443, 8080] 
-        max_scanner_workers = 100 # Кількість одночасних задач сканування
-        max_ingester_workers = 5  # Кількість одночасних задач введення даних в Elasticsearch
+        max_scanner_workers = None # Кількість одночасних проб; None - автоматично з ліміту файлових дескрипторів (RLIMIT_NOFILE)
+        max_connects_per_second = 1000 # Глобальний ліміт нових з'єднань/с (None - без ліміту)
+        scanner_processes = 1 # Кількість процесів-сканерів; >1 - розподіл цілей між ядрами CPU
+        max_bulk_in_flight = 4 # Кількість одночасних bulk-запитів до Elasticsearch
+        max_ingest_linger = 1.0 # Секунд, які результат може чекати в неповній пачці
+        change_aware_ingest = True # Незмінені сервіси - лише оновлення timestamp_last_seen, first_seen зберігається
+        dead_letter_path = "dead_letter.ndjson" # Документи, що не записались після всіх повторів bulk-запиту
+        # Інкрементальне пересканування (src/scheduler.py): лише нові та прострочені блоки і відомі відкриті порти.
+        # Розраховане на регулярні запуски (наприклад, з cron) - кожен продовжує з того, що прострочено
+        incremental_rescan = False
+        rescan_state_path = "rescan_state.json" # Локальний стан блоків між запусками
+        rescan_max_probes = None # Бюджет проб на запуск (None - без обмеження)
+        # Контрольні точки (src/checkpoint.py): перерваний запуск з тими ж цілями та портами продовжується з місця зупинки
+        checkpoint_dir = "checkpoints" # None - без контрольних точок
+        # Хост фіксується в контрольній точці лише після того, як ingester збереже всі його результати
+        acknowledgements = ResultAcknowledgements() if checkpoint_dir else None
+
+        scheduler = None
+        rescan_plan = None
+        if incremental_rescan:
+            scheduler = RescanScheduler(rescan_state_path, max_probes=rescan_max_probes)
+            rescan_plan = await scheduler.plan(ip_ranges, ports, es_client, INDEX_NAME)
+            print(scheduler.summary_line(rescan_plan))
 
-        # 5. Запуск робітників модуля введення даних (ingester'ів)
-        ingester_tasks = []
-        print(f"Запускаємо {max_ingester_workers} робітників введення даних...")
-        for _ in range(max_ingester_workers):
-            # Передаємо es_client до ingest_scan_results
-            task = asyncio.create_task(ingest_scan_results(es_client, scan_results_queue)) 
-            ingester_tasks.append(task)
+        change_tracker = None
+        # Офлайн завжди з ChangeTracker: без кешу всі документи стають upsert - відтворення спулу не перезапише first_seen
+        if change_aware_ingest or offline_mode:
+            change_tracker = ChangeTracker()
+            if es_client is not None:
+                await change_tracker.seed(es_client, INDEX_NAME, ip_ranges) # Лише документи цілей запуску
+
+        # 5. Запуск модуля введення даних (ingester'а)
+        # Один споживач черги зі спільною адаптивною пачкою; паралельність - через одночасні bulk-запити
+        print(f"Запускаємо модуль введення даних (до {max_bulk_in_flight} одночасних bulk-запитів)...")
+        ingester_task = asyncio.create_task(
+            ingest_scan_results(es_client, scan_results_queue, max_bulk_in_flight=max_bulk_in_flight,
+                                max_linger=max_ingest_linger, change_tracker=change_tracker,
+                                dead_letter_path=dead_letter_path, spool=spool, spool_all=spool_all_results,
+                                on_persisted=acknowledgements)
+        )
         
         # 6. Запуск модуля сканування
         print(f"Запускаємо модуль сканування для діапазонів {ip_ranges}...")
         scanner_task = asyncio.create_task(
-            main_async_scanner(ip_ranges, ports, max_scanner_workers, scan_results_queue)
+            main_async_scanner(ip_ranges, ports, max_scanner_workers, scan_results_queue,
+                               max_connects_per_second=max_connects_per_second, processes=scanner_processes,
+                               plan=rescan_plan, on_result=scheduler.observe if scheduler else None,
+                               checkpoint_dir=checkpoint_dir, acknowledgements=acknowledgements)
         )
 
         # 7. Очікування завершення сканування
         await scanner_task # Чекаємо, поки сканер завершить свою роботу
         print("Модуль сканування завершив збір даних.")
 
-        # 8. Сигнал про завершення для ingester'ів
-        print("Відправляємо сигнали завершення робітникам введення даних...")
-        for _ in range(max_ingester_workers):
-            await scan_results_queue.put(None) # Поміщаємо сигнал None для кожного робітника-ingester'а
+        # 8. Сигнал про завершення для ingester'а
+        print("Відправляємо сигнал завершення модулю введення даних...")
+        await scan_results_queue.put(None)
 
         # 9. Очікування, поки всі результати будуть оброблені та проіндексовані
         print("Очікуємо, поки всі дані будуть проіндексовані...")
         await scan_results_queue.join() # Чекаємо, поки всі завдання в черзі будуть позначені як done
-        await asyncio.gather(*ingester_tasks, return_exceptions=True) # Чекаємо завершення самих ingester'ів
+        await asyncio.gather(ingester_task, return_exceptions=True) # Чекаємо останніх bulk-запитів ingester'а
+        if scheduler is not None:
+            scheduler.commit(rescan_plan) # Лише після завершеного сканування: перерваний запуск повториться повністю
 
+        if offline_mode:
+            print(f"--- Система ScanEngine завершила роботу офлайн. Результати збережено до спулу '{spool_dir}'. ---")
+            print(f"Щоб записати їх до Elasticsearch, виконайте 'python -m src.spool replay {spool_dir}'.")
+            return
         print("--- Система ScanEngine завершила роботу. Всі дані оброблені та проіндексовані. ---")
         print("Тепер ви можете запустити веб-інтерфейс, виконавши 'python src/api.py' та перейти до http://127.0.0.1:5000/search?q=<ваш_запит>")
 
@@ -74,6 +138,11 @@ async def main():
         print(f"Виникла критична помилка в main: {e}")
         sys.exit(1)
     finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        if spool is not None:
+            await spool.close()
+            print(spool.summary_line())
         # Важливо: es_client.close() викликається тут, всередині асинхронної функції
         # Це гарантує, що він буде закритий в межах активного циклу подій.
         if es_client: # Перевіряємо, чи es_client був успішно створений
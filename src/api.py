@@ -1,91 +1,474 @@
 import asyncio
-# atexit більше не потрібен, оскільки клієнт керується async with
-from flask import Flask, request, jsonify
+import atexit
+import json
+import threading
+import time
+import zlib
+import aiohttp
+from flask import Flask, Response, g, request, jsonify
 from elasticsearch import AsyncElasticsearch, ConnectionError, NotFoundError, ApiError
+from elastic_transport import AiohttpHttpNode
+
+from src.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from src.query import LIST_PARAMS, build_facets, build_query, build_search, encode_cursor, parse_fields
+from src.response_cache import ResponseCache, normalize_args
 
 app = Flask(__name__)
 
-# Змінено: es_client_api більше не є глобальним і не ініціалізується тут.
-# Він буде створюватися всередині кожної функції представлення.
 INDEX_NAME = "scan_results"
 
-# Функції _init_es_client_api_sync та _close_es_client_api_async більше не потрібні,
-# оскільки керування клієнтом відбувається через async with у функціях представлення.
+# ---- Конфігурація ----
+# Значення за замовчуванням перекриваються змінними оточення з префіксом SCANENGINE_
+# (наприклад, SCANENGINE_ES_HOSTS=http://localhost:9200, SCANENGINE_ES_POOL_SIZE=32).
+app.config.update(
+    ES_HOSTS="http://172.18.144.1:9200", # Один або кілька вузлів через кому
+    ES_POOL_SIZE=10, # З'єднань на вузол у пулі клієнта
+    ES_KEEPALIVE=60.0, # Секунд, які простійне з'єднання пулу лишається відкритим
+    ES_REQUEST_TIMEOUT=10.0,
+    ES_HEALTH_INTERVAL=5.0, # Секунд між фоновими перевірками доступності кластера (і свіжості даних для кешу)
+    CACHE_SIZE=1024, # Відповідей у кеші API; 0 - без кешу
+    CACHE_TTL=30.0, # Секунд життя кешованої відповіді
+    FACETS_CACHE_TTL=10.0, # Секунд життя кешованих фасетів (коротше за CACHE_TTL - агрегації для дашбордів)
+    EXPORT_PAGE_SIZE=5000, # Документів на сторінку під час експорту
+    EXPORT_KEEP_ALIVE="2m", # Час життя point-in-time між сторінками експорту
+)
+app.config.from_prefixed_env("SCANENGINE")
+
+class KeepAliveNode(AiohttpHttpNode):
+    """
+    aiohttp-вузол з налаштовуваним keep-alive (aiohttp за замовчуванням закриває простійні з'єднання за 15 с).
+    Сесія створюється так само, як у AiohttpHttpNode, але keepalive_timeout передається конструктору TCPConnector.
+    """
+    keepalive_timeout = 60.0
+
+    def _create_aiohttp_session(self):
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            skip_auto_headers=("accept", "accept-encoding", "user-agent"),
+            auto_decompress=True,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            connector=aiohttp.TCPConnector(
+                limit_per_host=self.config.connections_per_node,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                enable_cleanup_closed=True,
+            ),
+        )
+
+class ElasticsearchPool:
+    """
+    Один AsyncElasticsearch на весь час життя застосунку.
+    Flask виконує кожне async-представлення у власному циклі подій, а клієнт (і його пул з'єднань aiohttp)
+    прив'язаний до одного циклу - тому клієнт живе у виділеному потоці зі своїм циклом, а представлення
+    передають туди запити через execute(). Доступність кластера перевіряється у фоні кожні health_interval
+    секунд; представлення лише читають прапорець healthy замість ping() перед кожним запитом.
+    Разом з перевіркою читається найпізніший timestamp_last_seen індексу - його зміна скидає кеш відповідей.
+    """
+
+    def __init__(self, hosts, pool_size, keepalive, request_timeout, health_interval, cache=None):
+        self.hosts = [host.strip() for host in hosts.split(",")] if isinstance(hosts, str) else list(hosts)
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.cache = cache # ResponseCache; використовується лише в циклі пулу
+        self.client = None
+        self.healthy = False
+        self.last_error = None
+        self.loop = None
+        self._thread = None
+        self._health_task = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="es-pool", daemon=True)
+            thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            except BaseException:
+                # Некоректна конфігурація клієнта тощо: не лишати потік і цикл - наступний запит спробує знову
+                if self.client is not None:
+                    try:
+                        asyncio.run_coroutine_threadsafe(self.client.close(), loop).result(timeout=10)
+                    except Exception:
+                        pass
+                    self.client = None
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join(timeout=10)
+                loop.close()
+                raise
+            self._thread = thread
+            self.loop = loop # Лише після відкриття клієнта: інші потоки бачать loop - пул готовий
+
+    async def _open(self):
+        node_class = type("PoolNode", (KeepAliveNode,), {"keepalive_timeout": self.keepalive})
+        self.client = AsyncElasticsearch(self.hosts, connections_per_node=self.pool_size, node_class=node_class,
+                                         request_timeout=self.request_timeout)
+        await self._check_health() # Перша перевірка - до першого запиту
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _check_health(self):
+        try:
+            healthy = await self.client.ping()
+            self.last_error = None if healthy else "ping не вдався"
+        except Exception as e:
+            healthy = False
+            self.last_error = str(e)
+        if healthy != self.healthy:
+            print(f"Elasticsearch {'доступний' if healthy else 'недоступний'} ({', '.join(self.hosts)}).")
+        self.healthy = healthy
+        if healthy and self.cache is not None:
+            await self._refresh_watermark()
+
+    async def _refresh_watermark(self):
+        try:
+            response = await self.client.search(index=INDEX_NAME, size=0,
+                                                 aggs={"latest": {"max": {"field": "timestamp_last_seen"}}})
+            self.cache.observe_watermark(response["aggregations"]["latest"]["value"])
+        except NotFoundError:
+            self.cache.observe_watermark(None)
+        except (ConnectionError, ApiError) as e:
+            print(f"Не вдалося перевірити свіжість даних для кешу: {e}")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self._check_health()
+
+    async def execute(self, coroutine):
+        """Виконує корутину клієнта (наприклад, es_pool.client.search(...)) у циклі пулу та чекає на результат."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    async def _close(self):
+        self._health_task.cancel()
+        await self.client.close()
+
+    def close(self):
+        with self._lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout=10)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=10)
+            self.loop.close()
+            self.loop = None
+
+response_cache = ResponseCache(app.config["CACHE_SIZE"], app.config["CACHE_TTL"]) if app.config["CACHE_SIZE"] > 0 else None
+es_pool = ElasticsearchPool(app.config["ES_HOSTS"], app.config["ES_POOL_SIZE"], app.config["ES_KEEPALIVE"],
+                            app.config["ES_REQUEST_TIMEOUT"], app.config["ES_HEALTH_INTERVAL"], response_cache)
+atexit.register(es_pool.close)
+
+# ---- Метрики (src/metrics.py), GET /metrics ----
+REQUEST_SECONDS = Histogram("scanengine_api_request_seconds", "Час обробки запиту API до відповіді (для /export - до початку потоку)", ["route"])
+REQUESTS = Counter("scanengine_api_requests_total", "Запити API за маршрутом і статусом", ["route", "status"])
+ES_HEALTHY = Gauge("scanengine_api_elasticsearch_up", "1 - кластер Elasticsearch доступний для API")
+ES_HEALTHY.set_function(lambda: int(es_pool.healthy))
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_pool():
+    # Пул (потік і перша перевірка кластера) стартує з першим запитом процесу-воркера, а не під час імпорту
+    if es_pool.loop is None:
+        try:
+            es_pool.start()
+        except Exception as e:
+            es_pool.last_error = str(e)
+            print(f"Не вдалося запустити пул Elasticsearch: {e}")
+            return unavailable_response()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUEST_SECONDS.labels(route).observe(time.perf_counter() - g.request_started)
+    REQUESTS.labels(route, str(response.status_code)).inc()
+    return response
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Метрики процесу API у текстовому форматі Prometheus."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+def unavailable_response():
+    return jsonify({"error": "Elasticsearch недоступний. Перевірте його роботу."}), 503
+
+async def cached_response(key, fetch, ttl=None):
+    """
+    Відповідь через кеш (у циклі пулу): fetch - async-функція, що повертає (статус, payload).
+    ETag - хеш тіла; If-None-Match з тим самим ETag дає 304 без тіла.
+    """
+    if response_cache is None:
+        status, payload = await es_pool.execute(fetch())
+        return jsonify(payload), status
+    entry, outcome = await es_pool.execute(response_cache.get_or_fetch(key, fetch, ttl))
+    headers = {"ETag": entry.etag, "X-Cache": outcome.upper(), "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if entry.status == 200 and (if_none_match.strip() == "*" or entry.etag in (tag.strip() for tag in if_none_match.split(","))):
+        return Response(status=304, headers=headers)
+    return Response(entry.body, status=entry.status, mimetype="application/json", headers=headers)
 
 @app.route('/')
 async def home(): # Робимо функцію асинхронною
     return "Ласкаво просимо до ScanEngine! Використовуйте /search для пошуку."
 
+@app.route('/health', methods=['GET'])
+async def health():
+    status = {"elasticsearch": "ok" if es_pool.healthy else "unavailable", "hosts": es_pool.hosts}
+    if es_pool.last_error:
+        status["error"] = es_pool.last_error
+    return jsonify(status), (200 if es_pool.healthy else 503)
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats():
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **response_cache.stats()})
+
 @app.route('/search', methods=['GET'])
 async def search_data():
-    # Змінено: Створення клієнта Elasticsearch всередині функції представлення
-    # Це гарантує, що клієнт буде коректно створений і закритий для кожного запиту.
-    async with AsyncElasticsearch([{'host': '172.18.144.1', 'port': 9200, 'scheme': 'http'}]) as es_client_per_request:
-        try:
-            if not await es_client_per_request.ping():
-                return jsonify({"error": "Elasticsearch недоступний. Перевірте його роботу."}), 500
-        except ConnectionError as e:
-            print(f"Помилка підключення Elasticsearch для запиту: {e}")
-            return jsonify({"error": "Не вдалося підключитися до Elasticsearch."}), 500
-        
-        # Спрощено запит до match_all для діагностики
-        es_query = {
-            "query": {"match_all": {}},
-            "from": 0, # Починаємо з 0
-            "size": 10, # Обмежуємо 10 результатами для початку
-            "sort": [{"timestamp_last_seen": {"order": "desc"}}]
+    """
+    Пошук: q - текстовий пошук по banner; фільтри port, service, product, version, country, asn, cidr, since/until
+    (див. src/query.py); size - розмір сторінки; after - курсор наступної сторінки з поля "next" попередньої
+    відповіді (search_after - глибокі сторінки такі ж швидкі, як перша); fields - поля документа у відповіді.
+    """
+    if not es_pool.healthy:
+        return unavailable_response()
+
+    try:
+        es_query = build_search(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    async def fetch():
+        response = await es_pool.client.search(index=INDEX_NAME, body=es_query)
+
+        hits = response['hits']['hits']
+        total = response['hits']['total']
+
+        results = [hit['_source'] for hit in hits]
+        # Курсор є, лише якщо сторінка повна - інакше результатів більше немає
+        next_cursor = encode_cursor(hits[-1]['sort']) if len(hits) == es_query["size"] else None
+
+        return 200, {
+            "results": results,
+            "total": total['value'],
+            "total_relation": total['relation'], # "gte" - точна кількість більша (рахуємо до 10000)
+            "size": es_query["size"],
+            "next": next_cursor
         }
 
-        try:
-            response = await es_client_per_request.search(index=INDEX_NAME, body=es_query)
-            
-            hits = response['hits']['hits']
-            total_hits = response['hits']['total']['value']
-
-            results = [hit['_source'] for hit in hits]
-            
-            return jsonify({
-                "results": results,
-                "total": total_hits,
-                "page": 1, 
-                "size": 10
-            })
-        except (ConnectionError, ApiError) as e:
-            print(f"Помилка Elasticsearch API під час пошуку: {e}")
-            # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
-            return jsonify({"error": "Помилка сервера під час пошуку даних."}), 500
-        except Exception as e:
-            print(f"Непередбачена помилка під час пошуку: {e}")
-            # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
-            return jsonify({"error": "Невідома помилка сервера."}), 500
+    try:
+        return await cached_response(("search", normalize_args(request.args, LIST_PARAMS)), fetch)
+    except ApiError as e:
+        if getattr(e, "status_code", None) == 400:
+            return jsonify({"error": f"Некоректний запит: {e.info}"}), 400
+        print(f"Помилка Elasticsearch API під час пошуку: {e}")
+        # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
+        return jsonify({"error": "Помилка сервера під час пошуку даних."}), 500
+    except ConnectionError as e:
+        print(f"Помилка Elasticsearch API під час пошуку: {e}")
+        return jsonify({"error": "Помилка сервера під час пошуку даних."}), 500
+    except Exception as e:
+        print(f"Непередбачена помилка під час пошуку: {e}")
+        # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
+        return jsonify({"error": "Невідома помилка сервера."}), 500
 
 @app.route('/device/<ip_address>/<port>', methods=['GET'])
 async def get_device_details(ip_address, port):
-    async with AsyncElasticsearch([{'host': '172.18.144.1', 'port': 9200, 'scheme': 'http'}]) as es_client_per_request:
-        try:
-            if not await es_client_per_request.ping():
-                return jsonify({"error": "Elasticsearch недоступний. Перевірте його роботу."}), 500
-        except ConnectionError as e:
-            print(f"Помилка підключення Elasticsearch для запиту: {e}")
-            return jsonify({"error": "Не вдалося підключитися до Elasticsearch."}), 500
-        
-        device_id = f"{ip_address}-{port}"
+    if not es_pool.healthy:
+        return unavailable_response()
+
+    device_id = f"{ip_address}-{port}"
+
+    async def fetch():
         try:
-            response = await es_client_per_request.get(index=INDEX_NAME, id=device_id)
-            if response['found']:
-                return jsonify(response['_source'])
-            else:
-                return jsonify({"error": "Пристрій не знайдено."}), 404
+            response = await es_pool.client.get(index=INDEX_NAME, id=device_id)
         except NotFoundError:
-            return jsonify({"error": "Пристрій не знайдено."}), 404
-        except (ConnectionError, ApiError) as e:
-            print(f"Помилка Elasticsearch API під час отримання деталей пристрою: {e}")
-            # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
-            return jsonify({"error": "Помилка сервера під час отримання деталей."}), 500
+            return 404, {"error": "Пристрій не знайдено."}
+        if response['found']:
+            return 200, response['_source']
+        return 404, {"error": "Пристрій не знайдено."}
+
+    try:
+        return await cached_response(("device", device_id), fetch)
+    except (ConnectionError, ApiError) as e:
+        print(f"Помилка Elasticsearch API під час отримання деталей пристрою: {e}")
+        # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
+        return jsonify({"error": "Помилка сервера під час отримання деталей."}), 500
+    except Exception as e:
+        print(f"Непередбачена помилка під час отримання деталей: {e}")
+        # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
+        return jsonify({"error": "Невідома помилка сервера."}), 500
+
+@app.route('/facets', methods=['GET'])
+async def facets_data():
+    """
+    Кількість документів за значеннями port, service, version, country, asn (і product) для підмножини,
+    заданої тими ж фільтрами, що й /search. Усі фасети - один запит агрегацій; результат кешується на FACETS_CACHE_TTL.
+    """
+    if not es_pool.healthy:
+        return unavailable_response()
+
+    try:
+        es_query = build_facets(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    async def fetch():
+        response = await es_pool.client.search(index=INDEX_NAME, body=es_query)
+        facets = {
+            name: {
+                "buckets": [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in aggregation["buckets"]],
+                "other": aggregation["sum_other_doc_count"], # Документи зі значеннями поза верхніми size
+            }
+            for name, aggregation in response["aggregations"].items()
+        }
+        return 200, {"total": response["hits"]["total"]["value"], "facets": facets}
+
+    try:
+        return await cached_response(("facets", normalize_args(request.args, LIST_PARAMS)), fetch, app.config["FACETS_CACHE_TTL"])
+    except ApiError as e:
+        if getattr(e, "status_code", None) == 400:
+            return jsonify({"error": f"Некоректний запит: {e.info}"}), 400
+        print(f"Помилка Elasticsearch API під час агрегації: {e}")
+        return jsonify({"error": "Помилка сервера під час агрегації даних."}), 500
+    except ConnectionError as e:
+        print(f"Помилка Elasticsearch API під час агрегації: {e}")
+        return jsonify({"error": "Помилка сервера під час агрегації даних."}), 500
+    except Exception as e:
+        print(f"Непередбачена помилка під час агрегації: {e}")
+        return jsonify({"error": "Невідома помилка сервера."}), 500
+
+# ---- Експорт ----
+# _shard_doc - найдешевше сортування для повного проходу індексу в межах point-in-time
+EXPORT_SORT = [{"_shard_doc": "asc"}]
+
+class ExportPointInTime:
+    """
+    Point-in-time експорту: актуальний ідентифікатор (Elasticsearch може змінювати його між сторінками)
+    та одноразове закриття - з генератора сторінок або з response.call_on_close, якщо потік так і не почався.
+    """
+
+    def __init__(self, pit_id):
+        self.id = pit_id
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(es_pool.client.close_point_in_time(id=self.id), es_pool.loop).result(timeout=10)
         except Exception as e:
-            print(f"Непередбачена помилка під час отримання деталей: {e}")
-            # traceback.print_exc() # Залишаємо для дебагу, якщо потрібно
-            return jsonify({"error": "Невідома помилка сервера."}), 500
+            print(f"Не вдалося закрити point-in-time експорту: {e}")
+
+def export_pages(pit, query, fields, page_size, limit=None):
+    """
+    Синхронний генератор сторінок (списків hits) у межах point-in-time (ExportPointInTime) з search_after.
+    Наступна сторінка запитується в циклі пулу до того, як поточна віддається клієнту, - мережа до клієнта
+    та запит до Elasticsearch перекриваються, а в пам'яті одночасно не більше двох сторінок.
+    Point-in-time закривається наприкінці, зокрема коли клієнт обірвав завантаження.
+    """
+    keep_alive = app.config["EXPORT_KEEP_ALIVE"]
+
+    def request_page(pit_id, search_after, size):
+        body = {"query": query, "size": size, "sort": EXPORT_SORT, "_source": fields,
+                "pit": {"id": pit_id, "keep_alive": keep_alive}, "track_total_hits": False}
+        if search_after is not None:
+            body["search_after"] = search_after
+        return asyncio.run_coroutine_threadsafe(es_pool.client.search(body=body), es_pool.loop)
+
+    sent = 0
+    requested = min(page_size, limit) if limit else page_size
+    pending = request_page(pit.id, None, requested)
+    try:
+        while pending is not None:
+            response = pending.result()
+            pending = None
+            pit.id = response.get("pit_id", pit.id) # Elasticsearch може оновити ідентифікатор point-in-time
+            hits = response["hits"]["hits"]
+            sent += len(hits)
+            # Неповна сторінка - кінець даних
+            if hits and len(hits) == requested:
+                requested = min(page_size, limit - sent) if limit else page_size
+                if requested > 0:
+                    pending = request_page(pit.id, hits[-1]["sort"], requested)
+            if hits:
+                yield hits
+    finally:
+        if pending is not None:
+            pending.cancel()
+        pit.close()
+
+def export_stream(pit, query, fields, page_size, limit=None, compress=False):
+    """Документи як NDJSON, по одному шматку на сторінку; compress - gzip, що скидається після кожної сторінки."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    exported = 0
+    try:
+        for hits in export_pages(pit, query, fields, page_size, limit):
+            chunk = "".join(json.dumps(hit["_source"], ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                            for hit in hits).encode("utf-8")
+            exported += len(hits)
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+    except (ConnectionError, ApiError) as e:
+        # Статус уже відправлено - обриваємо потік; клієнт побачить неповний файл (без завершення gzip)
+        print(f"Помилка Elasticsearch під час експорту після {exported} документів: {e}")
+
+@app.route('/export', methods=['GET'])
+async def export_data():
+    """
+    Потоковий експорт усіх документів, що відповідають фільтрам /search (q, port, service, cidr, ...), у NDJSON.
+    fields - поля документа (за замовчуванням повний документ); limit - максимум документів;
+    gzip=1 - файл scan_results.ndjson.gz; інакше при Accept-Encoding: gzip - прозоре стиснення (Content-Encoding).
+    """
+    if not es_pool.healthy:
+        return unavailable_response()
+
+    try:
+        query = build_query(request.args)
+        fields = parse_fields(request.args) if request.args.get("fields") else True
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+        if limit is not None and limit < 1:
+            raise ValueError("Параметр 'limit' має бути додатним")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        pit = await es_pool.execute(es_pool.client.open_point_in_time(index=INDEX_NAME,
+                                                                      keep_alive=app.config["EXPORT_KEEP_ALIVE"]))
+    except (ConnectionError, ApiError) as e:
+        print(f"Помилка Elasticsearch API під час відкриття експорту: {e}")
+        return jsonify({"error": "Помилка сервера під час експорту даних."}), 500
+
+    as_file = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    transparent = not as_file and "gzip" in request.headers.get("Accept-Encoding", "")
+    point_in_time = ExportPointInTime(pit["id"])
+    stream = export_stream(point_in_time, query, fields, app.config["EXPORT_PAGE_SIZE"], limit, compress=as_file or transparent)
+    if as_file:
+        response = Response(stream, mimetype="application/gzip",
+                            headers={"Content-Disposition": "attachment; filename=scan_results.ndjson.gz"})
+    else:
+        headers = {"Content-Disposition": "attachment; filename=scan_results.ndjson"}
+        if transparent:
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+        response = Response(stream, mimetype="application/x-ndjson", headers=headers)
+    # Генератор закриває point-in-time лише після початку ітерації; відповідь, яку так і не почали віддавати
+    # (клієнт відключився раніше), закриває його тут
+    response.call_on_close(point_in_time.close)
+    return response
 
 if __name__ == '__main__':
     # Змінено: Інструкції для запуску Hypercorn, без asyncio.run тут
@@ -93,4 +476,10 @@ if __name__ == '__main__':
     print("1. Переконайтеся, що ви активували віртуальне середовище.")
     print("2. Встановіть Hypercorn, якщо ще не встановлено: pip install hypercorn")
     print("3. Запустіть сервер: hypercorn src.api:app --bind 0.0.0.0:5000 --worker-class asyncio --workers 1")
+    print("   Адреса Elasticsearch та пул з'єднань: змінні SCANENGINE_ES_HOSTS, SCANENGINE_ES_POOL_SIZE, SCANENGINE_ES_KEEPALIVE")
+    print("   Кеш відповідей: SCANENGINE_CACHE_SIZE, SCANENGINE_CACHE_TTL; статистика - /cache/stats")
+    print("   Метрики Prometheus (затримка за маршрутами): http://127.0.0.1:5000/metrics")
     print("\nПісля запуску, перейдіть до http://127.0.0.1:5000/search?q=<ваш_запит>")
+    print("Фасети (кількості за port/service/version/country/asn): http://127.0.0.1:5000/facets?since=now-1d")
+    print("Експорт усіх результатів (NDJSON): http://127.0.0.1:5000/export?cidr=10.0.0.0/8&gzip=1")
+    print("Фільтри: &port=22,80 &service=SSH &country=UA &asn=AS15169 &cidr=10.0.0.0/8 &since=now-7d; наступна сторінка: &after=<next>")
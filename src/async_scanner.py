@@ -1,145 +1,643 @@
 import asyncio
-import ipaddress
-import socket
+import multiprocessing
+import queue
 import sys
+import time
+from collections import namedtuple
 
-# Функція для асинхронного сканування одного порту
-async def scan_port_async(ip_address, port, timeout=5):
+from src.checkpoint import DEFAULT_CHECKPOINT_INTERVAL, ResultAcknowledgements, ScanCheckpoint, scan_fingerprint
+from src.metrics import PROGRESS_INTERVAL, REGISTRY, Counter, Gauge, Histogram, report_progress
+from src.probes import PROBES, describe_tls, probe_for, read_until, start_tls
+from src.rate_limit import FairRateLimiter, fd_budget, size_concurrency
+from src.resolver import Resolver
+from src.targets import TARGET_QUEUE_SIZE, produce_planned_targets, produce_targets
+from src.timing import DEFAULT_MAX_READ_TIMEOUT, DEFAULT_MAX_TIMEOUT, DEFAULT_MIN_TIMEOUT, RttEstimator
+
+DEFAULT_PORTS = [22, 80, 443, 8080] # Стандартні порти, якщо виклик не передав свій список
+DEFAULT_MAX_PROBES_PER_HOST = 16 # Одночасних проб на один хост (щоб не перевантажувати окрему ціль)
+DEFAULT_MAX_BANNER_WORKERS = 50 # Одночасних зчитувань банерів (окремо від стадії виявлення)
+
+# Багатопроцесний режим: результати з дочірніх процесів пересилаються пачками кортежів
+RESULT_BATCH_SIZE = 256 # Максимум результатів в одній пачці
+RESULT_BATCH_LINGER = 0.2 # Секунд, скільки неповна пачка може чекати на відправку
+SHARD_QUEUE_BATCHES = 64 # Пачок на процес у міжпроцесній черзі (обмеження пам'яті, зворотний тиск)
+METRICS_FORWARD_INTERVAL = 5.0 # Секунд між знімками метрик дочірнього процесу для батьківського
+
+# ---- Метрики (src/metrics.py) ----
+PROBE_OUTCOMES = Counter("scanengine_probes_total", "Проби виявлення (TCP connect) за результатом", ["outcome"])
+PROBES_OPEN = PROBE_OUTCOMES.labels("open")
+PROBES_CLOSED = PROBE_OUTCOMES.labels("closed")
+PROBES_TIMEOUT = PROBE_OUTCOMES.labels("timeout")
+PROBES_ERROR = PROBE_OUTCOMES.labels("error")
+CONNECT_SECONDS = Histogram("scanengine_connect_seconds", "Час TCP connect до відповіді (SYN-ACK або RST)")
+BANNER_OUTCOMES = Counter("scanengine_banners_total", "Зчитування банерів за результатом", ["outcome"])
+BANNERS_OK = BANNER_OUTCOMES.labels("ok")
+BANNERS_TIMEOUT = BANNER_OUTCOMES.labels("timeout")
+BANNERS_ERROR = BANNER_OUTCOMES.labels("error")
+BANNER_SECONDS = Histogram("scanengine_banner_seconds", "Тривалість стадії банера одного з'єднання")
+HOSTS_SCANNED = Counter("scanengine_hosts_total", "Проскановані хости (усі порти)")
+TARGET_QUEUE_DEPTH = Gauge("scanengine_target_queue_depth", "Цілей у черзі ip_queue")
+BANNER_QUEUE_DEPTH = Gauge("scanengine_banner_queue_depth", "Відкритих з'єднань у черзі стадії банерів")
+
+class ScanResult(namedtuple("ScanResult", ("ip", "port", "banner", "probe", "tls", "sequence", "shard"),
+                            defaults=(None, 0))):
     """
-    Проводить асинхронне SYN-сканування одного порту і намагається отримати банер.
-    Повертає банер, якщо порт відкритий, інакше None.
+    Знахідка сканера: відкритий порт з банером. Кортеж без __dict__ (удвічі менший за dict з тими ж полями) -
+    у черзі результатів їх можуть бути десятки тисяч. Між процесами передається як є (pickle кортежу).
+    ip, port, banner; probe - назва проби банера (src/probes.py); tls - dict TLS або None.
+    sequence, shard - порядковий номер хоста та номер шарду для підтвердження контрольній точці
+    (ResultAcknowledgements, src/checkpoint.py); None - підтвердження не очікується.
+    """
+    __slots__ = ()
+
+# Функції для асинхронного сканування одного порту
+async def connect_port_async(ip_address, port, timeout=5, timing=None):
     """
+    Стадія виявлення: лише TCP-з'єднання, без читання банера.
+    Повертає (reader, writer) для відкритого порту, інакше None.
+    Якщо передано timing (RttEstimator), таймаут з'єднання береться з виміряного RTT хоста,
+    а час успішних з'єднань та RST повертається до оцінювача; інакше використовується фіксований timeout.
+    """
+    connect_timeout = timing.connect_timeout(ip_address) if timing else timeout
+    loop = asyncio.get_running_loop()
+    started = loop.time()
     try:
         # Створення асинхронного сокету
-        reader, writer = await asyncio.open_connection(ip_address, port, timeout=timeout)
-        
-        # Порт відкритий, намагаємося отримати банер
-        try:
-            writer.write(b'\n\\r\\n') # Відправка простого запиту для багатьох сервісів
+        # open_connection не приймає timeout - обмежуємо через wait_for
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip_address, port), timeout=connect_timeout)
+    except ConnectionRefusedError:
+        elapsed = loop.time() - started
+        PROBES_CLOSED.inc()
+        CONNECT_SECONDS.observe(elapsed)
+        if timing: # RST - теж повноцінний вимір RTT
+            timing.observe(ip_address, elapsed)
+        return None # Порт закритий
+    except asyncio.TimeoutError:
+        PROBES_TIMEOUT.inc()
+        if timing:
+            timing.record_connect_timeout(ip_address, connect_timeout)
+        return None # Порт фільтрується або таймаут з'єднання
+    except OSError:
+        PROBES_ERROR.inc()
+        return None # Хост недосяжний тощо
+    except Exception as e:
+        # print(f"Помилка сканування {ip_address}:{port}: {e}") # Для дебагу
+        PROBES_ERROR.inc()
+        return None
+
+    elapsed = loop.time() - started
+    PROBES_OPEN.inc()
+    CONNECT_SECONDS.observe(elapsed)
+    if timing:
+        timing.observe(ip_address, elapsed)
+    return reader, writer
+
+async def grab_banner_async(ip_address, port, reader, writer, timeout=5, timing=None):
+    """
+    Стадія банерів: отримує банер з уже відкритого з'єднання за пробою з таблиці (src/probes.py) та закриває його.
+    Читання завершується, щойно прийшов термінатор проби, а не по таймауту.
+    Повертає (banner, probe_name, tls_info); banner - завжди рядок (банер або опис причини, чому його немає),
+    tls_info - dict з даними TLS/сертифіката або None.
+    """
+    read_timeout = timing.read_timeout(ip_address) if timing else timeout
+    started = time.perf_counter()
+    probe = probe_for(port)
+    if probe.tls and not hasattr(writer, 'start_tls'): # StreamWriter.start_tls з'явився в Python 3.11
+        probe = PROBES["generic"]
+    tls_info = None
+    try:
+        prefix = ""
+        if probe.tls:
+            tls_info = await start_tls(writer, read_timeout)
+            prefix = describe_tls(tls_info)
+        if probe.payload:
+            writer.write(probe.payload)
             await writer.drain()
-            banner = await asyncio.wait_for(reader.read(1024), timeout=timeout)
+        try:
+            banner = await read_until(reader, probe.terminator, probe.max_bytes, read_timeout)
             banner = banner.decode('utf-8', errors='ignore').strip()
-            return banner
         except asyncio.TimeoutError:
-            return f"Порт {port} відкритий (без банера за таймаутом)"
-        except Exception as e:
-            return f"Порт {port} відкритий (помилка отримання банера: {e})"
-        finally:
-            writer.close()
-            await writer.wait_closed()
-    except (ConnectionRefusedError, asyncio.TimeoutError, OSError):
-        return None # Порт закритий, фільтрується або таймаут з'єднання
+            if not prefix:
+                raise
+            banner = "" # TLS-сервіс мовчить, але сертифікат вже є
+        BANNERS_OK.inc()
+        return (f"{prefix}\n{banner}".strip() if prefix else banner), probe.name, tls_info
+    except asyncio.TimeoutError:
+        BANNERS_TIMEOUT.inc()
+        if timing:
+            timing.record_read_timeout(read_timeout)
+        return f"Порт {port} відкритий (без банера за таймаутом)", probe.name, tls_info
     except Exception as e:
-        # print(f"Помилка сканування {ip_address}:{port}: {e}") # Для дебагу
+        BANNERS_ERROR.inc()
+        return f"Порт {port} відкритий (помилка отримання банера: {e})", probe.name, tls_info
+    finally:
+        BANNER_SECONDS.observe(time.perf_counter() - started)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass # Сервер міг вже розірвати з'єднання
+
+async def scan_port_async(ip_address, port, timeout=5, timing=None):
+    """
+    Проводить асинхронне сканування одного порту і намагається отримати банер (обидві стадії підряд).
+    Повертає банер, якщо порт відкритий, інакше None.
+    Конвеєр main_async_scanner використовує стадії окремо.
+    """
+    connection = await connect_port_async(ip_address, port, timeout, timing)
+    if connection is None:
         return None
+    reader, writer = connection
+    banner, _, _ = await grab_banner_async(ip_address, port, reader, writer, timeout, timing)
+    return banner
+
+class StageStats:
+    """Лічильники пропускної здатності однієї стадії конвеєра сканування."""
+
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0 # Скільки елементів стадія обробила
+        self.succeeded = 0 # Скільки з них дали результат (відкритий порт / банер)
+        self.started = time.monotonic()
+        self.finished = None
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def rate(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def summary_line(self):
+        return (f"Стадія '{self.name}': оброблено {self.processed}, успішно {self.succeeded}, "
+                f"{self.rate():.1f}/с.")
+
+class ScanContext:
+    """
+    Спільний стан одного запуску конвеєра: налаштування, ліміти та черги стадій.
+    Стадія виявлення (connect) передає відкриті з'єднання стадії банерів через обмежену banner_queue.
+    """
+
+    def __init__(self, ports, results_queue, max_in_flight, max_probes_per_host, timing, max_banner_workers,
+                 rate_limiter, on_result=None, checkpoint=None, acknowledged=False, shard_index=0):
+        self.ports = ports
+        self.results_queue = results_queue
+        self.on_result = on_result
+        self.checkpoint = checkpoint
+        # True - ingester підтверджує збереження результатів (ResultAcknowledgements); інакше результат
+        # вважається збереженим, щойно потрапив до results_queue
+        self.acknowledged = acknowledged
+        self.shard_index = shard_index
+        self.max_in_flight = max_in_flight
+        self.max_probes_per_host = max_probes_per_host
+        self.probe_slots = asyncio.Semaphore(max_in_flight)
+        self.timing = timing
+        self.rate_limiter = rate_limiter
+        self.max_banner_workers = max_banner_workers
+        # Черга обмежена: якщо стадія банерів не встигає, виявлення пригальмовує, а не накопичує сокети
+        self.banner_queue = asyncio.Queue(maxsize=max_banner_workers * 2)
+        self.discovery_stats = StageStats("виявлення")
+        self.banner_stats = StageStats("банери")
+        self.hosts_scanned = 0
+
+    def progress_summary(self, ip_queue, prefix=""):
+        """Функція для report_progress: підсумок прогресу з темпом проб за останній проміжок."""
+        previous = [self.discovery_stats.processed]
 
-async def worker(ip_queue, results_queue):
+        def summary(elapsed):
+            processed = self.discovery_stats.processed
+            rate = (processed - previous[0]) / elapsed if elapsed > 0 else 0.0
+            previous[0] = processed
+            return (f"{prefix}Прогрес: хостів {self.hosts_scanned}, проб {processed} ({rate:.0f}/с), "
+                    f"відкритих {self.discovery_stats.succeeded}, банерів {self.banner_stats.succeeded}; "
+                    f"черги: цілей {ip_queue.qsize()}, банерів {self.banner_queue.qsize()}, "
+                    f"результатів {self.results_queue.qsize()}.")
+        return summary
+
+def parse_ports(ports_spec):
     """
-    Асинхронний робітник, який бере IP-адреси з черги, сканує їх порти
-    та поміщає результати до черги результатів.
+    Нормалізує список портів: приймає ітерабельне з int або рядок виду "22,80,8000-8100" ("1-65535").
+    Прибирає дублікати зі збереженням порядку. None -> DEFAULT_PORTS.
+    """
+    if ports_spec is None:
+        return list(DEFAULT_PORTS)
+    if isinstance(ports_spec, str):
+        ports_spec = ports_spec.split(',')
+
+    ports = []
+    seen = set()
+    for entry in ports_spec:
+        if isinstance(entry, str):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if '-' in entry:
+                first, last = (int(part) for part in entry.split('-', 1))
+                candidates = range(first, last + 1)
+            else:
+                candidates = (int(entry),)
+        else:
+            candidates = (int(entry),)
+        for port in candidates:
+            if not 1 <= port <= 65535:
+                raise ValueError(f"Некоректний порт: {port}")
+            if port not in seen:
+                seen.add(port)
+                ports.append(port)
+    return ports
+
+async def probe(ctx, ip_address, port, host_slots, sequence=None):
+    """
+    Одна одиниця роботи стадії виявлення (ip, port). Відкрите з'єднання передається стадії банерів.
+    Звільняє слоти хоста та глобального пулу по завершенню.
+    """
+    try:
+        # Токен видається по черзі підмережам, тож жодна ціль не отримує сплеск з'єднань
+        await ctx.rate_limiter.acquire(ctx.timing.subnet_key(ip_address))
+        connection = await connect_port_async(ip_address, port, timing=ctx.timing)
+        ctx.discovery_stats.processed += 1
+        if connection is not None:
+            ctx.discovery_stats.succeeded += 1
+            reader, writer = connection
+            if ctx.checkpoint:
+                ctx.checkpoint.hold(sequence) # Хост не фіксується, поки з'єднання не пройде стадію банерів
+            try:
+                await ctx.banner_queue.put((ip_address, port, reader, writer, sequence))
+            except BaseException: # Скасовано на повній черзі - з'єднання до стадії банерів не дійде
+                writer.close()
+                if ctx.checkpoint:
+                    ctx.checkpoint.release(sequence)
+                raise
+        # else:
+        #     print(f"[{ip_address}:{port}] - Закрито/Фільтрується") # Можна закоментувати для чистоти виводу
+    finally:
+        ctx.probe_slots.release()
+        host_slots.release()
+
+async def scan_host(ctx, ip_address, ports=None, sequence=None):
+    """
+    Планує окремі проби (ip, port) для одного хоста: усі ctx.ports або лише передані ports (план пересканування).
+    Кожна проба спершу займає слот хоста (не більше max_probes_per_host одночасно на хост),
+    а потім слот глобального пулу probe_slots, спільного для всіх хостів.
+    Задачі створюються лише тоді, коли є вільний слот, тож навіть 1-65535 портів не розростаються в пам'яті.
+    """
+    host_slots = asyncio.Semaphore(ctx.max_probes_per_host)
+    pending = set()
+    try:
+        for port in ports or ctx.ports:
+            await host_slots.acquire()
+            try:
+                await ctx.probe_slots.acquire()
+            except BaseException:
+                host_slots.release()
+                raise
+            task = asyncio.create_task(probe(ctx, ip_address, port, host_slots, sequence))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        for task in list(pending): # Лише якщо робітника скасовано - проби не лишаються без власника
+            task.cancel()
+
+async def worker(ctx, ip_queue):
+    """
+    Асинхронний робітник стадії виявлення, який бере IP-адреси з черги та планує проби їх портів
+    у спільному пулі. Елемент черги - (порядковий номер, адреса, порти або None - усі ctx.ports).
+    Кількість робітників визначає лише, скільки хостів обробляються одночасно,
+    загальну кількість активних з'єднань обмежує ctx.probe_slots.
     """
     while True:
-        ip_address = await ip_queue.get()
-        if ip_address is None: # Сигнал завершення
+        target = await ip_queue.get()
+        if target is None: # Сигнал завершення
             ip_queue.task_done()
             break
 
-        ports_to_scan = [22, 80, 443, 8080] # Стандартні порти для початку
-        
-        print(f"Сканування хоста: {ip_address}")
-        for port in ports_to_scan:
-            banner = await scan_port_async(ip_address, port)
-            if banner:
-                result = {
-                    'ip': ip_address,
-                    'port': port,
-                    'banner': banner
-                }
-                await results_queue.put(result)
-                print(f"[Знайдено] {ip_address}:{port} -> {banner[:50]}...") # Обмежити вивід банера
-            # else:
-            #     print(f"[{ip_address}:{port}] - Закрито/Фільтрується") # Можна закоментувати для чистоти виводу
-
-        ip_queue.task_done()
+        sequence, ip_address, ports = target
+        try:
+            await scan_host(ctx, ip_address, ports, sequence)
+            ctx.hosts_scanned += 1
+            HOSTS_SCANNED.inc()
+            if ctx.checkpoint:
+                ctx.checkpoint.complete(sequence)
+        finally:
+            ip_queue.task_done()
 
-async def resolve_hostname(hostname):
+async def banner_worker(ctx):
     """
-    Асинхронно перетворює ім'я хоста на IP-адресу.
-    Використовує run_in_executor для неблокуючого виклику socket.gethostbyname.
+    Робітник стадії банерів: читає банери з відкритих з'єднань і поміщає результати до черги результатів.
     """
-    loop = asyncio.get_running_loop()
-    try:
-        ip_address = await loop.run_in_executor(None, socket.gethostbyname, hostname)
-        return ip_address
-    except socket.gaierror:
-        print(f"Помилка: Не вдалося перетворити ім'я хоста '{hostname}' на IP-адресу.")
-        return None
+    while True:
+        item = await ctx.banner_queue.get()
+        if item is None: # Сигнал завершення
+            ctx.banner_queue.task_done()
+            break
 
-async def main_async_scanner(ip_ranges_cidr, ports_to_scan_override=None, max_scanner_workers=100, results_queue=None):
+        ip_address, port, reader, writer, sequence = item
+        awaiting_acknowledgement = False
+        try:
+            banner, probe_name, tls_info = await grab_banner_async(ip_address, port, reader, writer, timing=ctx.timing)
+            ctx.banner_stats.processed += 1
+            if banner:
+                ctx.banner_stats.succeeded += 1
+                acknowledged = ctx.checkpoint is not None and ctx.acknowledged
+                result = ScanResult(ip_address, port, banner, probe_name, tls_info,
+                                    sequence if acknowledged else None, ctx.shard_index)
+                await ctx.results_queue.put(result)
+                awaiting_acknowledgement = acknowledged
+                if ctx.on_result:
+                    ctx.on_result(result)
+        finally:
+            if ctx.checkpoint and not awaiting_acknowledgement:
+                ctx.checkpoint.release(sequence)
+            ctx.banner_queue.task_done()
+
+def print_timing_summary(timing, max_in_flight):
+    """Виводить підсумок адаптивних таймаутів та оцінку зекономленого часу."""
+    summary = timing.summary()
+    if summary["srtt"] is not None:
+        print(f"RTT: srtt={summary['srtt'] * 1000:.1f} мс, rttvar={summary['rttvar'] * 1000:.1f} мс "
+              f"({summary['rtt_samples']} вимірів).")
+    saved = summary["estimated_time_saved"]
+    # Зекономлені секунди проб діляться між одночасними слотами - це наближення до реального часу
+    print(f"Таймаутів з'єднання: {summary['connect_timeouts']}, читання: {summary['read_timeouts']}. "
+          f"Оцінка зекономленого часу проти фіксованих {timing.baseline_timeout:g} с: "
+          f"{saved:.1f} с проб (~{saved / max_in_flight:.1f} с реального часу).")
+
+async def main_async_scanner(ip_ranges_cidr, ports_to_scan_override=None, max_scanner_workers=100, results_queue=None,
+                             max_probes_per_host=DEFAULT_MAX_PROBES_PER_HOST,
+                             min_timeout=DEFAULT_MIN_TIMEOUT, max_timeout=DEFAULT_MAX_TIMEOUT,
+                             max_banner_workers=DEFAULT_MAX_BANNER_WORKERS, banner_timeout=DEFAULT_MAX_READ_TIMEOUT,
+                             max_connects_per_second=None, processes=1, shard=None, resolver=None, plan=None,
+                             on_result=None, checkpoint_dir=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                             acknowledgements=None):
     """
     Основна асинхронна функція для сканування діапазонів IP.
-    Вона ініціалізує черги та робітників.
+    Вона ініціалізує обмежену чергу цілей, потоковий генератор адрес та дві стадії конвеєра:
+    виявлення (лише connect) і зчитування банерів, з'єднані обмеженою чергою.
+    Робітники стартують одразу, паралельно з генерацією цілей.
+    max_scanner_workers - глобальна межа одночасних проб виявлення (ip, port);
+    None - визначити автоматично з RLIMIT_NOFILE (в будь-якому разі не більше бюджету дескрипторів),
+    max_probes_per_host - межа одночасних проб на один хост.
+    min_timeout/max_timeout - межі адаптивного таймауту з'єднання, що виводиться з виміряного RTT.
+    max_banner_workers/banner_timeout - паралельність і верхня межа таймауту стадії банерів.
+    max_connects_per_second - глобальний ліміт нових з'єднань/с, розподілений між підмережами (None - без ліміту).
+    processes - кількість процесів-сканерів (>1 - шардований режим, кожен процес з власним циклом подій).
+    shard - (index, count), внутрішній параметр дочірнього процесу шардованого режиму.
+    resolver - Resolver для імен хостів серед цілей (None - резолвер з налаштуваннями за замовчуванням).
+    plan - RescanPlan (src/scheduler.py): сканувати лише заплановані блоки та сервіси замість ip_ranges_cidr.
+    on_result - функція, що викликається для кожного результату (у шардованому режимі - в батьківському процесі).
+    checkpoint_dir - каталог контрольних точок (src/checkpoint.py): прогрес зберігається кожні checkpoint_interval
+    секунд, а перерваний запуск з тими ж цілями, портами, кількістю процесів та планом продовжується з місця зупинки.
+    acknowledgements - ResultAcknowledgements, який ingester викликає для збережених результатів (on_persisted):
+    хост фіксується лише після збереження всіх його результатів. None - результат вважається збереженим,
+    щойно потрапив до results_queue.
     """
     if results_queue is None:
         print("Попередження: results_queue не надано. Результати не будуть передані далі.")
         results_queue = asyncio.Queue() # Створити тимчасову чергу, якщо не передано
 
-    ip_queue = asyncio.Queue()
-    all_ips = []
-
-    for ip_entry in ip_ranges_cidr: # Змінено: тепер ip_entry може бути ім'ям хоста або CIDR
-        try:
-            # Спроба перетворити на IP-мережу/адресу
-            network = ipaddress.ip_network(ip_entry, strict=False)
-            all_ips.extend([str(ip) for ip in network.hosts()])
-        except ValueError:
-            # Якщо це не IP-мережа, спробувати перетворити як ім'я хоста
-            resolved_ip = await resolve_hostname(ip_entry)
-            if resolved_ip:
-                # Перетворюємо розпізнаний IP на мережу /32 для сканування
-                all_ips.append(str(ipaddress.ip_network(resolved_ip + "/32").network_address))
-            else:
-                print(f"Пропущено: '{ip_entry}' не є дійсною IP-мережею або іменем хоста.")
-                continue # Пропускаємо цю некоректну сутність
+    ports = parse_ports(ports_to_scan_override)
+    if not ports:
+        print("Список портів порожній. Завершення.")
+        return
 
-    # Видаляємо дублікати IP-адрес
-    all_ips = list(set(all_ips))
-    if not all_ips:
-        print("Не знайдено дійсних IP-адрес для сканування. Завершення.")
-        # Поміщаємо сигнали завершення для робітників, щоб вони не зависали
-        for _ in range(max_scanner_workers):
-            await ip_queue.put(None)
-        await asyncio.gather(*[asyncio.create_task(worker(ip_queue, results_queue)) for _ in range(max_scanner_workers)], return_exceptions=True)
+    if processes > 1:
+        settings = {
+            'max_scanner_workers': -(-max_scanner_workers // processes) if max_scanner_workers else None,
+            'max_probes_per_host': max_probes_per_host,
+            'min_timeout': min_timeout,
+            'max_timeout': max_timeout,
+            'max_banner_workers': -(-max_banner_workers // processes),
+            'banner_timeout': banner_timeout,
+            'max_connects_per_second': max_connects_per_second / processes if max_connects_per_second else None,
+            'resolver_config': resolver.config() if resolver else None,
+            'plan': plan,
+            'checkpoint_dir': checkpoint_dir,
+            'checkpoint_interval': checkpoint_interval,
+        }
+        await scan_sharded(ip_ranges_cidr, ports, processes, results_queue, settings, on_result,
+                           acknowledgements if checkpoint_dir else None)
         return
+    max_scanner_workers, max_banner_workers = size_concurrency(max_scanner_workers, max_banner_workers, fd_budget())
+    max_probes_per_host = max(1, min(max_probes_per_host, len(ports), max_scanner_workers))
 
+    timing = RttEstimator(min_timeout=min_timeout, max_timeout=max_timeout, max_read_timeout=banner_timeout)
+    rate_limiter = FairRateLimiter(max_connects_per_second)
+    checkpoint = None
+    if checkpoint_dir:
+        fingerprint = scan_fingerprint(ip_ranges_cidr, ports, shard[1] if shard else 1, plan)
+        checkpoint = ScanCheckpoint(checkpoint_dir, fingerprint, shard, checkpoint_interval)
+        if acknowledgements is not None:
+            acknowledgements.register(shard[0] if shard else 0, checkpoint.acknowledge)
+        checkpoint.start()
+    ctx = ScanContext(ports, results_queue, max_scanner_workers, max_probes_per_host, timing, max_banner_workers,
+                      rate_limiter, on_result, checkpoint, acknowledgements is not None, shard[0] if shard else 0)
+    ip_queue = asyncio.Queue(maxsize=TARGET_QUEUE_SIZE)
+    TARGET_QUEUE_DEPTH.set_function(ip_queue.qsize)
+    BANNER_QUEUE_DEPTH.set_function(ctx.banner_queue.qsize)
 
-    print(f"Ініціалізація сканування для {len(all_ips)} унікальних хостів.")
+    # Хостів в роботі вдвічі більше, ніж потрібно для заповнення глобального пулу,
+    # щоб пул не простоював, поки хост добирає останні порти
+    host_workers = 2 * -(-max_scanner_workers // max_probes_per_host)
 
-    # Заповнення черги IP-адресами
-    for ip in all_ips:
-        await ip_queue.put(ip)
+    print(f"Порти для сканування: {len(ports)}; проб одночасно: {max_scanner_workers} (на хост: {max_probes_per_host}); "
+          f"зчитувань банерів одночасно: {max_banner_workers}; "
+          f"ліміт з'єднань/с: {max_connects_per_second or 'немає'}.")
 
-    # Створення пулу асинхронних робітників
+    # Створення пулів асинхронних робітників обох стадій
+    banner_workers = [asyncio.create_task(banner_worker(ctx)) for _ in range(max_banner_workers)]
     workers = []
-    for _ in range(max_scanner_workers):
-        worker_task = asyncio.create_task(worker(ip_queue, results_queue))
+    for _ in range(host_workers):
+        worker_task = asyncio.create_task(worker(ctx, ip_queue))
         workers.append(worker_task)
+    # Підсумок раз на PROGRESS_INTERVAL замість рядка на кожен хост і кожну знахідку
+    prefix = f"[Шард {shard[0] + 1}/{shard[1]}] " if shard else ""
+    progress = asyncio.create_task(report_progress(ctx.progress_summary(ip_queue, prefix), PROGRESS_INTERVAL))
 
-    # Очікування завершення всіх завдань у черзі IP-адрес
-    await ip_queue.join()
+    completed = False
+    try:
+        try:
+            # Генератор блокується на повній черзі, тож у пам'яті не більше TARGET_QUEUE_SIZE адрес
+            if plan is not None:
+                queued = await produce_planned_targets(plan, ip_queue, shard, checkpoint)
+            else:
+                queued = await produce_targets(ip_ranges_cidr, ip_queue, shard, resolver, checkpoint)
+        finally:
+            # Сигнали завершення для робітників (після всіх цілей, черга FIFO)
+            for _ in range(host_workers):
+                await ip_queue.put(None)
 
-    # Сигнали завершення для робітників
-    for _ in range(max_scanner_workers):
-        await ip_queue.put(None)
+        # Очікування, поки всі робітники завершать (хоча б спробують завершити)
+        await asyncio.gather(*workers, return_exceptions=True)
+        completed = True
+    finally:
+        progress.cancel()
+        if not completed:
+            # Генератор цілей упав або сканування скасовано: зупиняємо обидві стадії, а не лишаємо робітників
+            # банерів чекати на чергу, і закриваємо з'єднання, що так і не дійшли до стадії банерів
+            for task in workers + banner_workers:
+                task.cancel()
+            await asyncio.gather(*workers, *banner_workers, return_exceptions=True)
+            while not ctx.banner_queue.empty():
+                item = ctx.banner_queue.get_nowait()
+                if item is not None:
+                    item[3].close()
+            await rate_limiter.close()
+            if checkpoint:
+                await checkpoint.finish(False)
+    ctx.discovery_stats.finish()
+    await rate_limiter.close()
+
+    # Виявлення завершено - більше з'єднань не буде, завершуємо стадію банерів
+    for _ in range(max_banner_workers):
+        await ctx.banner_queue.put(None)
+    await asyncio.gather(*banner_workers, return_exceptions=True)
+    ctx.banner_stats.finish()
+    if checkpoint:
+        await checkpoint.finish(True) # Чекає, поки ingester підтвердить останні результати
+
+    if not queued and checkpoint and checkpoint.resumed:
+        print("Усі цілі вже проскановано попереднім (перерваним) запуском. Завершення.")
+    elif not queued:
+        print("Не знайдено дійсних IP-адрес для сканування. Завершення.")
+    else:
+        print(ctx.discovery_stats.summary_line())
+        print(ctx.banner_stats.summary_line())
+        print_timing_summary(timing, max_scanner_workers)
 
-    # Очікування, поки всі робітники завершать (хоча б спробують завершити)
-    await asyncio.gather(*workers, return_exceptions=True)
-    
     # print("Модуль сканування завершив роботу.") # Для дебагу
 
 
+# ---- Багатопроцесний (шардований) режим ----
+async def forward_results(local_queue, shard_queue):
+    """
+    Збирає результати дочірнього процесу (ScanResult) в пачки та відправляє їх батьківському процесу,
+    коли пачка заповнена або чекає довше RESULT_BATCH_LINGER.
+    """
+    loop = asyncio.get_running_loop()
+    batch = []
+    while True:
+        try:
+            result = await asyncio.wait_for(local_queue.get(), timeout=RESULT_BATCH_LINGER) if batch else await local_queue.get()
+        except asyncio.TimeoutError:
+            result = False # Минув час очікування - відправляємо те, що є
+        if result:
+            batch.append(result)
+        if batch and (result is None or result is False or len(batch) >= RESULT_BATCH_SIZE):
+            # put може блокуватись на повній міжпроцесній черзі - не зупиняємо цикл подій
+            await loop.run_in_executor(None, shard_queue.put, batch)
+            batch = []
+        if result is None: # Сигнал завершення
+            break
+
+async def forward_metrics(shard_index, shard_queue):
+    """Періодично надсилає знімок метрик дочірнього процесу батьківському (його /metrics підсумовує шарди)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(METRICS_FORWARD_INTERVAL)
+        await loop.run_in_executor(None, shard_queue.put, ("metrics", shard_index, REGISTRY.snapshot()))
+
+async def receive_acknowledgements(shard_index, ack_queue, acknowledgements):
+    """Підтвердження результатів шарду від ingester'а батьківського процесу -> контрольна точка шарду."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            sequences, persisted = await loop.run_in_executor(None, ack_queue.get, True, 1.0)
+        except queue.Empty:
+            continue
+        acknowledgements.dispatch(shard_index, sequences, persisted)
+
+async def run_shard(ip_ranges_cidr, ports, shard, settings, shard_queue, ack_queue=None):
+    """Сканує один шард у власному циклі подій дочірнього процесу."""
+    local_queue = asyncio.Queue(maxsize=RESULT_BATCH_SIZE * 4)
+    settings = dict(settings)
+    resolver_config = settings.pop('resolver_config')
+    settings['resolver'] = Resolver(**resolver_config) if resolver_config else None
+    forwarder = asyncio.create_task(forward_results(local_queue, shard_queue))
+    metrics_forwarder = asyncio.create_task(forward_metrics(shard[0], shard_queue))
+    receiver = None
+    if ack_queue is not None:
+        settings['acknowledgements'] = ResultAcknowledgements()
+        receiver = asyncio.create_task(receive_acknowledgements(shard[0], ack_queue, settings['acknowledgements']))
+    loop = asyncio.get_running_loop()
+    try:
+        await main_async_scanner(ip_ranges_cidr, ports, results_queue=local_queue, shard=shard, **settings)
+    finally:
+        await local_queue.put(None)
+        await forwarder
+        metrics_forwarder.cancel()
+        if receiver is not None:
+            receiver.cancel()
+        await loop.run_in_executor(None, shard_queue.put, ("metrics", shard[0], REGISTRY.snapshot()))
+        await loop.run_in_executor(None, shard_queue.put, ("finished", shard[0], None))
+
+def shard_process_main(ip_ranges_cidr, ports, shard, settings, shard_queue, ack_queue=None):
+    """Точка входу дочірнього процесу."""
+    asyncio.run(run_shard(ip_ranges_cidr, ports, shard, settings, shard_queue, ack_queue))
+
+async def scan_sharded(ip_ranges_cidr, ports, processes, results_queue, settings, on_result=None, acknowledgements=None):
+    """
+    Ділить простір цілей детерміновано між processes дочірніми процесами (див. iter_addresses)
+    і передає результати всіх шардів до results_queue батьківського процесу.
+    Ліміти паралельності та швидкості діляться між процесами порівну.
+    acknowledgements - підтвердження ingester'а пересилаються контрольній точці відповідного дочірнього процесу.
+    """
+    mp_context = multiprocessing.get_context('spawn') # fork з запущеним циклом подій небезпечний
+    shard_queue = mp_context.Queue(maxsize=processes * SHARD_QUEUE_BATCHES)
+    ack_queues = [mp_context.Queue() if acknowledgements is not None else None for _ in range(processes)]
+    for index, ack_queue in enumerate(ack_queues):
+        if ack_queue is not None:
+            # put не блокується (необмежена черга) - викликається з циклу подій під час обробки пачки ingester'ом
+            acknowledgements.register(index, lambda sequences, persisted, ack_queue=ack_queue: ack_queue.put((sequences, persisted)))
+    workers = [
+        mp_context.Process(target=shard_process_main,
+                           args=(ip_ranges_cidr, ports, (index, processes), settings, shard_queue, ack_queues[index]),
+                           daemon=True)
+        for index in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    print(f"Запущено {processes} процесів-сканерів.")
+
+    loop = asyncio.get_running_loop()
+    finished = 0
+    forwarded = 0
+    while finished < processes:
+        try:
+            batch = await loop.run_in_executor(None, shard_queue.get, True, 1.0)
+        except queue.Empty:
+            if not any(process.is_alive() for process in workers):
+                print("Попередження: процеси-сканери завершились, не надіславши всіх результатів.")
+                break
+            continue
+        if isinstance(batch, tuple): # ("metrics", номер шарду, знімок) або ("finished", номер шарду, None)
+            kind, shard_index, snapshot = batch
+            if kind == "metrics":
+                REGISTRY.set_remote(f"shard-{shard_index}", snapshot)
+            else:
+                finished += 1
+                if acknowledgements is not None:
+                    acknowledgements.unregister(shard_index)
+            continue
+        for result in batch:
+            await results_queue.put(result)
+            if on_result:
+                on_result(result)
+        forwarded += len(batch)
+
+    for process in workers:
+        await loop.run_in_executor(None, process.join)
+    for index, ack_queue in enumerate(ack_queues):
+        if ack_queue is not None:
+            acknowledgements.unregister(index)
+            ack_queue.cancel_join_thread() # Непрочитані підтвердження завершеного процесу не потрібні
+            ack_queue.close()
+    print(f"Шардоване сканування завершено: отримано {forwarded} результатів від {processes} процесів.")
+
 if __name__ == "__main__":
     # Приклад використання для автономного тестування модуля сканування
+    # Запуск з кореня репозиторію: python -m src.async_scanner
     # Уникайте сканування публічних мереж без дозволу.
     # Для тестування можна використовувати:
     # "127.0.0.1/24" (для локальної мережі)
@@ -0,0 +1,558 @@
+import argparse
+import asyncio
+import contextlib
+import gzip
+import ipaddress
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import statistics
+import sys
+import threading
+import time
+
+try:
+    import resource # Немає на Windows
+except ImportError:
+    resource = None
+
+# Відтворюваний бенчмарк конвеєра: локальна ферма TCP-сервісів на loopback, локальна заміна Elasticsearch
+# (_bulk, _search) з затримкою та 429, сценарії scan / ingest / pipeline / api.
+# Ферма та заміна ES працюють в окремих процесах, кожен сценарій - у власному процесі (чистий пік RSS).
+# Усі випадкові вибори - з фіксованим seed, тож однакова конфігурація дає однакове навантаження.
+#
+# Запуск з кореня репозиторію:
+#   python -m src.benchmark                         - усі сценарії, порівняння з benchmark_baseline.json
+#   python -m src.benchmark scan ingest --quick     - окремі сценарії, зменшене навантаження
+#   python -m src.benchmark --repeat 3 --save-baseline   - медіана з 3 запусків як нова базова лінія
+# Базова лінія залежить від машини - зберігайте її на тій машині, де порівнюєте.
+
+DEFAULT_BASELINE_PATH = "benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.10 # Відхилення в гірший бік понад 10% - регресія
+SCENARIO_TIMEOUT = 600.0 # Секунд на один запуск сценарію
+
+# Ферма: кожна пара (адреса, порт) отримує поведінку за вагами mix
+FARM = {
+    "network": "127.77.0.0/22",
+    "ports": [20022, 20080, 20443],
+    "mix": {"banner": 0.6, "delayed": 0.1, "silent": 0.05, "refused": 0.25},
+    "banner_delay": 0.05, # Секунд до банера для "delayed"
+    "seed": 1,
+}
+QUICK_FARM = dict(FARM, network="127.77.0.0/25")
+
+FAKE_ES = {
+    "bulk_latency": 0.02, # Секунд на bulk-запит (плюс до jitter від неї)
+    "search_latency": 0.005,
+    "jitter": 0.5,
+    "reject_ratio": 0.05, # Частка bulk-запитів, відхилених цілком (429)
+    "item_reject_ratio": 0.01, # Частка елементів bulk, відхилених окремо (429)
+    "total_hits": 125000,
+    "seed": 2,
+}
+
+SCENARIOS = {
+    "scan": {"workers": 500, "banner_workers": 100, "banner_timeout": 0.5},
+    "ingest": {"documents": 20000, "change_aware": True, "seed": 3},
+    "pipeline": {"workers": 500, "banner_workers": 100, "banner_timeout": 0.5, "change_aware": True},
+    "api": {"threads": 8, "requests": 2000, "distinct_queries": 200, "seed": 4},
+}
+QUICK_OVERRIDES = {
+    "ingest": {"documents": 2000},
+    "api": {"requests": 200, "distinct_queries": 40},
+}
+FARM_SCENARIOS = ("scan", "pipeline")
+ES_SCENARIOS = ("ingest", "pipeline", "api")
+
+# Метрики, що порівнюються з базовою лінією: більше - краще; решта з суфіксами _ms, _s, _mb - менше - краще
+HIGHER_IS_BETTER = ("probes_per_second", "docs_per_second", "requests_per_second")
+LOWER_IS_BETTER_SUFFIXES = ("_ms", "_s", "_mb")
+
+BANNERS = {
+    20022: [b"SSH-2.0-OpenSSH_8.9p1 Ubuntu-3ubuntu0.%d\r\n", b"SSH-2.0-dropbear_2022.%d\r\n"],
+    20080: [b"HTTP/1.1 200 OK\r\nServer: nginx/1.%d.0\r\nContent-Length: 0\r\n\r\n",
+            b"HTTP/1.1 301 Moved Permanently\r\nServer: Apache/2.4.%d\r\n\r\n"],
+    20443: [b"220 mail.example.com ESMTP Postfix 3.%d\r\n", b"220 ProFTPD 1.3.%d Server ready.\r\n"],
+}
+
+# ---- Ферма TCP-сервісів ----
+def farm_layout(farm):
+    """Детермінований план ферми: [(адреса, порт, поведінка, банер)] для всіх пар, включно з "refused"."""
+    rng = random.Random(farm["seed"])
+    behaviours = list(farm["mix"])
+    weights = [farm["mix"][name] for name in behaviours]
+    layout = []
+    for address in ipaddress.ip_network(farm["network"]).hosts():
+        for port in farm["ports"]:
+            behaviour = rng.choices(behaviours, weights)[0]
+            templates = BANNERS.get(port, [b"220 service ready %d\r\n"])
+            banner = rng.choice(templates) % rng.randrange(1, 30)
+            layout.append((str(address), port, behaviour, banner))
+    return layout
+
+async def serve_farm(farm, ready, stop):
+    from src.rate_limit import fd_budget
+    fd_budget() # Піднімає м'яке обмеження дескрипторів: слухачів тисячі
+
+    def handler(behaviour, banner):
+        async def handle(reader, writer):
+            try:
+                if behaviour == "delayed":
+                    await asyncio.sleep(farm["banner_delay"])
+                if behaviour != "silent":
+                    writer.write(banner)
+                    await writer.drain()
+                await asyncio.wait_for(reader.read(), timeout=10) # Тримаємо з'єднання, доки клієнт не закриє
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+        return handle
+
+    layout = farm_layout(farm)
+    servers = []
+    counts = {}
+    for address, port, behaviour, banner in layout:
+        counts[behaviour] = counts.get(behaviour, 0) + 1
+        if behaviour != "refused":
+            servers.append(await asyncio.start_server(handler(behaviour, banner), address, port, backlog=64))
+    ready.put({"kind": "farm", "network": farm["network"], "ports": farm["ports"], "counts": counts,
+               "listeners": len(servers)})
+    await asyncio.to_thread(stop.wait)
+    for server in servers:
+        server.close()
+
+# ---- Локальна заміна Elasticsearch ----
+class FakeElasticsearch:
+    """
+    Мінімальний HTTP/1.1 сервер (keep-alive) з відповідями у форматі Elasticsearch 8 для шляхів, які використовує
+    ScanEngine: ping, перевірка/створення індексу, _bulk, _search (документи, агрегації, scroll), clear scroll.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.rng = random.Random(config["seed"])
+        self.bulk_requests = 0
+        self.documents = 0
+
+    async def delay(self, latency):
+        await asyncio.sleep(latency * (1 + self.config["jitter"] * self.rng.random()))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if headers.get("content-encoding") == "gzip":
+                    body = gzip.decompress(body)
+                path, _, query_string = target.partition("?")
+                status, payload = await self.dispatch(method, path.rstrip("/") or "/", query_string, body)
+                data = b"" if method == "HEAD" else json.dumps(payload).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                             f"X-Elastic-Product: Elasticsearch\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, query_string, body):
+        parts = [part for part in path.split("/") if part]
+        if not parts:
+            return 200, {"name": "benchmark", "cluster_name": "benchmark", "tagline": "You Know, for Search",
+                         "version": {"number": "8.11.0", "build_flavor": "default"}}
+        if parts[-1] == "_bulk":
+            return await self.bulk(body)
+        if parts == ["_search", "scroll"]:
+            return 200, {"succeeded": True, "num_freed": 1} if method == "DELETE" else self.empty_hits()
+        if parts[-1] == "_search":
+            return await self.search(json.loads(body) if body else {}, "scroll=" in query_string)
+        if len(parts) == 1 and method in ("HEAD", "GET", "PUT"):
+            return 200, {"acknowledged": True, "index": parts[0]} # Індекс вже існує / створено
+        return 404, {"error": {"type": "resource_not_found_exception", "reason": path}, "status": 404}
+
+    async def bulk(self, body):
+        self.bulk_requests += 1
+        await self.delay(self.config["bulk_latency"])
+        if self.rng.random() < self.config["reject_ratio"]:
+            return 429, {"error": {"type": "es_rejected_execution_exception", "reason": "benchmark"}, "status": 429}
+        items = []
+        errors = False
+        lines = body.splitlines()
+        index = 0
+        while index < len(lines):
+            action = json.loads(lines[index])
+            kind = next(iter(action))
+            index += 1 if kind == "delete" else 2
+            if self.rng.random() < self.config["item_reject_ratio"]:
+                errors = True
+                items.append({kind: {"status": 429, "error": {"type": "es_rejected_execution_exception"}}})
+            else:
+                self.documents += 1
+                items.append({kind: {"_id": action[kind].get("_id"), "status": 201, "result": "created"}})
+        return 200, {"took": 1, "errors": errors, "items": items}
+
+    def empty_hits(self):
+        return {"_scroll_id": "benchmark", "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}}
+
+    async def search(self, body, scroll):
+        await self.delay(self.config["search_latency"])
+        if scroll:
+            return 200, self.empty_hits()
+        response = {"took": 1, "hits": {"total": {"value": self.config["total_hits"], "relation": "eq"}, "hits": []}}
+        for position in range(body.get("size", 10)):
+            address = f"10.{position // 65536 % 256}.{position // 256 % 256}.{position % 256}"
+            source = {"ip_address": address, "port": 22, "banner": "SSH-2.0-OpenSSH_8.9p1",
+                      "service_name_inferred": "SSH", "timestamp_last_seen": "2026-01-01T00:00:00.000Z"}
+            response["hits"]["hits"].append({"_id": f"{address}:22", "_source": source,
+                                             "sort": [1767225600000, address, 22]})
+        aggregations = {}
+        for name, aggregation in body.get("aggs", {}).items():
+            if "max" in aggregation:
+                aggregations[name] = {"value": 1767225600000.0}
+            else:
+                size = aggregation.get("terms", {}).get("size", 10)
+                aggregations[name] = {"doc_count_error_upper_bound": 0, "sum_other_doc_count": 0,
+                                      "buckets": [{"key": f"{name}-{rank}", "doc_count": 1000 - rank} for rank in range(size)]}
+        if aggregations:
+            response["aggregations"] = aggregations
+        return 200, response
+
+async def serve_fake_es(config, ready, stop):
+    fake = FakeElasticsearch(config)
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    ready.put({"kind": "es", "url": f"http://127.0.0.1:{port}"})
+    await asyncio.to_thread(stop.wait)
+    server.close()
+
+def service_process_main(kind, config, ready, stop):
+    """Точка входу процесу ферми або заміни ES."""
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        asyncio.run(serve_farm(config, ready, stop) if kind == "farm" else serve_fake_es(config, ready, stop))
+
+# ---- Сценарії ----
+def quantiles_ms(histogram):
+    """p50/p99 (мс) з гістограми src/metrics.py."""
+    from src.metrics import histogram_quantile
+    counts = histogram.snapshot().get((), ([0], 0, 0))[0]
+    return tuple(None if value is None else round(value * 1000, 3)
+                 for value in (histogram_quantile(q, histogram.buckets, counts) for q in (0.5, 0.99)))
+
+def exact_quantiles_ms(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return None, None
+    return tuple(round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3) for q in (0.5, 0.99))
+
+def synthetic_results(count, seed):
+    """Детерміновані результати сканера для сценарію ingest."""
+    from src.async_scanner import ScanResult
+
+    rng = random.Random(seed)
+    for number in range(count):
+        port = rng.choice(list(BANNERS))
+        banner = (rng.choice(BANNERS[port]) % rng.randrange(1, 30)).decode("ascii").strip()
+        address = f"10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}"
+        yield ScanResult(address, port, banner, "generic", None)
+
+async def scenario_scan(config, services):
+    from src.async_scanner import BANNER_SECONDS, CONNECT_SECONDS, PROBE_OUTCOMES, main_async_scanner
+
+    farm = services["farm"]
+    results = asyncio.Queue()
+    started = time.perf_counter()
+    await main_async_scanner([farm["network"]], farm["ports"], config["workers"], results,
+                             max_banner_workers=config["banner_workers"], banner_timeout=config["banner_timeout"])
+    elapsed = time.perf_counter() - started
+    probes = sum(PROBE_OUTCOMES.snapshot().values())
+    connect_p50, connect_p99 = quantiles_ms(CONNECT_SECONDS)
+    _, banner_p99 = quantiles_ms(BANNER_SECONDS)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "probes_per_second": round(probes / elapsed, 1),
+        "connect_p50_ms": connect_p50,
+        "connect_p99_ms": connect_p99,
+        "banner_p99_ms": banner_p99,
+        "results": results.qsize(),
+        "expected_results": sum(count for behaviour, count in farm["counts"].items() if behaviour != "refused"),
+    }
+
+async def scenario_ingest(config, services, results=None, producer=None):
+    from elasticsearch import AsyncElasticsearch
+    from src.change_tracker import ChangeTracker
+    from src.data_ingester import BULK_SECONDS, DOCUMENTS_INDEXED, create_index_if_not_exists, ingest_scan_results
+
+    es_client = AsyncElasticsearch(services["es"])
+    try:
+        await create_index_if_not_exists(es_client)
+        if results is None:
+            results = asyncio.Queue(maxsize=10000)
+        tracker = ChangeTracker() if config["change_aware"] else None
+        started = time.perf_counter()
+        ingester = asyncio.create_task(ingest_scan_results(es_client, results, change_tracker=tracker, dead_letter_path=None))
+        if producer is None:
+            for result in synthetic_results(config["documents"], config["seed"]):
+                await results.put(result)
+        else:
+            await producer
+        await results.put(None)
+        await ingester
+        elapsed = time.perf_counter() - started
+    finally:
+        await es_client.close()
+    bulk_p50, bulk_p99 = quantiles_ms(BULK_SECONDS)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "docs_per_second": round(DOCUMENTS_INDEXED.value / elapsed, 1),
+        "bulk_p50_ms": bulk_p50,
+        "bulk_p99_ms": bulk_p99,
+        "indexed": DOCUMENTS_INDEXED.value,
+    }
+
+async def scenario_pipeline(config, services):
+    """Сканер і ingester разом, як у main.py: ферма -> обмежена черга -> заміна ES."""
+    from src.async_scanner import PROBE_OUTCOMES, main_async_scanner
+
+    farm = services["farm"]
+    results = asyncio.Queue(maxsize=10000)
+    started = time.perf_counter()
+    scanner = asyncio.ensure_future(main_async_scanner(
+        [farm["network"]], farm["ports"], config["workers"], results,
+        max_banner_workers=config["banner_workers"], banner_timeout=config["banner_timeout"]))
+    report = await scenario_ingest(config, services, results, scanner)
+    elapsed = time.perf_counter() - started
+    report.update(elapsed_s=round(elapsed, 3), probes_per_second=round(sum(PROBE_OUTCOMES.snapshot().values()) / elapsed, 1))
+    return report
+
+def scenario_api(config, services):
+    """Потоки з test_client Flask над src/api.py (пул ES, кеш відповідей) з детермінованим набором запитів."""
+    os.environ["SCANENGINE_ES_HOSTS"] = services["es"]
+    from src import api
+    api.es_pool.start() # Заздалегідь, щоб запуск пулу не потрапив у затримку першого запиту
+
+    rng = random.Random(config["seed"])
+    ports = ["22", "80", "443", "8080", "22,80"]
+    distinct = []
+    for number in range(config["distinct_queries"]):
+        if number % 4 == 3:
+            distinct.append(f"/facets?port={rng.choice(ports)}")
+        else:
+            distinct.append(f"/search?port={rng.choice(ports)}&size={rng.choice([10, 50, 100])}&q=ssh{number}")
+    per_thread = config["requests"] // config["threads"]
+    latencies = []
+    failures = []
+
+    def run(seed):
+        client = api.app.test_client()
+        thread_rng = random.Random(seed)
+        for _ in range(per_thread):
+            path = distinct[int(thread_rng.paretovariate(1.2)) % len(distinct)] # Популярні запити повторюються
+            started = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    threads = [threading.Thread(target=run, args=(config["seed"] + number,)) for number in range(config["threads"])]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    p50, p99 = exact_quantiles_ms(latencies)
+    cache = api.response_cache.stats() if api.response_cache is not None else {}
+    api.es_pool.close()
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "request_p50_ms": p50,
+        "request_p99_ms": p99,
+        "failed_requests": len(failures),
+        "cache_hit_rate": cache.get("hit_rate"),
+    }
+
+SCENARIO_FUNCTIONS = {"scan": scenario_scan, "ingest": scenario_ingest, "pipeline": scenario_pipeline, "api": scenario_api}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1048576 if sys.platform == "darwin" else 1024), 1) # macOS - байти, Linux - КБ
+
+def scenario_process_main(name, config, services, results):
+    """Точка входу процесу сценарію: вивід модулів приглушено, результат - до черги results."""
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            function = SCENARIO_FUNCTIONS[name]
+            report = asyncio.run(function(config, services)) if asyncio.iscoroutinefunction(function) else function(config, services)
+        report["peak_rss_mb"] = peak_rss_mb()
+        results.put(report)
+    except BaseException as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+        raise
+
+# ---- Запуск, порівняння, базова лінія ----
+def scenario_config(name, quick):
+    config = dict(SCENARIOS[name])
+    if quick:
+        config.update(QUICK_OVERRIDES.get(name, {}))
+    return config
+
+def run_benchmarks(names, repeat=1, quick=False):
+    """Запускає сценарії (кожен repeat разів, у власному процесі); повертає {сценарій: медіани метрик}."""
+    mp_context = multiprocessing.get_context("spawn")
+    ready = mp_context.Queue()
+    stop = mp_context.Event()
+    services = {}
+    processes = []
+    if any(name in FARM_SCENARIOS for name in names):
+        processes.append(mp_context.Process(target=service_process_main, args=("farm", QUICK_FARM if quick else FARM, ready, stop), daemon=True))
+    if any(name in ES_SCENARIOS for name in names):
+        processes.append(mp_context.Process(target=service_process_main, args=("es", FAKE_ES, ready, stop), daemon=True))
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            info = ready.get(timeout=120)
+            services[info["kind"]] = info if info["kind"] == "farm" else info["url"]
+        if "farm" in services:
+            print(f"Ферма: {services['farm']['listeners']} слухачів у {services['farm']['network']}, "
+                  f"порти {services['farm']['ports']}, поведінка {services['farm']['counts']}.")
+
+        report = {}
+        for name in names:
+            runs = []
+            for attempt in range(repeat):
+                results = mp_context.Queue()
+                process = mp_context.Process(target=scenario_process_main,
+                                             args=(name, scenario_config(name, quick), services, results))
+                process.start()
+                try:
+                    run = results.get(timeout=SCENARIO_TIMEOUT)
+                except queue.Empty:
+                    run = {"error": "перевищено час сценарію"}
+                    process.terminate()
+                process.join()
+                if "error" in run:
+                    print(f"Сценарій '{name}' (запуск {attempt + 1}) завершився помилкою: {run['error']}")
+                    break
+                runs.append(run)
+            if runs:
+                report[name] = {key: (statistics.median(values) if all(isinstance(value, (int, float)) for value in values) else values[0])
+                                for key in runs[0] for values in [[run[key] for run in runs]]}
+        return report
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=10)
+
+def metric_direction(metric):
+    if metric in HIGHER_IS_BETTER:
+        return 1
+    if metric.endswith(LOWER_IS_BETTER_SUFFIXES):
+        return -1
+    return 0 # Інформаційна метрика, не порівнюється
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Рядки (сценарій, метрика, базова, поточна, зміна, статус) та кількість регресій."""
+    rows = []
+    regressions = 0
+    for name, metrics in report.items():
+        for metric, current in metrics.items():
+            expected = baseline.get(name, {}).get(metric)
+            direction = metric_direction(metric)
+            if not direction or not isinstance(current, (int, float)) or not expected:
+                rows.append((name, metric, expected, current, None, ""))
+                continue
+            change = (current - expected) / expected
+            if change * direction < -tolerance:
+                status = "РЕГРЕСІЯ"
+                regressions += 1
+            elif change * direction > tolerance:
+                status = "краще"
+            else:
+                status = "ok"
+            rows.append((name, metric, expected, current, change, status))
+    return rows, regressions
+
+def print_report(rows):
+    print(f"{'сценарій':<10} {'метрика':<22} {'базова':>12} {'поточна':>12} {'зміна':>8}  статус")
+    for name, metric, expected, current, change, status in rows:
+        expected = "-" if expected is None else f"{expected:g}" if isinstance(expected, (int, float)) else str(expected)
+        current = "-" if current is None else f"{current:g}" if isinstance(current, (int, float)) else str(current)
+        change = "" if change is None else f"{change * 100:+.1f}%"
+        print(f"{name:<10} {metric:<22} {expected:>12} {current:>12} {change:>8}  {status}")
+
+def load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+def save_baseline(path, profile, report):
+    """Оновлює профіль ("full" / "quick") базової лінії, зберігаючи інші профілі та сценарії."""
+    baseline = load_baseline(path)
+    section = baseline.setdefault(profile, {})
+    section.update(report)
+    baseline.setdefault("_meta", {})[profile] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(path + ".tmp", "w", encoding="utf-8") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.benchmark", description="Відтворюваний бенчмарк ScanEngine")
+    parser.add_argument("scenarios", nargs="*",
+                        help="Сценарії (за замовчуванням - усі): " + ", ".join(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=1, help="Запусків кожного сценарію (звітується медіана)")
+    parser.add_argument("--quick", action="store_true", help="Зменшене навантаження (окремий профіль базової лінії)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Файл базової лінії")
+    parser.add_argument("--save-baseline", action="store_true", help="Записати результати як нову базову лінію")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Допустиме погіршення (частка)")
+    parser.add_argument("--json", help="Записати звіт у JSON-файл")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"невідомі сценарії: {', '.join(unknown)}")
+
+    names = args.scenarios or list(SCENARIOS)
+    profile = "quick" if args.quick else "full"
+    report = run_benchmarks(names, args.repeat, args.quick)
+    rows, regressions = compare(report, load_baseline(args.baseline).get(profile, {}), args.tolerance)
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump({"profile": profile, "report": report}, report_file, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        save_baseline(args.baseline, profile, report)
+        print(f"Базову лінію '{profile}' збережено до '{args.baseline}'.")
+        return 0
+    if regressions:
+        print(f"Регресій: {regressions} (допуск {args.tolerance * 100:.0f}%).")
+        return 1
+    return 0 if len(report) == len(names) else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
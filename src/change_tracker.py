@@ -0,0 +1,152 @@
+import hashlib
+import ipaddress
+import json
+
+from elasticsearch import ApiError, ConnectionError, NotFoundError
+
+from src.resolver import Resolver
+
+SEED_PAGE_SIZE = 5000 # Документів на сторінку під час початкового читання індексу
+SEED_SCROLL_KEEPALIVE = "2m"
+
+# Нормалізовані поля, що описують сервіс. Сирий банер до відбитка не входить: HTTP-заголовки (Date, Expires,
+# Set-Cookie, Last-Modified) та привітання SMTP/FTP містять час, і такий сервіс був би "зміненим" на кожному
+# скануванні. Зміна лише тексту банера (без зміни сервісу, продукту, версії чи TLS) не переписує документ -
+# збережений банер оновиться з наступною змістовною зміною.
+HASHED_FIELDS = ("port", "service_name_inferred", "product_inferred", "version_inferred", "probe", "geolocation")
+
+def content_hash(document):
+    """Відбиток нормалізованого змісту документа (HASHED_FIELDS та TLS: версія, шифр, відбиток сертифіката)."""
+    content = {field: document.get(field) for field in HASHED_FIELDS}
+    tls = document.get("tls")
+    if tls:
+        content["tls"] = [tls.get("version"), tls.get("cipher"), tls.get("certificate", {}).get("sha256")]
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+async def target_networks(ip_ranges_cidr, resolver=None):
+    """CIDR-діапазони цілей та адреси розпізнаних імен хостів - рядки для запиту terms по ip_address."""
+    networks = []
+    hostnames = []
+    for entry in ip_ranges_cidr:
+        try:
+            networks.append(str(ipaddress.ip_network(entry, strict=False)))
+        except ValueError:
+            hostnames.append(entry)
+    if hostnames:
+        resolution = await (resolver or Resolver()).resolve_many(hostnames)
+        networks.extend(address for addresses in resolution.values() for address in addresses)
+    return networks
+
+def document_id(document):
+    return f"{document['ip_address']}-{document['port']}"
+
+def upsert_pair(index, doc_id, document):
+    """
+    Рядки bulk для повного документа, що не затирає timestamp_first_seen наявного: новий документ створюється
+    цілком (upsert), в наявному оновлюються всі поля, крім first_seen.
+    """
+    partial = {key: value for key, value in document.items() if key != "timestamp_first_seen"}
+    return {"update": {"_index": index, "_id": doc_id}}, {"doc": partial, "upsert": document}
+
+def archive_operations(index, documents):
+    """Повні документи пачки (upsert_pair) - для спулу-архіву замість часткових оновлень ChangeTracker."""
+    operations = []
+    for document in documents:
+        operations.extend(upsert_pair(index, document_id(document), document))
+    return operations
+
+class ChangeTracker:
+    """
+    Локальний кеш _id -> (відбиток змісту, timestamp_first_seen) для індексації з урахуванням змін.
+    Для кожного документа пачки вибирає найдешевшу дію bulk:
+    - зміст не змінився - часткове оновлення лише timestamp_last_seen (write avoided);
+    - зміст змінився - повний документ (index) зі збереженим timestamp_first_seen;
+    - _id невідомий кешу - update з doc + upsert: новий документ створюється повністю,
+      а в наявному (якщо кеш не знав про нього) timestamp_first_seen не перезаписується.
+    Кеш заповнюється з індексу (seed) та оновлюється з кожною відправленою пачкою; невдалі елементи
+    забуваються (forget), щоб наступного разу документ було записано повністю.
+    """
+
+    def __init__(self):
+        self.known = {} # _id -> (content_hash або None, timestamp_first_seen або None)
+        self.seeded = 0
+        self.unchanged = 0
+        self.changed = 0
+        self.upserted = 0
+
+    async def seed(self, es_client, index, ip_ranges_cidr=None, resolver=None, page_size=SEED_PAGE_SIZE):
+        """
+        Читає відбитки та timestamp_first_seen документів індексу (scroll). Повертає кількість.
+        Кеш тримається в пам'яті (~250 байт на документ, 10 млн документів - ~2.5 ГБ), тому ip_ranges_cidr
+        обмежує читання цілями запуску: CIDR-діапазонами та адресами імен хостів. Документи поза ними кешу
+        не потрібні - невідомий _id однаково записується через upsert без втрати first_seen. None - увесь індекс.
+        """
+        query = None
+        if ip_ranges_cidr is not None:
+            networks = await target_networks(ip_ranges_cidr, resolver)
+            if not networks:
+                print("Кеш змін: цілі не містять жодної адреси - відбитки не завантажуються.")
+                return 0
+            query = {"bool": {"filter": [{"terms": {"ip_address": networks}}]}}
+        scroll_id = None
+        try:
+            response = await es_client.search(index=index, scroll=SEED_SCROLL_KEEPALIVE, size=page_size, sort=["_doc"],
+                                               query=query, source=["content_hash", "timestamp_first_seen"])
+            while True:
+                scroll_id = response.get("_scroll_id")
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                for hit in hits:
+                    source = hit.get("_source", {})
+                    self.known[hit["_id"]] = (source.get("content_hash"), source.get("timestamp_first_seen"))
+                self.seeded += len(hits)
+                response = await es_client.scroll(scroll_id=scroll_id, scroll=SEED_SCROLL_KEEPALIVE)
+        except NotFoundError:
+            pass # Індексу ще немає - усі документи нові
+        except (ApiError, ConnectionError) as e:
+            print(f"Попередження: не вдалося прочитати відбитки документів з індексу '{index}': {e}. "
+                  "Невідомі документи будуть записані через upsert.")
+        finally:
+            if scroll_id:
+                try:
+                    await es_client.clear_scroll(scroll_id=scroll_id)
+                except (ApiError, ConnectionError):
+                    pass
+        print(f"Кеш змін: завантажено відбитки {self.seeded} документів з індексу '{index}'.")
+        return self.seeded
+
+    def operations(self, index, documents):
+        """Повертає тіло bulk-запиту (рядки дій і документів) для пачки документів."""
+        operations = []
+        for document in documents:
+            doc_id = document_id(document)
+            digest = document["content_hash"] = content_hash(document)
+            known_hash, first_seen = self.known.get(doc_id, (None, None))
+            if known_hash == digest:
+                self.unchanged += 1
+                operations.append({"update": {"_index": index, "_id": doc_id}})
+                operations.append({"doc": {"timestamp_last_seen": document["timestamp_last_seen"]}})
+            elif first_seen is not None:
+                self.changed += 1
+                document["timestamp_first_seen"] = first_seen
+                operations.append({"index": {"_index": index, "_id": doc_id}})
+                operations.append(document)
+            else:
+                self.upserted += 1
+                operations.extend(upsert_pair(index, doc_id, document))
+            # Після upsert справжній first_seen може бути старішим (якщо документ уже існував) - лишаємо його невідомим
+            self.known[doc_id] = (digest, first_seen)
+        return operations
+
+    def forget(self, doc_ids):
+        """Прибирає з кешу документи, запис яких не вдався."""
+        for doc_id in doc_ids:
+            self.known.pop(doc_id, None)
+
+    def summary_line(self):
+        total = self.unchanged + self.changed + self.upserted
+        share = f" ({self.unchanged / total:.0%})" if total else ""
+        return (f"Кеш змін: без змін {self.unchanged}{share} - повних записів уникнуто; "
+                f"змінено {self.changed}; нових/невідомих {self.upserted}.")
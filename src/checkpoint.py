@@ -0,0 +1,225 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+
+DEFAULT_CHECKPOINT_DIR = "checkpoints"
+DEFAULT_CHECKPOINT_INTERVAL = 10.0 # Секунд між записами контрольної точки
+
+# Контрольна точка - завершені цілі шарду як інтервали порядкових номерів [first, last] у послідовності,
+# яку генерує produce_targets / produce_planned_targets. Робітники завершують хости майже по порядку, тож
+# навіть для /8 стан - це суцільний префікс і кілька "відсталих" інтервалів біля фронту сканування.
+
+def scan_fingerprint(ip_ranges_cidr, ports, shards, plan=None):
+    """
+    Відбиток запуску: цілі, порти, кількість шардів та план пересканування - все, від чого залежить, яка ціль
+    отримує який порядковий номер. Інший відбиток - інша контрольна точка (стара не застосовується).
+    Незавершений план RescanScheduler повторно використовує, тож відбиток перерваного інкрементального запуску
+    при повторі не змінюється.
+    """
+    source = {
+        "targets": list(ip_ranges_cidr),
+        "ports": list(ports),
+        "shards": shards,
+        "plan": plan.entries if plan is not None else None,
+    }
+    return hashlib.sha256(json.dumps(source, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def merge_sequences(done, sequences):
+    """Додає відсортовані порядкові номери до відсортованого списку інтервалів [first, last], зливаючи суміжні."""
+    for sequence in sequences:
+        index = bisect.bisect_right(done, [sequence, float('inf')]) - 1
+        if index >= 0 and done[index][0] <= sequence <= done[index][1] + 1:
+            done[index][1] = max(done[index][1], sequence)
+        else:
+            index += 1
+            done.insert(index, [sequence, sequence])
+        # Інтервал міг дорости до наступного
+        if index + 1 < len(done) and done[index][1] + 1 >= done[index + 1][0]:
+            done[index][1] = max(done[index][1], done[index + 1][1])
+            del done[index + 1]
+    return done
+
+class ScanCheckpoint:
+    """
+    Прогрес сканування одного шарду на диску: перерваний запуск (збій, Ctrl-C, недоступний кластер)
+    з тим самим відбитком продовжується з місця зупинки, пропускаючи завершені діапазони без їх генерації.
+    Одиниця прогресу - хост з усіма своїми портами. Хост фіксується, лише коли завершено всі його проби
+    і кожен його результат підтверджено: проіндексовано або записано до спулу (release з persisted=True).
+    Відкрите з'єднання тримає хост (hold) від стадії виявлення до підтвердження результату або до кінця
+    стадії банерів без результату. Результати, які не вдалося зберегти, лишають хост незавершеним -
+    повторний запуск проскансує його знову.
+    У каталозі - одна контрольна точка на схему шардів: файли того ж шарду з іншим відбитком видаляються.
+    Паралельні запуски з різними цілями мають використовувати різні каталоги.
+    """
+
+    def __init__(self, directory, fingerprint, shard=None, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        shard_index, shards = shard or (0, 1)
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.path = os.path.join(directory, f"scan-{fingerprint[:16]}-shard-{shard_index}-of-{shards}.json")
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale(directory, f"-shard-{shard_index}-of-{shards}.json")
+        self.done = self._load() # Зафіксовані інтервали [first, last]
+        self.resumed = sum(last - first + 1 for first, last in self.done)
+        self._holds = {} # Порядковий номер -> відкритих з'єднань і непідтверджених результатів
+        self._probed = set() # Проби завершено, але результати ще не підтверджено
+        self._failed = set() # Результат не збережено - хост не фіксується в цьому запуску
+        self.lost = 0 # Хостів, чиї результати не збережено (проскануються наступним запуском)
+        self._recent = [] # Готові до фіксації з останнього запису
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._task = None
+
+    def _remove_stale(self, directory, suffix):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.startswith("scan-") and name.endswith(suffix) and path != self.path:
+                print(f"Видалено застарілу контрольну точку '{path}' (інші цілі, порти або план).")
+                os.remove(path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return []
+        except ValueError as e:
+            print(f"Попередження: контрольну точку '{self.path}' пошкоджено ({e}), сканування почнеться спочатку.")
+            return []
+        if state.get("fingerprint") != self.fingerprint:
+            return []
+        return [list(interval) for interval in state["done"]]
+
+    def is_done(self, sequence):
+        index = bisect.bisect_right(self.done, [sequence, float('inf')]) - 1
+        return index >= 0 and self.done[index][0] <= sequence <= self.done[index][1]
+
+    def pending_ranges(self, start, stop):
+        """Незавершені діапазони [start, stop) у межах [start, stop)."""
+        position = start
+        for first, last in self.done:
+            if last < position:
+                continue
+            if first >= stop:
+                break
+            if first > position:
+                yield position, first
+            position = last + 1
+        if position < stop:
+            yield position, stop
+
+    def hold(self, sequence):
+        """Відкрите з'єднання хоста: хост не фіксується до відповідного release."""
+        self._holds[sequence] = self._holds.get(sequence, 0) + 1
+        self._drained.clear()
+
+    def release(self, sequence, persisted=True):
+        """З'єднання без результату або результат, підтверджений ingester'ом (persisted=False - не збережено)."""
+        if not persisted:
+            self._failed.add(sequence)
+        count = self._holds.get(sequence, 0) - 1
+        if count > 0:
+            self._holds[sequence] = count
+            return
+        self._holds.pop(sequence, None)
+        if sequence in self._probed:
+            self._probed.discard(sequence)
+            self._settle(sequence)
+        if not self._holds:
+            self._drained.set()
+
+    def complete(self, sequence):
+        """Усі проби хоста з цим порядковим номером завершено."""
+        if self._holds.get(sequence):
+            self._probed.add(sequence)
+        else:
+            self._settle(sequence)
+
+    def _settle(self, sequence):
+        if sequence in self._failed:
+            self._failed.discard(sequence)
+            self.lost += 1
+        else:
+            self._recent.append(sequence)
+
+    def acknowledge(self, sequences, persisted=True):
+        """Обробник ResultAcknowledgements: release для кожного підтвердженого результату."""
+        for sequence in sequences:
+            self.release(sequence, persisted)
+
+    def _write(self, done):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as checkpoint_file:
+            json.dump({"fingerprint": self.fingerprint, "done": done}, checkpoint_file, separators=(",", ":"))
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    async def save(self):
+        """Фіксує підтверджені хости і атомарно записує файл."""
+        merge_sequences(self.done, sorted(self._recent))
+        self._recent = []
+        await asyncio.to_thread(self._write, [interval[:] for interval in self.done])
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    def start(self):
+        if self.resumed:
+            print(f"Відновлення з контрольної точки '{self.path}': пропускаємо {self.resumed} завершених цілей.")
+        self._task = asyncio.create_task(self._run())
+
+    async def finish(self, completed):
+        """
+        completed=True - сканування шарду завершено: чекає на підтвердження останніх результатів і видаляє файл,
+        якщо всі хости зафіксовано; інакше (або при перериванні) лишає файл з останніми підтвердженими хостами.
+        """
+        if completed:
+            await self._drained.wait()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if completed and not self.lost:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            return
+        await self.save()
+        if self.lost:
+            print(f"Контрольна точка '{self.path}': результати {self.lost} хостів не збережено - "
+                  "повторний запуск з тими ж параметрами проскансує лише їх та незавершені цілі.")
+
+class ResultAcknowledgements:
+    """
+    Підтвердження результатів від ingester'а до контрольних точок сканера (BulkBatcher on_persisted).
+    Результат (ScanResult) несе номер шарду та порядковий номер хоста; обробник шарду - ScanCheckpoint.release
+    у тому ж процесі або пересилання до дочірнього процесу шардованого режиму.
+    """
+
+    def __init__(self):
+        self.handlers = {} # Номер шарду -> функція(порядкові номери, persisted)
+
+    def register(self, shard_index, handler):
+        self.handlers[shard_index] = handler
+
+    def unregister(self, shard_index):
+        self.handlers.pop(shard_index, None)
+
+    def dispatch(self, shard_index, sequences, persisted):
+        handler = self.handlers.get(shard_index)
+        if handler is not None:
+            handler(sequences, persisted)
+
+    def __call__(self, persisted, failed=()):
+        """persisted - збережені результати (ScanResult), failed - не збережені."""
+        for results, outcome in ((persisted, True), (failed, False)):
+            sequences = {}
+            for result in results:
+                if result.sequence is not None:
+                    sequences.setdefault(result.shard, []).append(result.sequence)
+            for shard_index, shard_sequences in sequences.items():
+                self.dispatch(shard_index, shard_sequences, outcome)
@@ -1,79 +1,98 @@
 import asyncio
+import functools
 import json
+import random
+import re
+import time
 from datetime import datetime
-from elasticsearch import AsyncElasticsearch, ConnectionError, NotFoundError, ApiError
+from elasticsearch import AsyncElasticsearch, ConnectionError, ConnectionTimeout, NotFoundError, ApiError
+
+from src.change_tracker import ChangeTracker, archive_operations, document_id
+from src.geoip import UNKNOWN_LOCATION, get_database
+from src.metrics import PROGRESS_INTERVAL, SIZE_BUCKETS, Counter, Gauge, Histogram, report_progress
+from src.serialization import encode_pairs
+from src.signatures import PORT_SERVICES, get_engine, service_display_name
 
 # Змінено: Змінна es більше не є глобальною і не ініціалізується тут.
 # Вона буде передаватися як аргумент до функцій.
 INDEX_NAME = "scan_results"
 
-# ---- Заглушки для збагачення даних ----
+# ---- Збагачення даних ----
+LOOPBACK_LOCATION = {
+    "country_code": "LO", # Localhost
+    "country_name": "Localhost",
+    "city": "Loopback",
+    "latitude": 0.0,
+    "longitude": 0.0,
+    "asn": "AS0",
+    "organization": "Loopback Network"
+}
+
 def get_geolocation(ip_address):
     """
-    Заглушка для функції отримання геолокації за IP-адресою.
-    У реальному проекті тут буде інтеграція з GeoLite2 або іншим сервісом.
+    Повертає геолокацію та ASN для IP-адреси з локальної бази діапазонів (src/geoip.py, шлях у SCANENGINE_GEOIP_DB).
+    Без бази або для адрес поза нею - Localhost для 127.0.0.0/8, інакше "Unknown".
+    Повернений dict спільний для багатьох документів - не змінюйте його.
     """
-    # Приклад даних для локальних IP або відомих заглушок
+    database = get_database()
+    if database is not None:
+        location = database.lookup(ip_address)
+        if location is not UNKNOWN_LOCATION:
+            return location
     if ip_address.startswith("127."):
-        return {
-            "country_code": "LO", # Localhost
-            "country_name": "Localhost",
-            "city": "Loopback",
-            "latitude": 0.0,
-            "longitude": 0.0,
-            "asn": "AS0",
-            "organization": "Loopback Network"
-        }
-    # Можете додати більше логіки для інших IP-адрес
-    return {
-        "country_code": "XX",
-        "country_name": "Unknown",
-        "city": "Unknown",
-        "latitude": None,
-        "longitude": None,
-        "asn": None,
-        "organization": None
-    }
+        return LOOPBACK_LOCATION
+    return UNKNOWN_LOCATION
+
+SERVICE_INFO_CACHE_SIZE = 4096 # Нормалізованих банерів (до 4 КБ кожен): кеш тримає не більше ~16 МБ
+# Заголовки HTTP, що містять лише час відповіді: без них однакове ПЗ дає однаковий вхід сигнатур і кешу
+VOLATILE_HEADER_LINES = re.compile(r"\n(?:date|expires|last-modified|age):[^\n]*", re.IGNORECASE)
 
 def infer_service_info(banner, port):
     """
-    Заглушка для функції визначення назви та версії сервісу з банера та порту.
-    У реальному проекті тут будуть регулярні вирази та/або бази даних сигнатур.
+    Визначає назву сервісу, продукт та версію за банером (скомпільована база сигнатур, src/signatures.py),
+    з резервним визначенням сервісу за портом. Повертає (service_name, product, version).
+    Кешується нормалізований вхід сигнатур (без рядків Date/Expires/Last-Modified/Age), а не сирий банер:
+    інакше кожна HTTP-відповідь з новим Date займала б окремий запис кешу.
     """
-    banner_lower = banner.lower()
-    if "ssh" in banner_lower:
-        return "SSH", "OpenSSH"
-    elif "http" in banner_lower or port == 80 or port == 443:
-        if "nginx" in banner_lower:
-            return "HTTP", "Nginx"
-        elif "apache" in banner_lower:
-            return "HTTP", "Apache HTTPD"
-        return "HTTP", "Unknown HTTP"
-    elif "ftp" in banner_lower or port == 21:
-        return "FTP", "Unknown FTP"
-    elif "microsoft" in banner_lower and port == 445:
-        return "SMB", "Microsoft SMB"
-    elif port == 3389:
-        return "RDP", "Microsoft RDP"
-    elif port == 23:
-        return "Telnet", "Telnet Server"
-    
-    return "Unknown", None
+    # Банер TLS-проби: перший рядок - опис TLS/сертифіката, далі - відповідь сервісу всередині TLS
+    tls = banner.startswith("TLS ")
+    text = banner.split("\n", 1)[1] if tls and "\n" in banner else ("" if tls else banner)
+    return _service_info(VOLATILE_HEADER_LINES.sub("", text), port, tls)
+
+@functools.lru_cache(maxsize=SERVICE_INFO_CACHE_SIZE)
+def _service_info(text, port, tls):
+    match = get_engine().match(text) if text else None
+    if match:
+        service, product, version, _ = match
+        return service_display_name(service, tls), product, version
+
+    service = PORT_SERVICES.get(port)
+    if service is None:
+        return ("SSL" if tls else "Unknown"), None, None
+    return service_display_name(service, tls), None, None
 
 # ---- Основна логіка введення даних ----
-def format_document(scan_result):
+NO_TAGS = () # Спільне порожнє значення tags (у JSON - []), не новий список на кожен документ
+
+def utc_timestamp():
+    """Поточний час UTC у форматі ISO 8601 для Elasticsearch."""
+    return datetime.utcnow().isoformat(timespec='milliseconds') + "Z"
+
+def format_document(scan_result, now=None):
     """
     Форматує один результат сканування у документ Elasticsearch.
-    scan_result: {'ip': '127.0.0.1', 'port': 80, 'banner': 'HTTP/1.1 200 OK'}
+    scan_result: ScanResult (src/async_scanner.py) - ('127.0.0.1', 80, 'HTTP/1.1 200 OK', 'http_head', None)
+    now: часова мітка (utc_timestamp()) - BulkBatcher бере одну на всю пачку; None - поточний час.
+    Тож timestamp_first_seen/timestamp_last_seen - час відправлення пачки до кластера, а не мить зчитування
+    банера: пізніше за неї на час у черзі результатів плюс до max_linger очікування пачки.
+    Геолокація та рядки сервісу спільні для багатьох документів - не змінюйте їх.
     """
-    ip_address = scan_result['ip']
-    port = scan_result['port']
-    banner = scan_result['banner']
-    
-    now = datetime.utcnow().isoformat(timespec='milliseconds') + "Z" # ISO 8601 формат для Elasticsearch
+    ip_address, port, banner, probe, tls = scan_result[:5]
+    if now is None:
+        now = utc_timestamp()
 
     geolocation_data = get_geolocation(ip_address)
-    service_name, service_version = infer_service_info(banner, port)
+    service_name, service_product, service_version = infer_service_info(banner, port)
 
     document = {
         "ip_address": ip_address,
@@ -84,18 +103,236 @@ def format_document(scan_result):
         "timestamp_last_seen": now,
         "geolocation": geolocation_data,
         "service_name_inferred": service_name,
+        "product_inferred": service_product,
         "version_inferred": service_version,
-        "tags": [] # Поки порожньо, можна додати пізніше
+        "probe": probe, # Назва проби банера (src/probes.py)
+        "tls": tls, # Версія TLS, шифр та сертифікат, якщо порт говорить TLS
+        "tags": NO_TAGS # Поки порожньо, можна додати пізніше
     }
     return document
 
-async def ingest_scan_results(es_client: AsyncElasticsearch, results_queue: asyncio.Queue):
+# ---- Повтори bulk-запитів ----
+DEFAULT_BULK_RETRIES = 5 # Повторів після першої спроби
+RETRY_BASE_DELAY = 0.5 # Секунд; затримка спроби n - випадкова в [0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2^n)]
+RETRY_MAX_DELAY = 30.0
+RETRYABLE_STATUSES = frozenset((429, 502, 503, 504)) # Перевантаження кластера - повторюємо; інші помилки остаточні
+DEFAULT_DEAD_LETTER_PATH = "dead_letter.ndjson"
+
+# ---- Метрики (src/metrics.py) ----
+BULK_SECONDS = Histogram("scanengine_bulk_seconds", "Тривалість одного bulk-запиту (кожна спроба окремо)")
+BULK_DOCUMENTS = Histogram("scanengine_bulk_documents", "Документів в одному bulk-запиті", buckets=SIZE_BUCKETS)
+BULK_FAILURES = Counter("scanengine_bulk_failures_total", "Невдалі bulk-запити за причиною", ["reason"])
+DOCUMENT_OUTCOMES = Counter("scanengine_ingested_documents_total", "Документи за результатом індексації", ["outcome"])
+DOCUMENTS_INDEXED = DOCUMENT_OUTCOMES.labels("indexed")
+DOCUMENTS_RETRIED = DOCUMENT_OUTCOMES.labels("retried")
+DOCUMENTS_DEAD = DOCUMENT_OUTCOMES.labels("dead")
+DOCUMENTS_SPOOLED = DOCUMENT_OUTCOMES.labels("spooled")
+DOCUMENTS_EXHAUSTED = DOCUMENT_OUTCOMES.labels("exhausted")
+RESULTS_QUEUE_DEPTH = Gauge("scanengine_results_queue_depth", "Результатів сканування в черзі до ingester'а")
+
+# ---- Спільний адаптивний пакетувальник для bulk-індексації ----
+DEFAULT_MAX_BULK_IN_FLIGHT = 4 # Одночасних bulk-запитів до Elasticsearch
+DEFAULT_MIN_BATCH_SIZE = 50
+DEFAULT_MAX_BATCH_SIZE = 5000
+DEFAULT_MAX_BATCH_BYTES = 5 * 1024 * 1024 # Орієнтовний розмір тіла bulk-запиту
+DEFAULT_MAX_LINGER = 1.0 # Секунд, які документ може чекати в неповній пачці
+DEFAULT_TARGET_BULK_LATENCY = 1.0 # Бажана тривалість одного bulk-запиту, секунд
+DOCUMENT_OVERHEAD_BYTES = 600 # Приблизний розмір JSON документа без банера (дія bulk, поля, геолокація)
+
+class BulkBatcher:
+    """
+    Одна спільна пачка результатів сканера для всіх споживачів черги результатів. Пачка тримає компактні
+    ScanResult, а документи Elasticsearch будуються лише під час відправлення - з однією часовою міткою на пачку
+    (часом відправлення, див. format_document).
+    Пачка відправляється, щойно виконається одна з умов: batch_size документів, max_batch_bytes байтів
+    або max_linger секунд від першого документа в пачці.
+    batch_size підлаштовується під затримку bulk-запитів (AIMD): повна пачка, успішно оброблена швидше за половину
+    target_latency, збільшує його в 1.5 раза; повільніший за target_latency запит, перевантаження (429/502/503/504)
+    чи помилка запиту - зменшує вдвічі.
+    Відправлення не блокує споживання черги: одночасно виконується до max_in_flight bulk-запитів,
+    і лише коли всі слоти зайняті, flush чекає на вільний (зворотний тиск на чергу).
+    spool (src/spool.py): без es_client - усі пачки лише записуються до спулу (офлайн-режим);
+    spool_all=True - кожна пачка спершу пишеться до спулу (локальний архів повних документів, навіть коли до
+    кластера йдуть часткові оновлення ChangeTracker), потім індексується;
+    інакше до спулу потрапляють лише документи, які кластер не прийняв навіть після повторів.
+    on_persisted(persisted, failed) викликається після кожної пачки зі списками ScanResult: збережені (проіндексовані,
+    записані до спулу або відхилені остаточною помилкою) та не збережені (вичерпали повтори без спулу, збій
+    відправлення) - так контрольні точки сканера (src/checkpoint.py) фіксують хост лише після збереження результатів.
+    """
+
+    def __init__(self, es_client, max_in_flight=DEFAULT_MAX_BULK_IN_FLIGHT, min_batch_size=DEFAULT_MIN_BATCH_SIZE,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES,
+                 max_linger=DEFAULT_MAX_LINGER, target_latency=DEFAULT_TARGET_BULK_LATENCY, tracker=None,
+                 dead_letter_path=DEFAULT_DEAD_LETTER_PATH, spool=None, spool_all=False, on_persisted=None):
+        self.es_client = es_client
+        self.on_persisted = on_persisted
+        self.tracker = tracker # ChangeTracker - індексація з урахуванням змін (src/change_tracker.py)
+        self.dead_letter_path = dead_letter_path
+        self.spool = spool
+        self.spool_all = spool_all
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_linger = max_linger
+        self.target_latency = target_latency
+        self.batch_size = min_batch_size
+        self.results = []
+        self.batch_bytes = 0
+        self.oldest = None # time.monotonic() першого документа поточної пачки
+        self.in_flight = set()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.flushes = {"size": 0, "bytes": 0, "linger": 0, "final": 0}
+        self.indexed = 0
+        self.submitted = 0
+        self.errors = [] # Винятки пачок, відправлення яких впало (close() повідомляє про перший)
+        self.lost = 0 # Документів у таких пачках
+        self.latency = None # Експоненційно згладжена затримка bulk-запиту
+
+    def linger_remaining(self):
+        """Секунд до примусового відправлення поточної пачки; None, якщо пачка порожня."""
+        if not self.results:
+            return None
+        return max(0.0, self.oldest + self.max_linger - time.monotonic())
+
+    async def add(self, scan_result):
+        if not self.results:
+            self.oldest = time.monotonic()
+        self.results.append(scan_result)
+        self.batch_bytes += len(scan_result.banner) + DOCUMENT_OVERHEAD_BYTES
+        if len(self.results) >= self.batch_size:
+            await self.flush("size")
+        elif self.batch_bytes >= self.max_batch_bytes:
+            await self.flush("bytes")
+
+    async def flush(self, reason):
+        """Відправляє поточну пачку у фоні; чекає лише на вільний слот bulk-запиту."""
+        if not self.results:
+            return
+        results = self.results
+        self.results = []
+        self.batch_bytes = 0
+        self.oldest = None
+        self.flushes[reason] += 1
+        await self._slots.acquire()
+        task = asyncio.create_task(self._send(results))
+        self.in_flight.add(task)
+        task.add_done_callback(functools.partial(self._finished, len(results)))
+
+    def _finished(self, count, task):
+        """Прибирає завершене відправлення; виняток запам'ятовується, а не губиться разом із задачею."""
+        self.in_flight.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        self.errors.append(task.exception())
+        self.lost += count
+        print(f"Помилка відправлення пачки з {count} документів: {task.exception()!r} - пачку не збережено.")
+
+    async def _send(self, results):
+        started = time.monotonic()
+        indexed = 0
+        persisted, failed = results, []
+        failures = [] # Статуси невдалих спроб bulk-запиту (перевантаження, помилки) - сигнал зменшити пачку
+        try:
+            now = utc_timestamp()
+            documents = [format_document(result, now) for result in results]
+            operations = build_operations(documents, self.tracker)
+            encoded = encode_pairs(operations) # Одне кодування для спулу та всіх спроб bulk-запиту
+            if self.spool is not None and (self.es_client is None or self.spool_all):
+                # Спул - повний архів: замість часткових оновлень ChangeTracker (лише timestamp_last_seen)
+                # до нього пишуться повні документи
+                archived = encoded if self.tracker is None else encode_pairs(archive_operations(INDEX_NAME, documents))
+                await self.spool.append(b"".join(archived))
+            if self.es_client is not None:
+                indexed, exhausted = await send_operations(self.es_client, operations, self.tracker,
+                                                           dead_letter_path=self.dead_letter_path,
+                                                           spool=None if self.spool_all else self.spool,
+                                                           encoded=encoded, on_failed_attempt=failures.append)
+                if exhausted:
+                    # spool_all: документи вже в спулі, їх допише `python -m src.spool replay`
+                    if self.spool_all:
+                        print(f"{len(exhausted)} документів не проіндексовано - залишились у спулі для відтворення.")
+                    else:
+                        if self.dead_letter_path:
+                            write_dead_letters(self.dead_letter_path, exhausted)
+                        lost = {next(iter(action.values()))["_id"] for action, _, _, _ in exhausted}
+                        # f"{ip}-{port}" - той самий _id, що й document_id
+                        persisted = [result for result in results if f"{result.ip}-{result.port}" not in lost]
+                        failed = [result for result in results if f"{result.ip}-{result.port}" in lost]
+        except BaseException:
+            persisted, failed = [], results
+            failures.append(None)
+            raise
+        finally:
+            self._slots.release()
+            if self.on_persisted is not None:
+                self.on_persisted(persisted, failed)
+            self._adapt(time.monotonic() - started, len(results), not failures)
+        self.indexed += indexed
+        self.submitted += len(results)
+
+    def _adapt(self, latency, count, succeeded=True):
+        """
+        AIMD за результатом пачки: лише успішна відповідь (без перевантаження та помилок запиту) може збільшити
+        batch_size - запит, що швидко впав, нічого не каже про спроможність кластера. 429/502/503/504 та помилки
+        зменшують batch_size вдвічі, так само як повільна відповідь.
+        """
+        if not succeeded:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            return
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        elif count >= self.batch_size and latency < self.target_latency / 2:
+            # Лише повна пачка щось каже про більший розмір - пачки за max_linger не збільшують batch_size
+            self.batch_size = min(self.max_batch_size, int(self.batch_size * 1.5))
+
+    async def close(self):
+        """
+        Відправляє залишок і чекає на завершення всіх bulk-запитів. Якщо відправлення хоча б однієї пачки
+        впало, після завершення решти піднімає перший такий виняток.
+        """
+        await self.flush("final")
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+        if self.errors:
+            raise self.errors[0]
+
+    def progress_summary(self, results_queue):
+        """Функція для report_progress: темп індексації за останній проміжок, розмір пачки та черги."""
+        previous = [self.indexed]
+
+        def summary(elapsed):
+            rate = (self.indexed - previous[0]) / elapsed if elapsed > 0 else 0.0
+            previous[0] = self.indexed
+            latency = f"{self.latency * 1000:.0f} мс" if self.latency is not None else "-"
+            return (f"Введення даних: проіндексовано {self.indexed} ({rate:.0f}/с), пачка {self.batch_size}, "
+                    f"bulk у роботі {len(self.in_flight)}, затримка {latency}; черга результатів {results_queue.qsize()}.")
+        return summary
+
+    def summary_line(self):
+        latency = f"{self.latency * 1000:.0f} мс" if self.latency is not None else "-"
+        flushes = ", ".join(f"{reason}: {count}" for reason, count in self.flushes.items())
+        spooled = f", до спулу {self.spool.operations}" if self.spool is not None else ""
+        lost = f", втрачено через збій відправлення {self.lost}" if self.lost else ""
+        return (f"Введення даних: проіндексовано {self.indexed} з {self.submitted} документів{spooled}{lost}; "
+                f"розмір пачки {self.batch_size}; затримка bulk {latency}; відправлення ({flushes})")
+
+async def ingest_scan_results(es_client: AsyncElasticsearch, results_queue: asyncio.Queue, batcher: BulkBatcher = None,
+                              max_bulk_in_flight=DEFAULT_MAX_BULK_IN_FLIGHT, max_linger=DEFAULT_MAX_LINGER,
+                              change_tracker: ChangeTracker = None, dead_letter_path=DEFAULT_DEAD_LETTER_PATH,
+                              spool=None, spool_all=False, on_persisted=None):
     """
     Асинхронно отримує результати сканування з черги, збагачує їх та індексує в Elasticsearch.
-    es_client: екземпляр AsyncElasticsearch
-    results_queue: асинхронна черга для результатів сканування
+    Достатньо одного споживача на чергу: паралельність індексації забезпечують одночасні bulk-запити батчера.
+    es_client: екземпляр AsyncElasticsearch (None разом зі spool - офлайн-режим, результати лише до спулу)
+    results_queue: асинхронна черга для результатів сканування (None - сигнал завершення)
+    batcher: спільний BulkBatcher (якщо кілька споживачів мають писати в одну пачку); інакше створюється власний
+    change_tracker: ChangeTracker для режиму з урахуванням змін (незмінені сервіси - лише оновлення timestamp_last_seen)
+    dead_letter_path: файл NDJSON для документів, які не вдалося записати після всіх повторів
+    spool, spool_all, on_persisted: локальний спул результатів (src/spool.py) та підтвердження збережених
+    результатів (ResultAcknowledgements, src/checkpoint.py), див. BulkBatcher
     """
-    if es_client is None:
+    if es_client is None and spool is None and batcher is None:
         print("Модуль введення даних не може працювати: Elasticsearch клієнт не надано.")
         # Чекати на сигнал завершення, щоб коректно завершити чергу
         while True:
@@ -104,66 +341,218 @@ async def ingest_scan_results(es_client: AsyncElasticsearch, results_queue: asyn
                 results_queue.task_done()
                 break
             results_queue.task_done() # Позначаємо завдання виконаним навіть без індексації
+            if on_persisted is not None:
+                on_persisted((), [item]) # Не збережено - контрольна точка не фіксує хост
         return
 
-    batch = []
-    batch_size = 50 # Розмір пачки для індексації (можна налаштувати)
+    own_batcher = batcher is None
+    if own_batcher:
+        batcher = BulkBatcher(es_client, max_in_flight=max_bulk_in_flight, max_linger=max_linger, tracker=change_tracker,
+                              dead_letter_path=dead_letter_path, spool=spool, spool_all=spool_all,
+                              on_persisted=on_persisted)
 
     print("Модуль введення даних запущено і очікує результатів...")
+    RESULTS_QUEUE_DEPTH.set_function(results_queue.qsize)
+    progress = asyncio.create_task(report_progress(batcher.progress_summary(results_queue), PROGRESS_INTERVAL))
 
     while True:
-        scan_result = await results_queue.get()
+        timeout = batcher.linger_remaining()
+        if timeout is not None and timeout <= 0:
+            await batcher.flush("linger")
+            continue
+        try:
+            scan_result = results_queue.get_nowait() # Черга не порожня - без wait_for (задача й таймер на кожен результат)
+        except asyncio.QueueEmpty:
+            if timeout is None:
+                scan_result = await results_queue.get()
+            else:
+                try:
+                    scan_result = await asyncio.wait_for(results_queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    await batcher.flush("linger") # Результати надходять повільно - не тримаємо їх до повної пачки
+                    continue
+
         if scan_result is None: # Сигнал завершення
-            if batch: # Індексуємо останню неповну пачку
-                await index_batch(es_client, batch) # Передаємо es_client
             results_queue.task_done()
             break
 
-        document = format_document(scan_result)
-        batch.append(document)
-
-        if len(batch) >= batch_size:
-            await index_batch(es_client, batch) # Передаємо es_client
-            batch = [] # Очистити пачку після індексації
-        
+        await batcher.add(scan_result)
         results_queue.task_done()
 
-async def index_batch(es_client: AsyncElasticsearch, documents: list):
+    progress.cancel()
+    if own_batcher:
+        try:
+            await batcher.close()
+        finally:
+            print(batcher.summary_line())
+            if batcher.tracker is not None:
+                print(batcher.tracker.summary_line())
+
+def retry_delay(attempt):
+    """Експоненційна затримка з повним джитером - повтори багатьох bulk-запитів не збігаються в часі."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+def write_dead_letters(path, entries):
+    """
+    Дописує остаточно невдалі елементи у файл NDJSON: по рядку {"action", "source", "status", "error", "failed_at"}.
+    action/source - рядки bulk-запиту без змін, тож їх можна відправити повторно.
+    """
+    failed_at = datetime.utcnow().isoformat(timespec='milliseconds') + "Z"
+    try:
+        with open(path, "a", encoding="utf-8") as dead_letter:
+            for action, source, status, error in entries:
+                record = {"action": action, "source": source, "status": status, "error": error, "failed_at": failed_at}
+                dead_letter.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        print(f"Не вдалося записати невдалі документи до '{path}': {e}")
+
+def build_operations(documents, tracker: ChangeTracker = None):
+    """Тіло bulk API для пачки документів: рядок дії, за ним - документ (або часткове оновлення)."""
+    if tracker is not None:
+        return tracker.operations(INDEX_NAME, documents)
+    operations = []
+    for doc in documents:
+        # 'index' - створити або замінити документ, якщо він вже існує.
+        # Це корисно для оновлення timestamp_last_seen при повторному скануванні.
+        operations.append({"index": {"_index": INDEX_NAME, "_id": document_id(doc)}}) # Унікальний ID для оновлення документів
+        operations.append(doc)
+    return operations
+
+async def index_batch(es_client: AsyncElasticsearch, documents: list, tracker: ChangeTracker = None,
+                      retries=DEFAULT_BULK_RETRIES, dead_letter_path=DEFAULT_DEAD_LETTER_PATH, spool=None):
     """
     Виконує масову індексацію документів в Elasticsearch.
     es_client: екземпляр AsyncElasticsearch
     documents: список документів для індексації
+    tracker: ChangeTracker - незмінені документи лише оновлюють timestamp_last_seen, змінені зберігають first_seen
+    retries, dead_letter_path, spool: див. send_operations; документи, що не записались і не потрапили до спулу,
+    дописуються до dead_letter_path
+    Повертає кількість успішно проіндексованих документів.
     """
     if es_client is None or not documents:
         print("Elasticsearch клієнт недоступний або немає документів для індексації.")
-        return
+        return 0
+    operations = build_operations(documents, tracker)
+    indexed, exhausted = await send_operations(es_client, operations, tracker, retries, dead_letter_path, spool)
+    if exhausted and dead_letter_path:
+        write_dead_letters(dead_letter_path, exhausted)
+    return indexed
 
-    actions = [
-        {
-            "_index": INDEX_NAME,
-            "_id": f"{doc['ip_address']}-{doc['port']}", # Унікальний ID для оновлення документів
-            "_source": doc
-        }
-        for doc in documents
-    ]
+def _decode_pair(entry):
+    """(дія, документ) елемента pending send_operations - з сирої пари NDJSON, якщо її не розбирали."""
+    action, source, pair = entry
+    if action is None:
+        action_line, source_line = pair.split(b"\n")[:2]
+        return json.loads(action_line), json.loads(source_line)
+    return action, source
 
-    try:
-        # Використовуємо bulk API для ефективної індексації
-        # 'op_type': 'index' - створити або замінити документ, якщо він вже існує.
-        # Це корисно для оновлення timestamp_last_seen при повторному скануванні.
-        success, failed = await es_client.options(request_timeout=30).bulk(operations=actions, op_type='index') # Використовуємо es_client
-        
-        if failed:
-            print(f"Помилка індексації деяких документів: {len(failed)} невдалих.")
-            # print(failed) # Для детального дебагу помилок індексації
+async def send_operations(es_client: AsyncElasticsearch, operations: list, tracker: ChangeTracker = None,
+                          retries=DEFAULT_BULK_RETRIES, dead_letter_path=DEFAULT_DEAD_LETTER_PATH, spool=None,
+                          encoded=None, on_failed_attempt=None):
+    """
+    Відправляє рядки bulk (дія, документ, ...) з повторами. Тіло запиту - готовий NDJSON (bytes), тож клієнт
+    Elasticsearch не кодує рядки повторно.
+    retries: скільки разів повторити елементи, відхилені через перевантаження (429/502/503/504), або весь запит
+             після помилки з'єднання. Повторно відправляються лише невдалі елементи, з експоненційною затримкою.
+    dead_letter_path: файл для елементів з остаточною помилкою (наприклад, 400) - None, лише повідомлення
+    spool: Spool для елементів, що вичерпали повтори (кластер недоступний) - їх допише відтворення спулу
+    encoded: NDJSON пар (дія, документ) з encode_pairs(operations), якщо вже закодовано; з operations=None -
+             лише вони (відтворення спулу), дія та документ розбираються тільки для невдалих елементів
+    on_failed_attempt(status): викликається для кожної спроби, що завершилась помилкою запиту або перевантаженням
+                       (status - HTTP-статус або None для помилки з'єднання); остаточні помилки окремих елементів
+                       (наприклад, 400) сюди не потрапляють
+    Повертає (кількість записаних, [(дія, документ, статус, помилка)] елементів, що вичерпали повтори і
+    не потрапили до спулу).
+    """
+    if encoded is None:
+        encoded = encode_pairs(operations)
+    if operations is None:
+        pending = [(None, None, pair) for pair in encoded] # Сирі пари: дія та документ розбираються лише при помилці
+    else:
+        pending = list(zip(operations[0::2], operations[1::2], encoded)) # (дія, документ, NDJSON) ще не записані
+    dead = [] # (дія, документ, статус, помилка) з остаточною помилкою
+    retry = [] # (елемент pending, статус, помилка)
+    indexed = 0
+
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(retry_delay(attempt - 1))
+        retry = []
+        BULK_DOCUMENTS.observe(len(pending))
+        started = time.perf_counter()
+        try:
+            # Використовуємо bulk API для ефективної індексації
+            body = b"".join(entry[2] for entry in pending)
+            response = await es_client.options(request_timeout=30).bulk(operations=body) # Використовуємо es_client
+        except ApiError as e:
+            status = getattr(e, "status_code", None)
+            if on_failed_attempt is not None:
+                on_failed_attempt(status)
+            if status not in RETRYABLE_STATUSES:
+                BULK_FAILURES.labels("api").inc()
+                print(f"Помилка API Elasticsearch під час індексації: {e.info}")
+                dead.extend((*_decode_pair(entry), status, str(e.info)) for entry in pending)
+                break
+            BULK_FAILURES.labels("overloaded").inc()
+            print(f"Elasticsearch перевантажений ({status}), повтор {len(pending)} документів (спроба {attempt + 1}).")
+            retry = [(entry, status, str(e.info)) for entry in pending]
+        except (ConnectionError, ConnectionTimeout) as e:
+            if on_failed_attempt is not None:
+                on_failed_attempt(None)
+            BULK_FAILURES.labels("connection").inc()
+            print(f"Помилка підключення до Elasticsearch під час індексації: {e}. Повтор (спроба {attempt + 1}).")
+            retry = [(entry, None, str(e)) for entry in pending]
+        except Exception as e:
+            if on_failed_attempt is not None:
+                on_failed_attempt(None)
+            BULK_FAILURES.labels("unexpected").inc()
+            print(f"Непередбачена помилка під час індексації: {e}")
+            dead.extend((*_decode_pair(entry), None, str(e)) for entry in pending)
+            break
         else:
-            print(f"Успішно проіндексовано {len(documents)} документів в Elasticsearch.")
-    except ApiError as e:
-        print(f"Помилка API Elasticsearch під час індексації: {e.info}")
-    except ConnectionError as e:
-        print(f"Помилка підключення до Elasticsearch під час індексації: {e}. Перевірте з'єднання.")
-    except Exception as e:
-        print(f"Непередбачена помилка під час індексації: {e}")
+            if not response["errors"]:
+                indexed += len(pending)
+                break
+            # Кожен елемент відповіді - {"index" | "update": {...}} у порядку дій запиту
+            for entry, item in zip(pending, response["items"]):
+                result = next(iter(item.values()))
+                if "error" not in result:
+                    indexed += 1
+                elif result.get("status") in RETRYABLE_STATUSES:
+                    retry.append((entry, result["status"], result["error"]))
+                else:
+                    dead.append((*_decode_pair(entry), result.get("status"), result["error"]))
+            if retry and on_failed_attempt is not None:
+                on_failed_attempt(retry[0][1]) # Перевантаження окремих елементів - як і всього запиту
+        finally:
+            BULK_SECONDS.observe(time.perf_counter() - started)
+        pending = [entry for entry, _, _ in retry]
+        if not pending:
+            break
+        if attempt < retries:
+            DOCUMENTS_RETRIED.inc(len(pending))
+    # Не порожній лише якщо спроби вичерпано
+    exhausted = [(*_decode_pair(entry), status, error) for entry, status, error in retry]
+    DOCUMENTS_INDEXED.inc(indexed)
+    DOCUMENTS_DEAD.inc(len(dead))
+
+    if tracker is not None and (dead or exhausted):
+        tracker.forget(next(iter(action.values()))["_id"] for action, _, _, _ in dead + exhausted)
+    if dead:
+        print(f"Помилка індексації деяких документів: {len(dead)} невдалих"
+              + (f", записано до '{dead_letter_path}'." if dead_letter_path else "."))
+        if dead_letter_path:
+            write_dead_letters(dead_letter_path, dead)
+    if exhausted and spool is not None:
+        await spool.append(b"".join(entry[2] for entry, _, _ in retry))
+        DOCUMENTS_SPOOLED.inc(len(exhausted))
+        print(f"Кластер не прийняв {len(exhausted)} документів після {retries} повторів - збережено до спулу.")
+        exhausted = []
+    elif exhausted:
+        DOCUMENTS_EXHAUSTED.inc(len(exhausted))
+        print(f"Кластер не прийняв {len(exhausted)} документів після {retries} повторів.")
+    # Успішні пачки не друкуються окремо: темп індексації - у підсумку прогресу (report_progress)
+    return indexed, exhausted
 
 # Функція для створення індексу в Elasticsearch (викликається один раз при запуску програми)
 # Змінено: Тепер приймає es_client як аргумент
@@ -200,7 +589,25 @@ async def create_index_if_not_exists(es_client: AsyncElasticsearch):
                         }
                     },
                     "service_name_inferred": {"type": "keyword"},
+                    "product_inferred": {"type": "keyword"},
                     "version_inferred": {"type": "keyword"},
+                    "probe": {"type": "keyword"},
+                    "tls": {
+                        "properties": {
+                            "version": {"type": "keyword"},
+                            "cipher": {"type": "keyword"},
+                            "certificate": {
+                                "properties": {
+                                    "sha256": {"type": "keyword"},
+                                    "subject": {"properties": {"CN": {"type": "keyword"}, "O": {"type": "keyword"}, "C": {"type": "keyword"}}},
+                                    "issuer": {"properties": {"CN": {"type": "keyword"}, "O": {"type": "keyword"}, "C": {"type": "keyword"}}},
+                                    "not_before": {"type": "date"},
+                                    "not_after": {"type": "date"}
+                                }
+                            }
+                        }
+                    },
+                    "content_hash": {"type": "keyword", "index": False}, # Відбиток змісту (src/change_tracker.py)
                     "tags": {"type": "keyword"},
                     "vulnerabilities": {"type": "nested"} # Використовувати "nested" для складних об'єктів
                 }
@@ -246,13 +653,16 @@ async def close_es_client_for_ingester_test(client: AsyncElasticsearch):
 
 if __name__ == "__main__":
     # Приклад автономного тестування модуля введення даних
+    # Запуск з кореня репозиторію: python -m src.data_ingester
+    from src.async_scanner import ScanResult
+
     async def test_ingester():
         # Створюємо тимчасову чергу та поміщаємо в неї тестові дані
         test_queue = asyncio.Queue()
-        await test_queue.put({'ip': '127.0.0.1', 'port': 80, 'banner': 'HTTP/1.1 200 OK'})
-        await test_queue.put({'ip': '127.0.0.1', 'port': 22, 'banner': 'SSH-2.0-OpenSSH_8.2p1 Ubuntu-4ubuntu0.1'})
-        await test_queue.put({'ip': '192.168.1.1', 'port': 443, 'banner': 'Nginx/1.18.0 (Ubuntu)'})
-        await test_queue.put({'ip': '192.168.1.2', 'port': 21, 'banner': '220 ProFTPD 1.3.6 Server (Debian) [::ffff:192.168.1.2]'})
+        await test_queue.put(ScanResult('127.0.0.1', 80, 'HTTP/1.1 200 OK', None, None))
+        await test_queue.put(ScanResult('127.0.0.1', 22, 'SSH-2.0-OpenSSH_8.2p1 Ubuntu-4ubuntu0.1', None, None))
+        await test_queue.put(ScanResult('192.168.1.1', 443, 'Nginx/1.18.0 (Ubuntu)', None, None))
+        await test_queue.put(ScanResult('192.168.1.2', 21, '220 ProFTPD 1.3.6 Server (Debian) [::ffff:192.168.1.2]', None, None))
 
         es_client_test = None
         try:
@@ -0,0 +1,255 @@
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import socket
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# Компактний двійковий формат бази діапазонів (будується з CSV командою `python -m src.geoip build`):
+#   заголовок: magic, кількість IPv4/IPv6 діапазонів, кількість записів, довжина JSON записів
+#   IPv6: start_hi, start_lo, end_hi, end_lo (uint64) та номер запису (uint32)
+#   IPv4: start, end (uint32) та номер запису (uint32), потім індекс /16: 65537 позицій першого діапазону,
+#         що починається в кожному /16 - бінарний пошук іде лише в межах кількох діапазонів
+#   записи збагачення (JSON-список, кожен унікальний запис - один раз)
+# Файл відображається в пам'ять (mmap) - сторінки спільні для всіх процесів, що його відкрили.
+MAGIC = b"SEGEOIP1"
+HEADER = struct.Struct("<8sQQQQ")
+LRU_CACHE_SIZE = 65536 # Кількість гарячих префіксів (/24 для IPv4, /64 для IPv6)
+MASK_64 = (1 << 64) - 1
+V4_BUCKETS = 1 << 16
+
+RECORD_FIELDS = ("country_code", "country_name", "city", "latitude", "longitude", "asn", "organization")
+
+UNKNOWN_LOCATION = {
+    "country_code": "XX",
+    "country_name": "Unknown",
+    "city": "Unknown",
+    "latitude": None,
+    "longitude": None,
+    "asn": None,
+    "organization": None
+}
+
+def _record_from_row(row):
+    """Запис збагачення з рядка CSV (відсутні колонки - None)."""
+    record = {}
+    for field in RECORD_FIELDS:
+        value = (row.get(field) or "").strip() or None
+        if value is not None and field in ("latitude", "longitude"):
+            value = float(value)
+        elif value is not None and field == "asn" and not value.upper().startswith("AS"):
+            value = f"AS{value}"
+        record[field] = value
+    return record
+
+def _row_bounds(row):
+    """(version, first, last) для рядка з колонкою network (CIDR) або start_ip/end_ip."""
+    if row.get("network"):
+        network = ipaddress.ip_network(row["network"].strip(), strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    first = ipaddress.ip_address(row["start_ip"].strip())
+    last = ipaddress.ip_address(row["end_ip"].strip())
+    return first.version, int(first), int(last)
+
+def build_database(csv_path, output_path):
+    """
+    Перетворює CSV з діапазонами на двійкову базу.
+    Колонки: network (CIDR) або start_ip,end_ip; далі country_code, country_name, city, latitude, longitude,
+    asn, organization (будь-які можуть бути відсутні). Діапазони не повинні перетинатися.
+    """
+    records = []
+    record_ids = {}
+    ranges_v4 = []
+    ranges_v6 = []
+    with open(csv_path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.DictReader(csv_file):
+            version, first, last = _row_bounds(row)
+            record = _record_from_row(row)
+            key = tuple(record[field] for field in RECORD_FIELDS)
+            record_id = record_ids.get(key)
+            if record_id is None:
+                record_id = record_ids[key] = len(records)
+                records.append(record)
+            (ranges_v4 if version == 4 else ranges_v6).append((first, last, record_id))
+    ranges_v4.sort()
+    ranges_v6.sort()
+
+    records_json = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with open(output_path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, len(ranges_v4), len(ranges_v6), len(records), len(records_json)))
+        for column in (lambda r: r[0] >> 64, lambda r: r[0] & MASK_64, lambda r: r[1] >> 64, lambda r: r[1] & MASK_64):
+            array("Q", (column(item) for item in ranges_v6)).tofile(output)
+        array("I", (item[2] for item in ranges_v6)).tofile(output)
+        for position in range(3):
+            array("I", (item[position] for item in ranges_v4)).tofile(output)
+        bucket_index = array("I", bytes(4 * (V4_BUCKETS + 1)))
+        bucket = 0
+        for index, item in enumerate(ranges_v4):
+            while bucket <= item[0] >> 16:
+                bucket_index[bucket] = index
+                bucket += 1
+        while bucket <= V4_BUCKETS:
+            bucket_index[bucket] = len(ranges_v4)
+            bucket += 1
+        bucket_index.tofile(output)
+        output.write(records_json)
+    return len(ranges_v4), len(ranges_v6), len(records)
+
+class GeoIPDatabase:
+    """
+    Пошук геолокації/ASN за IP у відсортованих масивах діапазонів (бінарний пошук), IPv4 та IPv6.
+    Масиви - це memoryview над mmap файлу, тож база майже не займає приватної пам'яті процесу.
+    Гарячі префікси (/24, /64), що цілком лежать в одному діапазоні (або в проміжку між діапазонами),
+    кешуються в LRU - повторні адреси з тієї ж мережі не потребують навіть розбору IP.
+    Повернені dict спільні для всіх адрес діапазону - їх не можна змінювати.
+    """
+
+    def __init__(self, path, cache_size=LRU_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count_v4, count_v6, count_records, json_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' не є базою GeoIP ScanEngine")
+        view = memoryview(self._map)
+        offset = HEADER.size
+
+        def take(typecode, count):
+            nonlocal offset
+            size = count * struct.calcsize(typecode)
+            column = view[offset:offset + size].cast(typecode)
+            offset += size
+            return column
+
+        self.v6_start_hi = take("Q", count_v6)
+        self.v6_start_lo = take("Q", count_v6)
+        self.v6_end_hi = take("Q", count_v6)
+        self.v6_end_lo = take("Q", count_v6)
+        self.v6_record = take("I", count_v6)
+        self.v4_start = take("I", count_v4)
+        self.v4_end = take("I", count_v4)
+        self.v4_record = take("I", count_v4)
+        self.v4_buckets = take("I", V4_BUCKETS + 1)
+        self.records = json.loads(bytes(view[offset:offset + json_length]).decode("utf-8"))
+
+    def __len__(self):
+        return len(self.v4_start) + len(self.v6_start_hi)
+
+    def _remember(self, key, record):
+        self.cache[key] = record
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def lookup(self, ip_address):
+        """Повертає dict збагачення для адреси або UNKNOWN_LOCATION."""
+        if ":" in ip_address:
+            return self._lookup_v6(ip_address)
+        prefix = ip_address[:ip_address.rfind(".")]
+        record = self.cache.get(prefix)
+        if record is not None:
+            self.cache.move_to_end(prefix)
+            return record
+        try:
+            value = int.from_bytes(socket.inet_aton(ip_address), "big")
+        except OSError:
+            return UNKNOWN_LOCATION
+        network_first, network_last = value & ~0xFF, value | 0xFF
+        bucket = value >> 16
+        index = bisect_right(self.v4_start, value, self.v4_buckets[bucket], self.v4_buckets[bucket + 1]) - 1
+        if index >= 0 and self.v4_end[index] >= value:
+            record = self.records[self.v4_record[index]]
+            covers_prefix = self.v4_start[index] <= network_first and self.v4_end[index] >= network_last
+        else:
+            record = UNKNOWN_LOCATION
+            following = index + 1
+            covers_prefix = ((index < 0 or self.v4_end[index] < network_first)
+                             and (following >= len(self.v4_start) or self.v4_start[following] > network_last))
+        if covers_prefix:
+            self._remember(prefix, record)
+        return record
+
+    def _lookup_v6(self, ip_address):
+        try:
+            high, low = struct.unpack(">QQ", socket.inet_pton(socket.AF_INET6, ip_address))
+        except OSError:
+            return UNKNOWN_LOCATION
+        record = self.cache.get(high)
+        if record is not None:
+            self.cache.move_to_end(high)
+            return record
+        # Лексикографічний пошук по (hi, lo): спершу за старшими 64 бітами, потім серед рівних - за молодшими
+        upper = bisect_right(self.v6_start_hi, high)
+        lower = bisect_left(self.v6_start_hi, high, 0, upper)
+        index = (bisect_right(self.v6_start_lo, low, lower, upper) if lower < upper else upper) - 1
+        if index >= 0 and (self.v6_end_hi[index], self.v6_end_lo[index]) >= (high, low):
+            record = self.records[self.v6_record[index]]
+            covers_prefix = (self.v6_start_hi[index], self.v6_start_lo[index]) <= (high, 0) \
+                and (self.v6_end_hi[index], self.v6_end_lo[index]) >= (high, MASK_64)
+            if covers_prefix:
+                self._remember(high, record)
+            return record
+        return UNKNOWN_LOCATION
+
+    def close(self):
+        for name in ("v6_start_hi", "v6_start_lo", "v6_end_hi", "v6_end_lo", "v6_record", "v4_start", "v4_end", "v4_record",
+                     "v4_buckets"):
+            getattr(self, name).release()
+        self._map.close()
+        self._file.close()
+
+_database = None
+_database_loaded = False
+
+def get_database(path=None):
+    """
+    База, відкрита один раз на процес. Шлях - аргумент або змінна оточення SCANENGINE_GEOIP_DB.
+    None, якщо базу не налаштовано або файл недоступний.
+    """
+    global _database, _database_loaded
+    if not _database_loaded:
+        _database_loaded = True
+        path = path or os.environ.get("SCANENGINE_GEOIP_DB")
+        if path:
+            try:
+                _database = GeoIPDatabase(path)
+                print(f"Базу GeoIP/ASN завантажено: {len(_database)} діапазонів ({path}).")
+            except (OSError, ValueError) as e:
+                print(f"Попередження: не вдалося відкрити базу GeoIP '{path}': {e}")
+    return _database
+
+if __name__ == "__main__":
+    # Побудова бази: python -m src.geoip build ranges.csv geoip.bin
+    # Мікробенчмарк пошуку: python -m src.geoip bench geoip.bin
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        count_v4, count_v6, count_records = build_database(sys.argv[2], sys.argv[3])
+        print(f"Збережено {count_v4} IPv4 та {count_v6} IPv6 діапазонів, {count_records} унікальних записів -> {sys.argv[3]}")
+    elif len(sys.argv) == 3 and sys.argv[1] == "bench":
+        database = GeoIPDatabase(sys.argv[2])
+        count = len(database.v4_start)
+        step = max(1, count // 10000)
+        addresses = [str(ipaddress.IPv4Address(database.v4_start[index] + 1)) for index in range(0, count, step)]
+        rounds = max(1, 200000 // max(1, len(addresses)))
+        database.cache_size = 0 # Спершу без кешу - чистий бінарний пошук
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for address in addresses:
+                database.lookup(address)
+        uncached = (time.perf_counter() - started) / (rounds * len(addresses))
+        database.cache_size = LRU_CACHE_SIZE
+        database.cache.clear()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for address in addresses:
+                database.lookup(address)
+        cached = (time.perf_counter() - started) / (rounds * len(addresses))
+        print(f"Діапазонів: {len(database)}; пошук без кешу: {uncached * 1e6:.2f} мкс, з кешем префіксів: {cached * 1e6:.2f} мкс.")
+    else:
+        print("Використання: python -m src.geoip build <ranges.csv> <output.bin> | bench <geoip.bin>")
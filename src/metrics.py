@@ -0,0 +1,289 @@
+import asyncio
+import bisect
+import threading
+import time
+
+# Метрики у форматі Prometheus (text exposition 0.0.4) без зовнішніх залежностей.
+# Оновлення - інкремент під неконкурентним замком (API обслуговує запити в кількох потоках), без виділення пам'яті;
+# у гарячому шляху варто брати дочірню метрику labels(...) один раз і зберігати.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+PROGRESS_INTERVAL = 10.0 # Секунд між підсумками прогресу
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self, lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ('function',)
+
+    def __init__(self, lock):
+        super().__init__(lock)
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        """Значення обчислюється під час збору (наприклад, queue.qsize)."""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, lock, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Останній - +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Контекстний менеджер: спостерігає тривалість блоку в секундах."""
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+class Metric:
+    """Сімейство метрик з однаковими іменами міток; labels(...) повертає (і кешує) дочірню метрику."""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def snapshot(self):
+        """Значення всіх дочірніх метрик: {значення міток: число або (counts, sum, count)}."""
+        return {values: self._child_value(child) for values, child in list(self._children.items())}
+
+    def _child_value(self, child):
+        return child.value
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    @property
+    def value(self):
+        return self._default.value
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def _child_value(self, child):
+        return child.get()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _child_value(self, child):
+        return list(child.counts), child.sum, child.count
+
+def _merge_values(kind, total, value):
+    if kind != "histogram":
+        return total + value
+    counts = [left + right for left, right in zip(total[0], value[0])]
+    return counts, total[1] + value[1], total[2] + value[2]
+
+class Registry:
+    """
+    Набір метрик процесу. Знімки інших процесів (шардований сканер) додаються через set_remote
+    і підсумовуються з локальними значеннями під час render().
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.remote = {} # джерело -> знімок
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрику '{metric.name}' вже зареєстровано")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        """Знімок усіх метрик, придатний для pickle (передачі між процесами)."""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def set_remote(self, source, snapshot):
+        with self._lock:
+            self.remote[source] = snapshot
+
+    def collect(self):
+        """{ім'я: {значення міток: значення}} - локальні значення плюс знімки інших процесів."""
+        with self._lock:
+            remotes = list(self.remote.values())
+        collected = {}
+        for name, metric in self.metrics.items():
+            values = metric.snapshot()
+            for remote in remotes:
+                for labels, value in remote.get(name, {}).items():
+                    values[labels] = _merge_values(metric.kind, values[labels], value) if labels in values else value
+            collected[name] = values
+        return collected
+
+    def render(self):
+        """Текстовий формат Prometheus."""
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(values.items()):
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(metric.labelnames, labels)} {_format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound:g}"'
+                    lines.append(f"{name}_bucket{_format_labels(metric.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(metric.labelnames, labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(metric.labelnames, labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def histogram_quantile(quantile, buckets, counts):
+    """
+    Оцінка квантиля з лічильників кошиків (не кумулятивних, останній - +Inf) з лінійною інтерполяцією
+    всередині кошика, як histogram_quantile у Prometheus. None - немає спостережень.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets, counts):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return buckets[-1] # Квантиль у кошику +Inf - відома лише нижня межа
+
+async def report_progress(summary, interval=PROGRESS_INTERVAL):
+    """Друкує summary(elapsed) раз на interval секунд замість повідомлень на кожну ціль; скасовується ззовні."""
+    previous = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        line = summary(now - previous)
+        previous = now
+        if line:
+            print(line)
+
+async def start_metrics_server(port, host="0.0.0.0", registry=None):
+    """
+    Мінімальний HTTP-сервер у поточному циклі подій: GET /metrics - метрики процесу у форматі Prometheus.
+    Повертає asyncio.Server (закривається викликом close()).
+    """
+    registry = registry or REGISTRY
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass # Заголовки не потрібні
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, registry.render().encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not Found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                         "Connection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Метрики Prometheus: http://{host}:{port}/metrics")
+    return server
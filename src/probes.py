@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import ssl
+
+DEFAULT_MAX_BANNER_BYTES = 1024
+
+class Probe:
+    """
+    Опис проби банера: що надіслати після з'єднання (payload=None - лише слухати, сервіс говорить першим),
+    на якій послідовності байтів відповідь вважається повною (terminator) та скільки байтів читати максимум.
+    tls=True - спочатку TLS-рукостискання (ClientHello) із захопленням сертифіката, payload надсилається вже всередині TLS.
+    """
+    __slots__ = ('name', 'payload', 'terminator', 'max_bytes', 'tls')
+
+    def __init__(self, name, payload=None, terminator=None, max_bytes=DEFAULT_MAX_BANNER_BYTES, tls=False):
+        self.name = name
+        self.payload = payload
+        self.terminator = terminator
+        self.max_bytes = max_bytes
+        self.tls = tls
+
+# ---- Таблиця проб ----
+PROBES = {
+    # SSH, FTP, SMTP, POP3, IMAP, MySQL тощо вітаються першими - досить одного рядка
+    "passive": Probe("passive", None, b"\n"),
+    "http_head": Probe("http_head", b"HEAD / HTTP/1.0\r\nUser-Agent: ScanEngine\r\nAccept: */*\r\n\r\n", b"\r\n\r\n", 4096),
+    "tls": Probe("tls", b"HEAD / HTTP/1.0\r\nUser-Agent: ScanEngine\r\nAccept: */*\r\n\r\n", b"\r\n\r\n", 4096, tls=True),
+    # SMTPS, IMAPS, POP3S вітаються першими вже всередині TLS; LDAPS мовчить - лишається сертифікат
+    "tls_passive": Probe("tls_passive", None, b"\n", tls=True),
+    "redis": Probe("redis", b"PING\r\n", b"\r\n"),
+    # Для невідомих портів - порожні рядки, на які відповідає більшість текстових протоколів
+    "generic": Probe("generic", b"\r\n\r\n", b"\n"),
+}
+
+PORT_PROBES = {
+    21: "passive", 22: "passive", 23: "passive", 25: "passive", 110: "passive", 143: "passive",
+    587: "passive", 2222: "passive", 3306: "passive", 5900: "passive",
+    80: "http_head", 81: "http_head", 591: "http_head", 3000: "http_head", 5000: "http_head",
+    8000: "http_head", 8008: "http_head", 8080: "http_head", 8081: "http_head", 8888: "http_head", 9200: "http_head",
+    443: "tls", 8443: "tls", 9443: "tls",
+    465: "tls_passive", 636: "tls_passive", 993: "tls_passive", 995: "tls_passive",
+    6379: "redis",
+}
+
+def probe_for(port):
+    """Вибирає пробу за портом; невідомі порти - загальна проба."""
+    return PROBES[PORT_PROBES.get(port, "generic")]
+
+async def read_until(reader, terminator, max_bytes, timeout):
+    """
+    Читає, доки не зустрінеться terminator, не буде max_bytes, EOF або не мине timeout.
+    Повертає прочитане одразу, щойно відповідь повна, не чекаючи таймауту.
+    asyncio.TimeoutError - лише якщо за timeout не прийшло жодного байта.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    data = b""
+    while len(data) < max_bytes:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            if not data:
+                raise asyncio.TimeoutError()
+            break
+        try:
+            chunk = await asyncio.wait_for(reader.read(max_bytes - len(data)), timeout=remaining)
+        except asyncio.TimeoutError:
+            if not data:
+                raise
+            break # Частковий банер кращий, ніж жодного
+        if not chunk: # EOF
+            break
+        data += chunk
+        if terminator and terminator in data:
+            break
+    return data
+
+# ---- TLS ----
+def make_tls_context():
+    """Контекст для збору сертифікатів: без перевірки, з максимально широким набором шифрів."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        context.set_ciphers("ALL:@SECLEVEL=0") # Старі сервіси теж цікаві
+    except ssl.SSLError:
+        pass
+    return context
+
+TLS_CONTEXT = make_tls_context()
+
+OID_NAMES = {
+    bytes.fromhex("550403"): "CN",
+    bytes.fromhex("55040a"): "O",
+    bytes.fromhex("550406"): "C",
+}
+
+def _der_node(data, offset):
+    """Повертає (tag, start, end) вузла DER, що починається з offset."""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[offset:offset + size], "big")
+        offset += size
+    return tag, offset, offset + length
+
+def _der_children(data, start, end):
+    while start < end:
+        node = _der_node(data, start)
+        yield node
+        start = node[2]
+
+def _der_name(data, node):
+    attributes = {}
+    for _, set_start, set_end in _der_children(data, node[1], node[2]):
+        for _, seq_start, seq_end in _der_children(data, set_start, set_end):
+            oid, value = list(_der_children(data, seq_start, seq_end))[:2]
+            key = OID_NAMES.get(data[oid[1]:oid[2]])
+            if key:
+                attributes[key] = data[value[1]:value[2]].decode("utf-8", errors="replace")
+    return attributes
+
+def _der_time(data, node):
+    text = data[node[1]:node[2]].decode("ascii", errors="replace")
+    if node[0] == 0x17: # UTCTime: YYMMDDHHMMSSZ
+        year = int(text[:2])
+        text = f"{1900 + year if year >= 50 else 2000 + year}{text[2:]}"
+    return f"{text[0:4]}-{text[4:6]}-{text[6:8]}T{text[8:10]}:{text[10:12]}:{text[12:14]}Z"
+
+def parse_certificate(der):
+    """
+    Мінімальний розбір X.509 (DER) без зовнішніх залежностей: subject, issuer, строк дії та відбиток SHA-256.
+    """
+    info = {"sha256": hashlib.sha256(der).hexdigest()}
+    try:
+        _, cert_start, _ = _der_node(der, 0)
+        _, tbs_start, tbs_end = _der_node(der, cert_start)
+        fields = list(_der_children(der, tbs_start, tbs_end))
+        if fields[0][0] == 0xA0: # Необов'язкова версія [0]
+            fields = fields[1:]
+        _, _, issuer, validity, subject = fields[:5]
+        not_before, not_after = list(_der_children(der, validity[1], validity[2]))[:2]
+        info.update({
+            "subject": _der_name(der, subject),
+            "issuer": _der_name(der, issuer),
+            "not_before": _der_time(der, not_before),
+            "not_after": _der_time(der, not_after),
+        })
+    except (IndexError, ValueError):
+        pass # Нестандартний сертифікат - залишаємо хоча б відбиток
+    return info
+
+async def start_tls(writer, timeout):
+    """
+    Виконує TLS-рукостискання на вже відкритому з'єднанні.
+    Повертає dict з версією протоколу, шифром та даними сертифіката.
+    """
+    await asyncio.wait_for(writer.start_tls(TLS_CONTEXT), timeout=timeout)
+    ssl_object = writer.get_extra_info("ssl_object")
+    tls_info = {"version": ssl_object.version(), "cipher": (ssl_object.cipher() or (None,))[0]}
+    der = ssl_object.getpeercert(binary_form=True)
+    if der:
+        tls_info["certificate"] = parse_certificate(der)
+    return tls_info
+
+def describe_tls(tls_info):
+    """Короткий текстовий опис TLS для поля banner."""
+    certificate = tls_info.get("certificate", {})
+    subject = certificate.get("subject", {}).get("CN", "?")
+    issuer = certificate.get("issuer", {}).get("CN", "?")
+    return f"TLS {tls_info['version']} {tls_info['cipher']}; subject CN={subject}; issuer CN={issuer}"
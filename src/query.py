@@ -0,0 +1,165 @@
+import base64
+import binascii
+import ipaddress
+import json
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 1000
+
+# Стабільний порядок для курсорів search_after: час, потім унікальна пара (ip_address, port)
+SEARCH_SORT = [{"timestamp_last_seen": {"order": "desc"}}, {"ip_address": {"order": "asc"}}, {"port": {"order": "asc"}}]
+
+# Поля відповіді /search за замовчуванням (projection _source) - без сертифіката та повної геолокації
+DEFAULT_SEARCH_FIELDS = (
+    "ip_address", "port", "protocol", "banner", "service_name_inferred", "product_inferred", "version_inferred",
+    "timestamp_first_seen", "timestamp_last_seen", "geolocation.country_code", "geolocation.asn",
+)
+
+# Параметр запиту -> (поле індексу, нормалізація значення) для фільтрів за точним значенням (keyword/integer)
+TERM_FILTERS = {
+    "port": ("port", int),
+    "service": ("service_name_inferred", str),
+    "product": ("product_inferred", str),
+    "version": ("version_inferred", str),
+    "country": ("geolocation.country_code", str.upper),
+    "asn": ("geolocation.asn", lambda value: value.upper() if value.upper().startswith("AS") else f"AS{value}"),
+}
+
+# Текстовий пошук q: лише ці поля, оператори + | - "фраза" префікс* (дужки) та екранування
+TEXT_QUERY_FIELDS = ("banner",)
+TEXT_QUERY_FLAGS = "AND|OR|NOT|PHRASE|PREFIX|PRECEDENCE|ESCAPE|WHITESPACE"
+MAX_TEXT_QUERY_LENGTH = 512
+
+# Параметри зі списком значень (через кому або повторені) - їх порядок не впливає на запит
+LIST_PARAMS = frozenset(TERM_FILTERS) | {"cidr", "fields", "facets"}
+
+def _values(args, name):
+    """Усі значення параметра: повторені (?port=22&port=80) та через кому (?port=22,80)."""
+    values = []
+    for raw in args.getlist(name) if hasattr(args, "getlist") else [args[name]] if name in args else []:
+        values.extend(value.strip() for value in raw.split(",") if value.strip())
+    return values
+
+def build_filters(args):
+    """
+    Фільтри bool-запиту з параметрів: port, service, product, version, country, asn (кілька значень - будь-яке з них),
+    cidr (мережа або адреса, IPv4/IPv6 - term на полі типу ip), since/until (timestamp_last_seen, ISO 8601
+    або date math, наприклад now-7d). ValueError - некоректне значення.
+    """
+    filters = []
+    for name, (field, normalize) in TERM_FILTERS.items():
+        values = _values(args, name)
+        if values:
+            try:
+                filters.append({"terms": {field: [normalize(value) for value in values]}})
+            except ValueError:
+                raise ValueError(f"Некоректне значення параметра '{name}': {','.join(values)}")
+    networks = _values(args, "cidr")
+    if networks:
+        try:
+            networks = [str(ipaddress.ip_network(network, strict=False)) for network in networks]
+        except ValueError as e:
+            raise ValueError(f"Некоректна мережа в 'cidr': {e}")
+        filters.append({"terms": {"ip_address": networks}})
+    time_range = {bound: args.get(name) for bound, name in (("gte", "since"), ("lte", "until")) if args.get(name)}
+    if time_range:
+        filters.append({"range": {"timestamp_last_seen": time_range}})
+    return filters
+
+def build_query(args):
+    """
+    Запит Elasticsearch: q - текстовий пошук по banner (оцінює релевантність), решта - фільтри без оцінки.
+    q розбирається як simple_query_string лише по TEXT_QUERY_FIELDS: синтаксис, що дозволяє звертатися до
+    інших полів, регулярні вирази, провідні wildcard та нечіткий пошук недоступні. ValueError - задовгий q.
+    """
+    must = []
+    text = (args.get("q") or "").strip()
+    if len(text) > MAX_TEXT_QUERY_LENGTH:
+        raise ValueError(f"Параметр 'q' довший за {MAX_TEXT_QUERY_LENGTH} символів")
+    if text:
+        must.append({"simple_query_string": {
+            "query": text,
+            "fields": list(TEXT_QUERY_FIELDS),
+            "default_operator": "AND",
+            "flags": TEXT_QUERY_FLAGS,
+            "lenient": True,
+        }})
+    filters = build_filters(args)
+    if not must and not filters:
+        return {"match_all": {}}
+    return {"bool": {"must": must, "filter": filters}}
+
+def encode_cursor(sort_values):
+    return base64.urlsafe_b64encode(json.dumps(sort_values, separators=(",", ":")).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ValueError("Некоректний курсор 'after'")
+    if not isinstance(values, list) or len(values) != len(SEARCH_SORT):
+        raise ValueError("Некоректний курсор 'after'")
+    return values
+
+def parse_page_size(args, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(args.get("size", default))
+    except ValueError:
+        raise ValueError("Параметр 'size' має бути цілим числом")
+    if not 1 <= size <= maximum:
+        raise ValueError(f"Параметр 'size' має бути від 1 до {maximum}")
+    return size
+
+def parse_fields(args, default=DEFAULT_SEARCH_FIELDS):
+    """Projection _source: ?fields=ip_address,port,tls; fields=* - повний документ."""
+    fields = _values(args, "fields")
+    if not fields:
+        return list(default)
+    if fields == ["*"]:
+        return True
+    return fields
+
+def build_search(args):
+    """Тіло пошукового запиту для /search: запит, сторінка, сортування, курсор і projection."""
+    size = parse_page_size(args)
+    body = {
+        "query": build_query(args),
+        "size": size,
+        "sort": SEARCH_SORT,
+        "_source": parse_fields(args),
+    }
+    if args.get("after"):
+        body["search_after"] = decode_cursor(args["after"])
+    return body
+
+# ---- Фасети (агрегації terms по keyword/integer полях маппінгу) ----
+DEFAULT_FACET_SIZE = 10
+MAX_FACET_SIZE = 100
+
+FACET_FIELDS = {
+    "port": "port",
+    "service": "service_name_inferred",
+    "product": "product_inferred",
+    "version": "version_inferred",
+    "country": "geolocation.country_code",
+    "asn": "geolocation.asn",
+}
+DEFAULT_FACETS = ("port", "service", "version", "country", "asn")
+
+def build_facets(args):
+    """
+    Тіло запиту для /facets: ті ж запит і фільтри, що й у /search, без документів (size 0),
+    по одній агрегації terms на фасет - усі фасети за один запит. facets=port,asn - вибір фасетів,
+    size - кількість значень на фасет.
+    """
+    names = _values(args, "facets") or list(DEFAULT_FACETS)
+    unknown = [name for name in names if name not in FACET_FIELDS]
+    if unknown:
+        raise ValueError(f"Невідомі фасети: {', '.join(unknown)}; доступні: {', '.join(FACET_FIELDS)}")
+    size = parse_page_size(args, DEFAULT_FACET_SIZE, MAX_FACET_SIZE)
+    return {
+        "query": build_query(args),
+        "size": 0,
+        "track_total_hits": True,
+        "aggs": {name: {"terms": {"field": FACET_FIELDS[name], "size": size}} for name in dict.fromkeys(names)},
+    }
@@ -0,0 +1,118 @@
+import asyncio
+from collections import OrderedDict, deque
+
+try:
+    import resource # Немає на Windows
+except ImportError:
+    resource = None
+
+# Дескриптори, які залишаємо поза бюджетом сканера: клієнт Elasticsearch, файли, stdin/stdout тощо
+FD_RESERVE = 128
+DEFAULT_MAX_IN_FLIGHT = 1000 # Якщо обмеження дескрипторів невідоме
+MAX_AUTO_IN_FLIGHT = 50000 # Стеля автоматичного розміру: далі один цикл подій впирається в CPU, а не в сокети
+
+class FairRateLimiter:
+    """
+    Глобальний обмежувач швидкості з'єднань (token bucket, з'єднань/с) з чесним розподілом між ключами
+    (підмережами цілей): токени видаються по черзі (round-robin) кожному ключу, що має очікувачів,
+    тож велика підмережа не витісняє менші, а навантаження на ціль рівномірне, без сплесків.
+    rate=None вимикає обмеження.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        # Невеликий запас токенів згладжує роботу диспетчера, але не дає великих сплесків
+        self.burst = burst if burst is not None else max(1.0, (rate or 0) / 50)
+        self.waiters = OrderedDict() # ключ -> deque[Future]
+        self.granted = 0
+        self._wakeup = asyncio.Event()
+        self._dispatcher = None
+
+    async def acquire(self, key):
+        """Чекає на токен для ключа (наприклад, підмережі /24 цілі)."""
+        if not self.rate:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, deque()).append(future)
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await future
+
+    def _grant_next(self):
+        """Видає один токен наступному ключу в порядку round-robin. Повертає False, якщо видати нікому."""
+        while self.waiters:
+            key, waiting = next(iter(self.waiters.items()))
+            future = waiting.popleft()
+            if waiting:
+                self.waiters.move_to_end(key)
+            else:
+                del self.waiters[key]
+            if not future.done(): # Очікувача могли скасувати
+                future.set_result(None)
+                self.granted += 1
+                return True
+        return False
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        tokens = self.burst
+        last = loop.time()
+        while True:
+            if not self.waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = loop.time()
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            last = now
+            while tokens >= 1 and self._grant_next():
+                tokens -= 1
+            if self.waiters:
+                await asyncio.sleep((1 - tokens) / self.rate)
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+def fd_budget(reserve=FD_RESERVE):
+    """
+    Повертає кількість файлових дескрипторів, доступних під сокети сканера.
+    Спочатку намагається підняти м'яке обмеження RLIMIT_NOFILE до жорсткого.
+    None - якщо обмеження невідоме (наприклад, Windows).
+    """
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return None
+    return max(1, soft - reserve)
+
+def size_concurrency(max_in_flight, max_banner_workers, budget):
+    """
+    Узгоджує паралельність стадій з бюджетом дескрипторів.
+    Сокет тримають: проби виявлення, черга банерів (2 x max_banner_workers) та самі робітники банерів.
+    max_in_flight=None - взяти все, що лишилось після стадії банерів.
+    Повертає (max_in_flight, max_banner_workers).
+    """
+    if budget is None:
+        return (max_in_flight or DEFAULT_MAX_IN_FLIGHT), max_banner_workers
+    max_banner_workers = max(1, min(max_banner_workers, budget // 4))
+    available = max(1, budget - 3 * max_banner_workers)
+    if max_in_flight is None:
+        return min(available, MAX_AUTO_IN_FLIGHT), max_banner_workers
+    if max_in_flight > available:
+        print(f"Попередження: {max_in_flight} одночасних проб перевищує бюджет дескрипторів; зменшено до {available}.")
+        return available, max_banner_workers
+    return max_in_flight, max_banner_workers
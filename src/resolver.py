@@ -0,0 +1,241 @@
+import asyncio
+import ipaddress
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict
+
+DEFAULT_DNS_CONCURRENCY = 50 # Одночасних DNS-запитів
+DEFAULT_POSITIVE_TTL = 300 # Секунд кешування успішної відповіді (якщо бекенд не повідомив TTL)
+DEFAULT_NEGATIVE_TTL = 60 # Секунд кешування невдалої відповіді (NXDOMAIN, таймаут)
+DEFAULT_DNS_TIMEOUT = 3.0 # Таймаут одного запиту до DNS-сервера
+MAX_CACHE_ENTRIES = 100000
+
+DNS_TYPE_A = 1
+DNS_TYPE_AAAA = 28
+DNS_RCODE_NXDOMAIN = 3
+
+def parse_hosts_file(path):
+    """
+    Читає файл у форматі /etc/hosts ("адреса ім'я [аліаси...]", коментарі після #).
+    Повертає dict: ім'я (нижній регістр) -> список адрес у порядку появи.
+    """
+    records = {}
+    with open(path, encoding='utf-8') as hosts_file:
+        for line in hosts_file:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) < 2:
+                continue
+            try:
+                address = str(ipaddress.ip_address(fields[0]))
+            except ValueError:
+                continue
+            for name in fields[1:]:
+                addresses = records.setdefault(name.lower().rstrip('.'), [])
+                if address not in addresses:
+                    addresses.append(address)
+    return records
+
+# ---- Мінімальний DNS-клієнт (UDP) для звернення до stub-резолвера ----
+def build_query(query_id, hostname, record_type):
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0) # RD=1, одне питання
+    question = b''.join(bytes([len(label)]) + label for label in hostname.encode('idna').split(b'.') if label)
+    return header + question + b'\x00' + struct.pack('!HH', record_type, 1)
+
+def _skip_name(message, offset):
+    while True:
+        length = message[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0: # Стиснення - вказівник завершує ім'я
+            return offset + 2
+        offset += length + 1
+
+def parse_response(message):
+    """
+    Розбирає відповідь DNS. Повертає (query_id, rcode, truncated, [(address, ttl), ...]) для A/AAAA записів.
+    """
+    query_id, flags, qdcount, ancount, _, _ = struct.unpack_from('!HHHHHH', message, 0)
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(message, offset) + 4
+    answers = []
+    for _ in range(ancount):
+        offset = _skip_name(message, offset)
+        record_type, _, ttl, length = struct.unpack_from('!HHIH', message, offset)
+        offset += 10
+        data = message[offset:offset + length]
+        offset += length
+        if record_type == DNS_TYPE_A and length == 4:
+            answers.append((socket.inet_ntop(socket.AF_INET, data), ttl))
+        elif record_type == DNS_TYPE_AAAA and length == 16:
+            answers.append((socket.inet_ntop(socket.AF_INET6, data), ttl))
+    return query_id, flags & 0x000F, bool(flags & 0x0200), answers
+
+class _DnsProtocol(asyncio.DatagramProtocol):
+    """Збирає відповіді на відправлені запити за їх ідентифікаторами."""
+
+    def __init__(self, pending):
+        self.pending = pending # query_id -> Future
+
+    def datagram_received(self, data, addr):
+        try:
+            parsed = parse_response(data)
+        except (struct.error, IndexError):
+            return # Пошкоджена відповідь - чекаємо на таймаут
+        future = self.pending.get(parsed[0])
+        if future is not None and not future.done():
+            future.set_result(parsed)
+
+    def error_received(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+class Resolver:
+    """
+    Асинхронний резолвер імен хостів для сканера.
+    - паралельні запити з обмеженням max_concurrency та об'єднанням однакових запитів, що виконуються;
+    - кеш у пам'яті з TTL (позитивний і негативний), обмежений за розміром;
+    - повертає всі A та AAAA записи;
+    - джерела: hosts-файл (перевіряється першим), stub DNS-сервер через UDP (nameserver, з реальними TTL)
+      або системний getaddrinfo. hosts-файл чи локальний stub дозволяють працювати офлайн.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_DNS_CONCURRENCY, positive_ttl=DEFAULT_POSITIVE_TTL,
+                 negative_ttl=DEFAULT_NEGATIVE_TTL, hosts_file=None, nameserver=None, timeout=DEFAULT_DNS_TIMEOUT,
+                 use_system=True):
+        self.max_concurrency = max_concurrency
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.hosts_file = hosts_file
+        self.nameserver = nameserver # "127.0.0.53" або ("127.0.0.1", 5353)
+        self.timeout = timeout
+        self.use_system = use_system
+        self.hosts = parse_hosts_file(hosts_file) if hosts_file else {}
+        self.cache = OrderedDict() # ім'я -> (expires_at, [адреси])
+        self.in_flight = {} # ім'я -> Future, для об'єднання однакових запитів
+        self._slots = None
+        self.hits = 0
+        self.misses = 0
+
+    def config(self):
+        """Параметри для відтворення резолвера в іншому процесі (шардований режим)."""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'positive_ttl': self.positive_ttl,
+            'negative_ttl': self.negative_ttl,
+            'hosts_file': self.hosts_file,
+            'nameserver': self.nameserver,
+            'timeout': self.timeout,
+            'use_system': self.use_system,
+        }
+
+    def _cached(self, name):
+        entry = self.cache.get(name)
+        if entry is None:
+            return None
+        expires_at, addresses = entry
+        if expires_at < time.monotonic():
+            del self.cache[name]
+            return None
+        self.cache.move_to_end(name)
+        return addresses
+
+    def _store(self, name, addresses, ttl):
+        self.cache[name] = (time.monotonic() + ttl, addresses)
+        self.cache.move_to_end(name)
+        if len(self.cache) > MAX_CACHE_ENTRIES:
+            self.cache.popitem(last=False)
+
+    async def resolve(self, hostname):
+        """Повертає список усіх адрес (IPv4 та IPv6) імені; порожній список, якщо ім'я не розпізнано."""
+        name = hostname.lower().rstrip('.')
+        if name in self.hosts:
+            return list(self.hosts[name])
+        addresses = self._cached(name)
+        if addresses is not None:
+            self.hits += 1
+            return list(addresses)
+        self.misses += 1
+
+        if name in self.in_flight:
+            return list(await asyncio.shield(self.in_flight[name]))
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[name] = future
+        try:
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+            async with self._slots:
+                addresses, ttl = await self._lookup(name)
+            self._store(name, addresses, ttl)
+            future.set_result(addresses)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # Позначаємо виняток отриманим, якщо ніхто більше не чекав
+            raise
+        finally:
+            del self.in_flight[name]
+        return list(addresses)
+
+    async def resolve_many(self, hostnames):
+        """Розпізнає список імен паралельно (в межах max_concurrency). Повертає dict ім'я -> [адреси]."""
+        results = await asyncio.gather(*(self.resolve(hostname) for hostname in hostnames))
+        return dict(zip(hostnames, results))
+
+    async def _lookup(self, name):
+        """Повертає ([адреси], ttl). Невдача кешується як негативна відповідь."""
+        if self.nameserver:
+            try:
+                return await self._lookup_dns(name)
+            except (asyncio.TimeoutError, OSError) as e:
+                if not self.use_system:
+                    print(f"Помилка DNS для '{name}': {e}")
+                    return [], self.negative_ttl
+        if self.use_system:
+            return await self._lookup_system(name)
+        return [], self.negative_ttl
+
+    async def _lookup_system(self, name):
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+        except (socket.gaierror, UnicodeError):
+            return [], self.negative_ttl
+        addresses = []
+        for family, _, _, _, sockaddr in infos:
+            if family in (socket.AF_INET, socket.AF_INET6) and sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+        return addresses, (self.positive_ttl if addresses else self.negative_ttl)
+
+    async def _lookup_dns(self, name):
+        loop = asyncio.get_running_loop()
+        host, port = self.nameserver if isinstance(self.nameserver, tuple) else (self.nameserver, 53)
+        pending = {}
+        transport, _ = await loop.create_datagram_endpoint(lambda: _DnsProtocol(pending), remote_addr=(host, port))
+        try:
+            for record_type in (DNS_TYPE_A, DNS_TYPE_AAAA):
+                query_id = random.getrandbits(16)
+                while query_id in pending:
+                    query_id = random.getrandbits(16)
+                pending[query_id] = loop.create_future()
+                transport.sendto(build_query(query_id, name, record_type))
+            responses = await asyncio.wait_for(asyncio.gather(*pending.values()), timeout=self.timeout)
+        finally:
+            transport.close()
+
+        addresses = []
+        ttls = []
+        for _, rcode, truncated, answers in responses:
+            if truncated and self.use_system:
+                return await self._lookup_system(name) # Відповідь не вмістилась у UDP
+            if rcode == DNS_RCODE_NXDOMAIN:
+                return [], self.negative_ttl
+            for address, ttl in answers:
+                if address not in addresses:
+                    addresses.append(address)
+                ttls.append(ttl)
+        if not addresses:
+            return [], self.negative_ttl
+        return addresses, min(min(ttls), self.positive_ttl)
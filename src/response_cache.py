@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 1024 # Відповідей у кеші
+DEFAULT_CACHE_TTL = 30.0 # Секунд життя відповіді
+CACHEABLE_STATUSES = frozenset((200, 404))
+
+class CachedResponse:
+    """Готове тіло відповіді (JSON у байтах) з ETag - повторна віддача не серіалізує даних заново."""
+    __slots__ = ('status', 'body', 'etag', 'expires_at', 'generation')
+
+    def __init__(self, status, payload, ttl, generation):
+        self.status = status
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=12).hexdigest()}"'
+        self.expires_at = time.monotonic() + ttl
+        self.generation = generation
+
+def normalize_args(args, list_params=()):
+    """
+    Ключ кешу з параметрів запиту, незалежний від порядку параметрів. Значення параметрів-списків (list_params,
+    наприклад фільтри port, country) ще й упорядковуються: ?port=80,22 == ?port=22&port=80. Решта (q, after,
+    since...) лишається дослівною - кома в тексті запиту чи курсорі значуща.
+    """
+    normalized = []
+    for name in sorted(set(args.keys())):
+        values = args.getlist(name) if hasattr(args, "getlist") else [args[name]]
+        if name in list_params:
+            values = sorted(value.strip() for raw in values for value in raw.split(",") if value.strip())
+        normalized.append((name, tuple(values)))
+    return tuple(normalized)
+
+class ResponseCache:
+    """
+    Кеш відповідей API у пам'яті процесу: LRU, обмежений max_entries, з TTL на запис.
+    Однакові одночасні промахи об'єднуються - бекенд отримує один запит, решта чекає на його результат.
+    Усі записи скидаються, щойно зміниться позначка свіжості індексу (найпізніший timestamp_last_seen,
+    observe_watermark) - нові дані сканування не ховаються за TTL.
+    Не потокобезпечний: усі виклики - з одного циклу подій (у src/api.py - цикл пулу Elasticsearch).
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # ключ -> CachedResponse
+        self.in_flight = {} # ключ -> Future, для об'єднання однакових промахів
+        self.generation = 0
+        self.watermark = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get_or_fetch(self, key, fetch, ttl=None):
+        """
+        Повертає (CachedResponse, "hit" | "miss" | "coalesced").
+        fetch - async-функція без аргументів, що повертає (HTTP-статус, payload); кешуються лише 200 та 404.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic() and entry.generation == self.generation:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry, "hit"
+            del self.entries[key]
+
+        if key in self.in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self.in_flight[key]), "coalesced"
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        generation = self.generation
+        try:
+            status, payload = await fetch()
+            entry = CachedResponse(status, payload, self.ttl if ttl is None else ttl, generation)
+            # Відповідь, отримана до зміни даних, не кешується
+            if status in CACHEABLE_STATUSES and generation == self.generation:
+                self._store(key, entry)
+            future.set_result(entry)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception() # Позначаємо виняток отриманим, якщо ніхто більше не чекав
+            raise
+        finally:
+            del self.in_flight[key]
+        return entry, "miss"
+
+    def _store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def observe_watermark(self, watermark):
+        """Нова позначка свіжості індексу; якщо вона змінилась - кеш скидається."""
+        if watermark != self.watermark:
+            if self.watermark is not None:
+                self.invalidate()
+            self.watermark = watermark
+
+    def invalidate(self):
+        self.generation += 1
+        self.entries.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "watermark": self.watermark,
+        }
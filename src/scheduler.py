@@ -0,0 +1,271 @@
+import ipaddress
+import json
+import os
+import time
+from datetime import datetime
+
+from elasticsearch import ApiError, ConnectionError, NotFoundError
+
+from src.async_scanner import parse_ports
+from src.resolver import Resolver
+from src.targets import host_interval, interval_contains, iter_addresses, merge_intervals, split_targets
+
+DEFAULT_STATE_PATH = "rescan_state.json"
+BLOCK_SIZE = 256 # Адрес у блоці розкладу: /24 для IPv4, /120 для IPv6
+DEFAULT_OPEN_INTERVAL = 3600.0 # Відомі відкриті порти - перевірка щогодини
+DEFAULT_LIVE_INTERVAL = 86400.0 # Блоки, де є відкриті порти, - повний обхід щодня
+DEFAULT_DEAD_INTERVAL = 3 * 86400.0 # Порожній блок: перший повтор через 3 дні, далі інтервал подвоюється
+DEFAULT_DEAD_MAX_INTERVAL = 30 * 86400.0
+DEFAULT_CLOSED_GRACE = 3 * 86400.0 # Порт, не бачений відкритим стільки часу, вважається закритим
+SEED_PAGE_SIZE = 5000
+SEED_SCROLL_KEEPALIVE = "2m"
+
+# Пріоритети (менше - раніше): нові блоки одразу, потім відомі відкриті порти, потім живі та порожні блоки
+PRIORITY_NEW = 0
+PRIORITY_OPEN = 1
+PRIORITY_LIVE = 2
+PRIORITY_DEAD = 3
+
+def parse_timestamp(value):
+    """ISO 8601 з Elasticsearch ("2026-01-01T00:00:00.000Z") -> секунди epoch."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+def iter_blocks(merged):
+    """Розбиває інтервали цілей на блоки розкладу: (ключ блоку, (version, first, last)) - перетин з блоком."""
+    for version, first, last in merged:
+        block_start = first - first % BLOCK_SIZE
+        while block_start <= last:
+            yield f"{version}:{block_start}", (version, max(first, block_start), min(last, block_start + BLOCK_SIZE - 1))
+            block_start += BLOCK_SIZE
+
+def _address_key(ip_address):
+    address = ipaddress.ip_address(ip_address)
+    return address.version, int(address)
+
+def block_key(ip_address):
+    address = ipaddress.ip_address(ip_address)
+    value = int(address)
+    return f"{address.version}:{value - value % BLOCK_SIZE}"
+
+class RescanPlan:
+    """
+    Результат планування: записи в порядку пріоритету -
+    ("block", key, (version, first, last)) - усі порти для адрес блоку, ("service", ip, [порти]) - лише ці порти.
+    Простий список кортежів: передається дочірнім процесам шардованого режиму як є.
+    """
+
+    def __init__(self, entries, ports_count, stats, resumed=False):
+        self.entries = entries
+        self.ports_count = ports_count
+        self.stats = stats
+        self.resumed = resumed # План перерваного запуску, збережений у стані розкладу
+
+    def targets(self, shard=0, shards=1):
+        """Генератор цілей (ip, порти або None - усі порти) для шарду shard з shards."""
+        for entry in self.entries:
+            if entry[0] == "block":
+                for ip_address in iter_addresses([entry[2]], shard, shards):
+                    yield ip_address, None
+            elif int(ipaddress.ip_address(entry[1])) % shards == shard:
+                yield entry[1], entry[2]
+
+    def probe_count(self):
+        return sum((entry[2][2] - entry[2][1] + 1) * self.ports_count if entry[0] == "block" else len(entry[2])
+                   for entry in self.entries)
+
+    def block_keys(self):
+        return [entry[1] for entry in self.entries if entry[0] == "block"]
+
+class RescanScheduler:
+    """
+    Інкрементальне пересканування за станом попередніх запусків.
+    Локальний стан (state_path) зберігає для кожного блоку з BLOCK_SIZE адрес час останнього обходу,
+    кількість знайдених відкритих портів та кількість порожніх обходів поспіль. Відкриті порти та їх
+    timestamp_last_seen читаються з індексу Elasticsearch.
+    Розклад:
+    - блоки, яких ще не сканували, - одразу (найвищий пріоритет);
+    - відомі відкриті (ip, port) - кожні open_interval, лише ці порти;
+    - блоки з відкритими портами - повний обхід кожні live_interval;
+    - порожні блоки - dead_interval, що подвоюється з кожним порожнім обходом до dead_max_interval.
+    max_probes обмежує кількість проб за запуск: решта лишається простроченою до наступного запуску,
+    тож регулярні запуски (наприклад, з cron) безперервно покривають великий простір за частку повного обходу.
+    План зберігається у стані до commit(): перерваний запуск з тими ж цілями отримує той самий план (а не новий,
+    адже перерваний запуск уже оновив timestamp_last_seen в індексі), тож його контрольна точка (src/checkpoint.py)
+    збігається і сканування продовжується з місця зупинки.
+    """
+
+    def __init__(self, state_path=DEFAULT_STATE_PATH, open_interval=DEFAULT_OPEN_INTERVAL,
+                 live_interval=DEFAULT_LIVE_INTERVAL, dead_interval=DEFAULT_DEAD_INTERVAL,
+                 dead_max_interval=DEFAULT_DEAD_MAX_INTERVAL, closed_grace=DEFAULT_CLOSED_GRACE, max_probes=None):
+        self.state_path = state_path
+        self.open_interval = open_interval
+        self.live_interval = live_interval
+        self.dead_interval = dead_interval
+        self.dead_max_interval = dead_max_interval
+        self.closed_grace = closed_grace
+        self.max_probes = max_probes
+        # blocks: ключ блоку -> [час обходу, відкритих портів, порожніх обходів поспіль]
+        # pending: незавершений план {"key", "entries", "stats"} або None
+        self.blocks, self.pending = self._load()
+        self.found = {} # ключ блоку -> відкритих портів, знайдених у поточному запуску
+
+    def _load(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as state_file:
+                state = json.load(state_file)
+            return state["blocks"], state.get("pending")
+        except FileNotFoundError:
+            return {}, None
+        except (ValueError, KeyError) as e:
+            print(f"Попередження: стан розкладу '{self.state_path}' пошкоджено ({e}), починаємо з нуля.")
+            return {}, None
+
+    def save(self):
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as state_file:
+            json.dump({"version": 1, "blocks": self.blocks, "pending": self.pending}, state_file, separators=(",", ":"))
+        os.replace(temporary_path, self.state_path)
+
+    def block_interval(self, state):
+        """Інтервал пересканування блоку за його станом."""
+        _, open_count, empty_streak = state
+        if open_count:
+            return self.live_interval
+        return min(self.dead_max_interval, self.dead_interval * 2 ** max(0, empty_streak - 1))
+
+    async def load_open_services(self, es_client, index, networks, ports):
+        """
+        Відкриті (ip, port) з індексу, бачені за останні closed_grace секунд: {ip: {port: last_seen}}.
+        networks - CIDR-діапазони та адреси розпізнаних імен хостів; запит завжди обмежений ними,
+        порожній список - жодного запиту (інакше повернулися б відкриті сервіси всього індексу).
+        """
+        if not networks:
+            return {}
+        query = {"bool": {"filter": [
+            {"terms": {"port": list(ports)}},
+            {"range": {"timestamp_last_seen": {"gte": f"now-{int(self.closed_grace)}s"}}},
+            {"terms": {"ip_address": list(networks)}},
+        ]}}
+        services = {}
+        scroll_id = None
+        try:
+            response = await es_client.search(index=index, scroll=SEED_SCROLL_KEEPALIVE, size=SEED_PAGE_SIZE,
+                                               sort=["_doc"], query=query,
+                                               source=["ip_address", "port", "timestamp_last_seen"])
+            while True:
+                scroll_id = response.get("_scroll_id")
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                for hit in hits:
+                    source = hit["_source"]
+                    services.setdefault(source["ip_address"], {})[source["port"]] = parse_timestamp(source["timestamp_last_seen"])
+                response = await es_client.scroll(scroll_id=scroll_id, scroll=SEED_SCROLL_KEEPALIVE)
+        except NotFoundError:
+            pass
+        except (ApiError, ConnectionError) as e:
+            print(f"Попередження: не вдалося прочитати відкриті порти з індексу '{index}': {e}. Розклад - лише за блоками.")
+        finally:
+            if scroll_id:
+                try:
+                    await es_client.clear_scroll(scroll_id=scroll_id)
+                except (ApiError, ConnectionError):
+                    pass
+        return services
+
+    async def plan(self, ip_ranges_cidr, ports, es_client=None, index=None, resolver=None, now=None):
+        """Будує RescanPlan для цілей (CIDR та імена хостів - останні розпізнаються в адреси /32, /128)."""
+        now = now or time.time()
+        ports = parse_ports(ports)
+        run_key = {"targets": list(ip_ranges_cidr), "ports": ports, "max_probes": self.max_probes}
+        if self.pending is not None and self.pending["key"] == run_key:
+            entries = [(kind, target, tuple(value) if kind == "block" else value)
+                       for kind, target, value in self.pending["entries"]]
+            print("Розклад: попередній запуск з цими цілями не завершено - використовується його план.")
+            return RescanPlan(entries, len(ports), self.pending["stats"], resumed=True)
+        merged, hostnames = split_targets(ip_ranges_cidr)
+        addresses = []
+        if hostnames:
+            resolution = await (resolver or Resolver()).resolve_many(hostnames)
+            addresses = [address for resolved in resolution.values() for address in resolved]
+            merged = merge_intervals(merged + [host_interval(ipaddress.ip_network(address)) for address in addresses])
+
+        services = {}
+        if es_client is not None:
+            networks = [str(ipaddress.ip_network(entry, strict=False)) for entry in ip_ranges_cidr if entry not in hostnames]
+            services = await self.load_open_services(es_client, index, networks + addresses, ports)
+            # Лише адреси цілей: сервіси поза ними не скануються, навіть якщо запит повернув зайве
+            services = {ip_address: seen_ports for ip_address, seen_ports in services.items()
+                        if interval_contains(merged, *_address_key(ip_address))}
+
+        candidates = [] # (пріоритет, -прострочення, запис)
+        stats = {"new": 0, "live": 0, "dead": 0, "services": 0, "blocks_skipped": 0, "services_skipped": 0}
+        due_blocks = set()
+        for block, interval in iter_blocks(merged):
+            state = self.blocks.get(block)
+            if state is None:
+                candidates.append((PRIORITY_NEW, 0.0, ("block", block, interval)))
+                due_blocks.add(block)
+                continue
+            overdue = (now - state[0]) / self.block_interval(state)
+            if overdue >= 1:
+                candidates.append((PRIORITY_LIVE if state[1] else PRIORITY_DEAD, -overdue, ("block", block, interval)))
+                due_blocks.add(block)
+            else:
+                stats["blocks_skipped"] += 1
+
+        for ip_address, seen_ports in services.items():
+            if block_key(ip_address) in due_blocks:
+                continue # Блок усе одно обходиться повністю
+            due_ports = [port for port, last_seen in seen_ports.items() if now - last_seen >= self.open_interval]
+            if due_ports:
+                overdue = max((now - seen_ports[port]) / self.open_interval for port in due_ports)
+                candidates.append((PRIORITY_OPEN, -overdue, ("service", ip_address, sorted(due_ports))))
+            else:
+                stats["services_skipped"] += 1
+
+        candidates.sort(key=lambda candidate: candidate[:2])
+        entries = []
+        budget = self.max_probes
+        for priority, _, entry in candidates:
+            cost = (entry[2][2] - entry[2][1] + 1) * len(ports) if entry[0] == "block" else len(entry[2])
+            if budget is not None:
+                if cost > budget:
+                    stats["blocks_skipped" if entry[0] == "block" else "services_skipped"] += 1
+                    continue
+                budget -= cost
+            entries.append(entry)
+            if entry[0] == "service":
+                stats["services"] += 1
+            else:
+                stats[("new", "new", "live", "dead")[priority]] += 1
+        self.found = {}
+        self.pending = {"key": run_key, "entries": entries, "stats": stats}
+        self.save()
+        return RescanPlan(entries, len(ports), stats)
+
+    def observe(self, result):
+        """Враховує знайдений відкритий порт (результат сканера) для стану його блоку."""
+        key = block_key(result.ip)
+        self.found[key] = self.found.get(key, 0) + 1
+
+    def commit(self, plan, now=None):
+        """Записує обхід усіх блоків плану (після завершення сканування) та зберігає стан."""
+        now = now or time.time()
+        for key in plan.block_keys():
+            previous = self.blocks.get(key)
+            open_count = self.found.get(key, 0)
+            if not open_count and plan.resumed and previous:
+                # Знахідки перерваної частини запуску не збереглися - живий блок не вважаємо порожнім
+                open_count = previous[1]
+            empty_streak = 0 if open_count else (previous[2] + 1 if previous else 1)
+            self.blocks[key] = [now, open_count, empty_streak]
+        self.pending = None
+        self.save()
+
+    @staticmethod
+    def summary_line(plan):
+        stats = plan.stats
+        return (f"Розклад: нових блоків {stats['new']}, живих {stats['live']}, порожніх {stats['dead']}, "
+                f"відкритих сервісів {stats['services']}; відкладено блоків {stats['blocks_skipped']}, "
+                f"сервісів {stats['services_skipped']}; проб у цьому запуску: {plan.probe_count()}.")
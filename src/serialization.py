@@ -0,0 +1,27 @@
+import json
+
+try:
+    import orjson # Необов'язкова залежність: у кілька разів швидше кодування тіл bulk-запитів
+except ImportError:
+    orjson = None
+
+# Компактний JSON у UTF-8 для тіл bulk API (NDJSON) та спулу. З orjson результат такий самий, як у
+# json.dumps(ensure_ascii=False, separators=(",", ":"), default=str) для документів сканера (рядки, числа, dict).
+# Відбитки змісту (src/change_tracker.py) навмисно лишаються на json: збережені в індексі відбитки не залежать
+# від того, чи встановлено orjson.
+
+if orjson is not None:
+    def dumps(value):
+        """Значення -> компактний JSON (bytes, UTF-8)."""
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(value):
+        """Значення -> компактний JSON (bytes, UTF-8)."""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+def encode_pairs(operations):
+    """
+    Рядки bulk (дія, документ, ...) -> NDJSON кожної пари (bytes). Тіло запиту - b"".join(пари):
+    повтор невдалих елементів склеює вже закодовані пари без повторного кодування.
+    """
+    return [dumps(action) + b"\n" + dumps(source) + b"\n" for action, source in zip(operations[0::2], operations[1::2])]
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import zlib
+
+from src.serialization import dumps
+
+DEFAULT_SPOOL_DIR = "spool"
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024 # Стиснутих байтів у сегменті до переходу на наступний
+DEFAULT_FSYNC_INTERVAL = 1.0 # Секунд між fsync: дані пачок за цей час можуть загубитися при збої живлення
+DEFAULT_COMPRESS_LEVEL = 6
+DEFAULT_REPLAY_IN_FLIGHT = 4 # Одночасних bulk-запитів під час відтворення
+READ_CHUNK_SIZE = 1024 * 1024
+OFFSETS_FILE = "replay_offsets.json"
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.ndjson\.gz$")
+
+# Формат спулу: каталог сегментів segment-NNNNNN.ndjson.gz, що лише доповнюються.
+# Кожна пачка - окремий gzip-член (gzip допускає конкатенацію членів, тож `zcat segment-*.ndjson.gz` дає
+# звичайне тіло bulk API: рядок дії, рядок документа). Межа члена - природна точка відновлення:
+# зміщення відтворення зберігаються у стиснутих байтах і завжди вказують на початок цілої пачки.
+# Незавершений останній член (збій посеред запису) при читанні ігнорується.
+
+def segment_name(sequence):
+    return f"segment-{sequence:06d}.ndjson.gz"
+
+def segment_paths(directory):
+    """Шляхи сегментів каталогу в порядку запису."""
+    try:
+        names = sorted(name for name in os.listdir(directory) if SEGMENT_PATTERN.match(name))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+def encode_operations(operations, level=DEFAULT_COMPRESS_LEVEL):
+    """Рядки bulk-запиту (або вже закодоване тіло NDJSON, bytes) -> один gzip-член NDJSON."""
+    body = operations if isinstance(operations, bytes) else b"".join(dumps(line) + b"\n" for line in operations)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits=31 - формат gzip
+    return compressor.compress(body) + compressor.flush()
+
+def iter_batches(path, offset=0, raw=False):
+    """
+    Читає сегмент з offset (початок gzip-члена). Видає (зміщення наступного члена, [рядки bulk]) для кожної пачки.
+    raw=True - замість розібраних рядків NDJSON пар (дія, документ) як є (bytes), без json.loads: відтворення
+    склеює їх у тіло bulk-запиту напряму. Обрізаний або пошкоджений хвіст пропускається.
+    """
+    with open(path, "rb") as segment:
+        segment.seek(offset)
+        member_start = offset
+        consumed = 0 # Стиснутих байтів поточного члена, вже переданих декомпресору
+        decompressor = zlib.decompressobj(31)
+        output = []
+        while True:
+            data = segment.read(READ_CHUNK_SIZE)
+            if not data:
+                return
+            while data:
+                try:
+                    output.append(decompressor.decompress(data))
+                except zlib.error as e:
+                    print(f"Попередження: пошкоджений спул '{path}' після зміщення {member_start}: {e}")
+                    return
+                if not decompressor.eof:
+                    consumed += len(data)
+                    break
+                member_end = member_start + consumed + len(data) - len(decompressor.unused_data)
+                lines = [line for line in b"".join(output).split(b"\n") if line]
+                if raw:
+                    yield member_end, [action + b"\n" + source + b"\n" for action, source in zip(lines[0::2], lines[1::2])]
+                else:
+                    yield member_end, [json.loads(line) for line in lines]
+                data = decompressor.unused_data
+                member_start, consumed, output = member_end, 0, []
+                decompressor = zlib.decompressobj(31)
+
+class Spool:
+    """
+    Локальний спул результатів у форматі bulk API: append-only сегменти стиснутого NDJSON.
+    Кожна пачка стискається та дописується в потоці (не блокує цикл подій) одним записом; fsync пакетується -
+    не частіше, ніж раз на fsync_interval секунд, а залишок синхронізується відкладено або при close().
+    Сегмент закривається (з fsync), щойно перевищить segment_max_bytes, і далі пишеться наступний.
+    """
+
+    def __init__(self, directory=DEFAULT_SPOOL_DIR, segment_max_bytes=DEFAULT_SEGMENT_MAX_BYTES,
+                 fsync_interval=DEFAULT_FSYNC_INTERVAL, compress_level=DEFAULT_COMPRESS_LEVEL):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        self.compress_level = compress_level
+        os.makedirs(directory, exist_ok=True)
+        existing = segment_paths(directory)
+        # Новий запуск - новий сегмент: попередні сегменти лишаються незмінними
+        self.sequence = int(SEGMENT_PATTERN.match(os.path.basename(existing[-1])).group(1)) + 1 if existing else 1
+        self._fd = None
+        self._segment_bytes = 0
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+        self._fsync_task = None
+        self._lock = asyncio.Lock()
+        self.batches = 0
+        self.operations = 0
+        self.compressed_bytes = 0
+        self.fsyncs = 0
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, segment_name(self.sequence))
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment_bytes = os.fstat(self._fd).st_size
+
+    def _fsync(self):
+        os.fsync(self._fd)
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+        self.fsyncs += 1
+
+    def _close_segment(self):
+        if self._dirty:
+            self._fsync()
+        os.close(self._fd)
+        self._fd = None
+        self.sequence += 1
+
+    def _write(self, operations):
+        member = encode_operations(operations, self.compress_level)
+        if self._fd is None:
+            self._open_segment()
+        os.write(self._fd, member)
+        self._dirty = True
+        self._segment_bytes += len(member)
+        if self._segment_bytes >= self.segment_max_bytes:
+            self._close_segment()
+        elif time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+        return len(member)
+
+    async def append(self, operations):
+        """
+        Дописує пачку рядків bulk (дія, документ, ...) як один gzip-член. operations може бути і готовим
+        тілом NDJSON (bytes, як у send_operations) - тоді воно пишеться без повторного кодування.
+        """
+        if not operations:
+            return
+        # Компактний JSON не містить переносів рядка всередині рядка NDJSON
+        count = operations.count(b"\n") // 2 if isinstance(operations, bytes) else len(operations) // 2
+        async with self._lock:
+            written = await asyncio.to_thread(self._write, operations)
+            self.batches += 1
+            self.operations += count
+            self.compressed_bytes += written
+            if self._dirty and self._fsync_task is None:
+                self._fsync_task = asyncio.create_task(self._deferred_fsync())
+
+    async def _deferred_fsync(self):
+        """Синхронізує останні пачки, якщо після них записів не було (fsync інакше чекав би наступного запису)."""
+        try:
+            while True:
+                await asyncio.sleep(max(0.0, self._last_fsync + self.fsync_interval - time.monotonic()))
+                async with self._lock:
+                    if not self._dirty or self._fd is None:
+                        return
+                    if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                        await asyncio.to_thread(self._fsync)
+                        return
+        finally:
+            self._fsync_task = None
+
+    async def close(self):
+        if self._fsync_task is not None:
+            # Дочекатися скасування: fsync, що вже виконується в потоці, не має перетнутися з os.close
+            self._fsync_task.cancel()
+            await asyncio.gather(self._fsync_task, return_exceptions=True)
+        async with self._lock:
+            if self._fd is not None:
+                await asyncio.to_thread(self._close_segment)
+
+    def summary_line(self):
+        return (f"Спул '{self.directory}': {self.batches} пачок, {self.operations} операцій, "
+                f"{self.compressed_bytes / 1048576:.1f} МБ стиснуто, fsync: {self.fsyncs}.")
+
+# ---- Відтворення спулу в Elasticsearch ----
+def load_offsets(directory):
+    try:
+        with open(os.path.join(directory, OFFSETS_FILE), encoding="utf-8") as offsets_file:
+            return json.load(offsets_file)
+    except FileNotFoundError:
+        return {}
+
+def save_offsets(directory, offsets):
+    """Атомарно (через тимчасовий файл) зберігає зміщення відтворення: ім'я сегмента -> байт наступної пачки."""
+    path = os.path.join(directory, OFFSETS_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as offsets_file:
+        json.dump(offsets, offsets_file)
+        offsets_file.flush()
+        os.fsync(offsets_file.fileno())
+    os.replace(path + ".tmp", path)
+
+async def replay_spool(es_client, directory=DEFAULT_SPOOL_DIR, max_in_flight=DEFAULT_REPLAY_IN_FLIGHT,
+                       delete_replayed=False, dead_letter_path=None):
+    """
+    Відправляє пачки спулу до Elasticsearch (до max_in_flight bulk-запитів одночасно) і зберігає зміщення
+    після кожної пачки, всі попередні до якої вже записані - перерваний запуск продовжується з місця зупинки.
+    Якщо пачку не вдалося записати навіть після повторів (кластер недоступний), відтворення зупиняється,
+    не просуваючи зміщення. delete_replayed=True видаляє повністю відтворені сегменти, крім останнього
+    (у нього ще може писати сканер). Повертає кількість записаних документів.
+    """
+    from src.data_ingester import DEFAULT_DEAD_LETTER_PATH, send_operations
+
+    dead_letter_path = dead_letter_path or DEFAULT_DEAD_LETTER_PATH
+    offsets = load_offsets(directory)
+    paths = segment_paths(directory)
+    slots = asyncio.Semaphore(max_in_flight)
+    indexed_total = 0
+    stopped = False
+
+    async def send(pairs):
+        try:
+            # Сирі пари спулу йдуть у тіло запиту без розбору; JSON розбирається лише для невдалих елементів
+            return await send_operations(es_client, None, dead_letter_path=dead_letter_path, encoded=pairs)
+        finally:
+            slots.release()
+
+    for path in paths:
+        name = os.path.basename(path)
+        pending = [] # (зміщення після пачки, задача) у порядку файлу
+        for next_offset, pairs in iter_batches(path, offsets.get(name, 0), raw=True):
+            await slots.acquire()
+            pending.append((next_offset, asyncio.create_task(send(pairs))))
+            # Фіксуємо зміщення для завершеного префіксу пачок
+            while pending and pending[0][1].done():
+                next_done, task = pending.pop(0)
+                indexed, exhausted = task.result()
+                indexed_total += indexed
+                if exhausted:
+                    stopped = True
+                    break
+                offsets[name] = next_done
+                save_offsets(directory, offsets)
+            if stopped:
+                break
+        for next_done, task in pending:
+            indexed, exhausted = await task
+            indexed_total += indexed
+            if exhausted:
+                stopped = True
+            if not stopped:
+                offsets[name] = next_done
+                save_offsets(directory, offsets)
+        if stopped:
+            print(f"Відтворення зупинено на '{name}' (зміщення {offsets.get(name, 0)}): кластер не приймає записи. "
+                  "Повторний запуск продовжить з цього місця.")
+            break
+        if delete_replayed and path != paths[-1] and offsets.get(name, 0) == os.path.getsize(path):
+            os.remove(path)
+            offsets.pop(name, None)
+            save_offsets(directory, offsets)
+    print(f"Відтворення спулу '{directory}': записано {indexed_total} документів.")
+    return indexed_total
+
+if __name__ == "__main__":
+    # Відтворення: python -m src.spool replay [каталог] [http://хост:9200] [--delete]
+    # Статистика: python -m src.spool stats [каталог]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if args and args[0] == "replay":
+        from elasticsearch import AsyncElasticsearch
+
+        async def replay_main():
+            directory = args[1] if len(args) > 1 else DEFAULT_SPOOL_DIR
+            host = args[2] if len(args) > 2 else "http://172.18.144.1:9200"
+            es_client = AsyncElasticsearch(host)
+            try:
+                await replay_spool(es_client, directory, delete_replayed="--delete" in sys.argv)
+            finally:
+                await es_client.close()
+
+        asyncio.run(replay_main())
+    elif args and args[0] == "stats":
+        directory = args[1] if len(args) > 1 else DEFAULT_SPOOL_DIR
+        offsets = load_offsets(directory)
+        for path in segment_paths(directory):
+            name = os.path.basename(path)
+            batches = operations = 0
+            for _, pairs in iter_batches(path, raw=True):
+                batches += 1
+                operations += len(pairs)
+            size = os.path.getsize(path)
+            print(f"{name}: {size} байт, {batches} пачок, {operations} операцій, відтворено до {offsets.get(name, 0)}")
+    else:
+        print("Використання: python -m src.spool replay [каталог] [http://хост:9200] [--delete] | stats [каталог]")
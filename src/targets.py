@@ -0,0 +1,174 @@
+import asyncio
+import bisect
+import ipaddress
+import zlib
+
+from src.resolver import Resolver
+
+# Розмір обмеженої черги цілей: генератор не випереджає робітників більше ніж на стільки адрес,
+# тому пам'ять не залежить від розміру діапазону (/8 чи /30 - однаково)
+TARGET_QUEUE_SIZE = 1000
+
+# ---- Інтервальне представлення простору цілей ----
+def host_interval(network):
+    """
+    Повертає (version, first, last) - цілочисельні межі адрес, які повернув би network.hosts(),
+    без матеріалізації самих адрес.
+    """
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.version == 4 and network.prefixlen < 31:
+        return 4, first + 1, last - 1 # Без адреси мережі та broadcast
+    if network.version == 6 and network.prefixlen < 127:
+        return 6, first + 1, last # Без Subnet-Router anycast
+    return network.version, first, last
+
+def merge_intervals(intervals):
+    """
+    Об'єднує інтервали, що перетинаються або стикуються, у відсортований список (version, first, last).
+    Замінює дедуплікацію через множину рядків: перекриття діапазонів прибирається за O(n log n) по кількості CIDR,
+    а не по кількості адрес.
+    """
+    merged = []
+    for version, first, last in sorted(intervals):
+        if merged and merged[-1][0] == version and first <= merged[-1][2] + 1:
+            if last > merged[-1][2]:
+                merged[-1] = (version, merged[-1][1], last)
+        else:
+            merged.append((version, first, last))
+    return merged
+
+def interval_contains(merged, version, value):
+    """Перевіряє бінарним пошуком, чи входить адреса (version, value) до об'єднаних інтервалів."""
+    index = bisect.bisect_right(merged, (version, value, float('inf'))) - 1
+    if index < 0:
+        return False
+    found_version, first, last = merged[index]
+    return found_version == version and first <= value <= last
+
+def count_addresses(merged):
+    """Кількість адрес в об'єднаних інтервалах (без їх генерації)."""
+    return sum(last - first + 1 for _, first, last in merged)
+
+def _shard_ranges(merged, shard, shards):
+    """Для кожного інтервалу - (version, range значень адрес шарду)."""
+    base = 0 # Наскрізний номер першої адреси поточного інтервалу
+    for version, first, last in merged:
+        offset = (shard - base) % shards
+        yield version, range(first + offset, last + 1, shards)
+        base += last - first + 1
+
+def count_shard_addresses(merged, shard=0, shards=1):
+    """Кількість адрес шарду shard з shards (без їх генерації)."""
+    return sum(len(values) for _, values in _shard_ranges(merged, shard, shards))
+
+def iter_addresses(merged, shard=0, shards=1, start=0):
+    """
+    Лінивий генератор рядкових IP-адрес з об'єднаних інтервалів.
+    shard/shards - детермінований розподіл між процесами: шард k отримує адреси з наскрізним номером i,
+    де i % shards == k. Адреси чергуються, тож кожна підмережа рівномірно ділиться між процесами.
+    start - почати з адреси шарду з цим порядковим номером; пропущені адреси не генеруються.
+    """
+    for version, values in _shard_ranges(merged, shard, shards):
+        if start >= len(values):
+            start -= len(values)
+            continue
+        address_class = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+        for value in values[start:]:
+            yield str(address_class(value))
+        start = 0
+
+def hostname_shard(hostname, shards):
+    """Стабільний (між процесами та запусками) номер шарду для імені хоста."""
+    return zlib.crc32(hostname.lower().encode('utf-8')) % shards
+
+def split_targets(ip_ranges_cidr):
+    """
+    Розділяє вхідний список на інтервали IP-мереж та імена хостів.
+    Повертає (merged_intervals, hostnames).
+    """
+    intervals = []
+    hostnames = []
+    for ip_entry in ip_ranges_cidr:
+        try:
+            network = ipaddress.ip_network(ip_entry, strict=False)
+            intervals.append(host_interval(network))
+        except ValueError:
+            hostnames.append(ip_entry)
+    return merge_intervals(intervals), hostnames
+
+async def produce_targets(ip_ranges_cidr, ip_queue, shard=None, resolver=None, checkpoint=None):
+    """
+    Потоково заповнює обмежену ip_queue цілями (порядковий номер, адреса, None - усі порти).
+    Спочатку віддає адреси з CIDR, поки імена хостів паралельно розпізнаються у фоні (скануванню не потрібно
+    чекати DNS), потім усі A/AAAA адреси імен, пропускаючи ті, що вже входять до CIDR-діапазонів.
+    Повертає кількість поставлених у чергу адрес.
+    shard - (index, count) для багатопроцесного режиму: віддаються лише цілі цього шарду.
+    checkpoint - ScanCheckpoint (src/checkpoint.py): цілі, завершені попереднім запуском, пропускаються.
+    """
+    shard_index, shards = shard or (0, 1)
+    merged, hostnames = split_targets(ip_ranges_cidr)
+    if shards > 1:
+        hostnames = [hostname for hostname in hostnames if hostname_shard(hostname, shards) == shard_index]
+    if merged:
+        total = count_addresses(merged)
+        if shards > 1:
+            print(f"Шард {shard_index + 1}/{shards}: ~{total // shards} з {total} унікальних адрес з CIDR-діапазонів.")
+        else:
+            print(f"Ініціалізація сканування для {total} унікальних адрес з CIDR-діапазонів.")
+
+    resolution = None
+    if hostnames:
+        resolver = resolver or Resolver()
+        resolution = asyncio.create_task(resolver.resolve_many(hostnames))
+
+    queued = 0
+    shard_total = count_shard_addresses(merged, shard_index, shards)
+    gaps = checkpoint.pending_ranges(0, shard_total) if checkpoint else [(0, shard_total)]
+    try:
+        # Завершені діапазони пропускаються цілком - без генерації їх адрес
+        for start, stop in gaps:
+            addresses = iter_addresses(merged, shard_index, shards, start)
+            for sequence, ip_address in zip(range(start, stop), addresses):
+                await ip_queue.put((sequence, ip_address, None))
+                queued += 1
+    except BaseException:
+        if resolution is not None:
+            resolution.cancel()
+        raise
+
+    if resolution is None:
+        return queued
+
+    sequence = shard_total
+    resolved_seen = set() # Лише для імен хостів - їх небагато порівняно з адресами мереж
+    for hostname, addresses in (await resolution).items():
+        if not addresses:
+            print(f"Пропущено: '{hostname}' не є дійсною IP-мережею або іменем хоста.")
+            continue
+        for resolved_ip in sorted(addresses): # Стабільний порядок - стабільні порядкові номери для контрольних точок
+            address = ipaddress.ip_address(resolved_ip)
+            if resolved_ip in resolved_seen or interval_contains(merged, address.version, int(address)):
+                continue
+            resolved_seen.add(resolved_ip)
+            if not (checkpoint and checkpoint.is_done(sequence)):
+                await ip_queue.put((sequence, resolved_ip, None))
+                queued += 1
+            sequence += 1
+
+    return queued
+
+async def produce_planned_targets(plan, ip_queue, shard=None, checkpoint=None):
+    """
+    Заповнює ip_queue цілями плану пересканування (src/scheduler.py) у порядку пріоритету:
+    адреси блоків - усі порти, відомі відкриті сервіси - лише їх порти.
+    Повертає кількість поставлених у чергу цілей.
+    """
+    shard_index, shards = shard or (0, 1)
+    queued = 0
+    for sequence, (ip_address, ports) in enumerate(plan.targets(shard_index, shards)):
+        if checkpoint and checkpoint.is_done(sequence):
+            continue
+        await ip_queue.put((sequence, ip_address, ports))
+        queued += 1
+    return queued
@@ -0,0 +1,136 @@
+import ipaddress
+from collections import OrderedDict
+
+# Межі адаптивних таймаутів (секунди)
+DEFAULT_MIN_TIMEOUT = 0.1 # Нижня межа таймауту з'єднання (LAN)
+DEFAULT_MAX_TIMEOUT = 5.0 # Верхня межа; також початкове значення, поки немає вимірів
+DEFAULT_MIN_READ_TIMEOUT = 0.5 # Нижня межа таймауту читання банера
+DEFAULT_MAX_READ_TIMEOUT = 5.0 # Верхня межа таймауту читання банера
+READ_TIMEOUT_MULTIPLIER = 4 # Сервісу даємо кілька RTT на відповідь після з'єднання
+BASELINE_TIMEOUT = 5.0 # Фіксований таймаут попередньої версії - для оцінки зекономленого часу
+
+# Скільки хостів/підмереж тримати в пам'яті (LRU), щоб сканування /8 не накопичувало стан на кожну адресу
+MAX_TRACKED_HOSTS = 65536
+MAX_TRACKED_SUBNETS = 16384
+
+class RttStats:
+    """
+    Згладжений RTT та його варіація (алгоритм Якобсона, як у TCP/nmap) і множник експоненційного відступу:
+    кожен таймаут з'єднання подвоює таймаут (як RTO у TCP), перший вимір RTT скидає множник.
+    """
+    __slots__ = ('srtt', 'rttvar', 'samples', 'backoff')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.backoff = 1
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            delta = rtt - self.srtt
+            self.srtt += delta / 8
+            self.rttvar += (abs(delta) - self.rttvar) / 4
+        self.samples += 1
+        self.backoff = 1
+
+    def timeout(self):
+        return (self.srtt + 4 * self.rttvar) * self.backoff
+
+    def back_off(self, ceiling):
+        """Подвоює таймаут після таймауту з'єднання, доки він не сягне ceiling."""
+        if self.samples and self.timeout() < ceiling:
+            self.backoff *= 2
+
+class RttEstimator:
+    """
+    Оцінювач RTT на рівні хоста, підмережі (/24 для IPv4, /64 для IPv6) та всього сканування.
+    Живиться часом успішних з'єднань і RST (ConnectionRefusedError) та видає
+    таймаути з'єднання й читання банера в межах [floor, ceiling].
+    Для хоста без вимірів використовується статистика його підмережі; без вимірів і в ній - max_timeout
+    (загальна статистика не підходить: хост повільної мережі отримав би таймаут швидкої LAN і ніколи б не відповів).
+    Таймаут з'єднання подвоює таймаут хоста та його підмережі (до max_timeout), успішне з'єднання чи RST - скидає.
+    """
+
+    def __init__(self, min_timeout=DEFAULT_MIN_TIMEOUT, max_timeout=DEFAULT_MAX_TIMEOUT,
+                 min_read_timeout=DEFAULT_MIN_READ_TIMEOUT, max_read_timeout=DEFAULT_MAX_READ_TIMEOUT,
+                 baseline_timeout=BASELINE_TIMEOUT):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_read_timeout = min_read_timeout
+        self.max_read_timeout = max_read_timeout
+        self.baseline_timeout = baseline_timeout
+        self.hosts = OrderedDict()
+        self.subnets = OrderedDict()
+        self.overall = RttStats()
+        self.connect_timeouts = 0
+        self.read_timeouts = 0
+        self.time_saved = 0.0
+
+    @staticmethod
+    def subnet_key(ip_address):
+        if ':' not in ip_address:
+            return ip_address.rsplit('.', 1)[0] + '.0/24' # Швидкий шлях для IPv4
+        return str(ipaddress.ip_network(f"{ip_address}/64", strict=False))
+
+    @staticmethod
+    def _get(table, key, limit, create):
+        stats = table.get(key)
+        if stats is not None:
+            table.move_to_end(key)
+        elif create:
+            stats = table[key] = RttStats()
+            if len(table) > limit:
+                table.popitem(last=False)
+        return stats
+
+    def _stats_for(self, ip_address):
+        stats = self._get(self.hosts, ip_address, MAX_TRACKED_HOSTS, create=False)
+        if stats is None or not stats.samples:
+            stats = self._get(self.subnets, self.subnet_key(ip_address), MAX_TRACKED_SUBNETS, create=False)
+        if stats is None or not stats.samples:
+            return None
+        return stats
+
+    def observe(self, ip_address, rtt):
+        """Додає вимір RTT (успішне з'єднання або RST)."""
+        self._get(self.hosts, ip_address, MAX_TRACKED_HOSTS, create=True).update(rtt)
+        self._get(self.subnets, self.subnet_key(ip_address), MAX_TRACKED_SUBNETS, create=True).update(rtt)
+        self.overall.update(rtt)
+
+    def connect_timeout(self, ip_address):
+        stats = self._stats_for(ip_address)
+        if stats is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, stats.timeout()))
+
+    def read_timeout(self, ip_address):
+        stats = self._stats_for(ip_address)
+        if stats is None:
+            return self.max_read_timeout
+        return min(self.max_read_timeout, max(self.min_read_timeout, stats.timeout() * READ_TIMEOUT_MULTIPLIER))
+
+    def record_connect_timeout(self, ip_address, used_timeout):
+        """Таймаут з'єднання: відступ для хоста та підмережі, щоб повільний хост отримав довший таймаут."""
+        self.connect_timeouts += 1
+        self.time_saved += max(0.0, self.baseline_timeout - used_timeout)
+        self._get(self.hosts, ip_address, MAX_TRACKED_HOSTS, create=True).back_off(self.max_timeout)
+        self._get(self.subnets, self.subnet_key(ip_address), MAX_TRACKED_SUBNETS, create=True).back_off(self.max_timeout)
+
+    def record_read_timeout(self, used_timeout):
+        self.read_timeouts += 1
+        self.time_saved += max(0.0, self.baseline_timeout - used_timeout)
+
+    def summary(self):
+        """Підсумок для звіту сканування."""
+        return {
+            "srtt": self.overall.srtt,
+            "rttvar": self.overall.rttvar,
+            "rtt_samples": self.overall.samples,
+            "connect_timeouts": self.connect_timeouts,
+            "read_timeouts": self.read_timeouts,
+            "estimated_time_saved": self.time_saved,
+        }
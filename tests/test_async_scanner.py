@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+import src.async_scanner as async_scanner
+
+async def greet(reader, writer):
+    writer.write(b"SSH-2.0-OpenSSH_8.9\r\n")
+    await writer.drain()
+    writer.close()
+
+def test_failing_producer_stops_both_stages(monkeypatch):
+    async def failing_producer(ip_ranges_cidr, ip_queue, shard=None, resolver=None, checkpoint=None):
+        for sequence in range(3):
+            await ip_queue.put((sequence, "127.0.0.1", None))
+        raise RuntimeError("target source broke")
+
+    monkeypatch.setattr(async_scanner, "produce_targets", failing_producer)
+
+    async def scan():
+        server = await asyncio.start_server(greet, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            with pytest.raises(RuntimeError, match="target source broke"):
+                await asyncio.wait_for(async_scanner.main_async_scanner(
+                    ["127.0.0.1/32"], [port], 4, asyncio.Queue(), max_banner_workers=2), timeout=10)
+        finally:
+            server.close()
+            await server.wait_closed()
+        assert asyncio.all_tasks() == {asyncio.current_task()} # Жодних робітників без власника
+
+    asyncio.run(scan())
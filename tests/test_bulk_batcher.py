@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from src.async_scanner import ScanResult
+from src.data_ingester import BulkBatcher
+
+class FailingTransport:
+    """Клієнт, чий bulk-запит падає непередбаченою помилкою."""
+
+    def options(self, **kwargs):
+        return self
+
+    async def bulk(self, operations):
+        raise RuntimeError("transport broke")
+
+class FailingSpool:
+    operations = 0
+
+    async def append(self, body):
+        raise OSError("disk full")
+
+def results(count):
+    return [ScanResult(f"10.0.0.{number}", 22, "SSH-2.0-OpenSSH_8.9", "passive", None) for number in range(count)]
+
+async def run_batcher(batcher, scan_results):
+    for scan_result in scan_results:
+        await batcher.add(scan_result)
+    await batcher.close()
+
+def test_transport_error_is_dead_lettered(tmp_path):
+    dead_letter_path = tmp_path / "dead.ndjson"
+    persisted = []
+    batcher = BulkBatcher(FailingTransport(), dead_letter_path=str(dead_letter_path),
+                          on_persisted=lambda ok, failed: persisted.append((len(ok), len(failed))))
+    asyncio.run(run_batcher(batcher, results(3)))
+    assert batcher.indexed == 0
+    assert [json.loads(line)["error"] for line in dead_letter_path.read_text().splitlines()] == ["transport broke"] * 3
+    assert persisted == [(3, 0)] # Остаточна помилка записана до dead letters - повтор не допоможе
+
+def test_failed_send_is_reported_by_close():
+    failed_batches = []
+    batcher = BulkBatcher(None, spool=FailingSpool(), dead_letter_path=None,
+                          on_persisted=lambda ok, failed: failed_batches.append(len(failed)))
+    with pytest.raises(OSError, match="disk full"):
+        asyncio.run(run_batcher(batcher, results(3)))
+    assert batcher.lost == 3
+    assert failed_batches == [3]
+    assert not batcher.in_flight
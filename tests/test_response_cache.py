@@ -0,0 +1,22 @@
+from src.query import LIST_PARAMS
+from src.response_cache import normalize_args
+
+class Args(dict):
+    """Мінімальний аналог MultiDict з Flask: ім'я -> список значень."""
+
+    def getlist(self, name):
+        return self[name]
+
+def key(**params):
+    return normalize_args(Args({name: list(values) for name, values in params.items()}), LIST_PARAMS)
+
+def test_list_filters_are_order_independent():
+    assert key(port=["80,22"], country=["UA"]) == key(country=["UA"], port=["22", "80"])
+
+def test_free_text_query_kept_verbatim():
+    assert key(q=["a,b"]) != key(q=["b,a"])
+    assert key(q=["a,b"]) != key(q=["a", "b"])
+
+def test_cursor_and_time_kept_verbatim():
+    assert dict(key(after=["WzEsMl0,x"]))["after"] == ("WzEsMl0,x",)
+    assert key(since=["now-1d,x"]) != key(since=["x,now-1d"])
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from src.checkpoint import scan_fingerprint
+from src.scheduler import RescanScheduler
+
+TARGETS = ["10.0.0.0/23"]
+PORTS = "22,80"
+
+def test_interrupted_plan_is_resumed(tmp_path):
+    state_path = str(tmp_path / "rescan_state.json")
+    interrupted = asyncio.run(RescanScheduler(state_path).plan(TARGETS, PORTS))
+    assert not interrupted.resumed
+    # Запуск перервано до commit(): новий процес читає той самий стан
+    scheduler = RescanScheduler(state_path)
+    resumed = asyncio.run(scheduler.plan(TARGETS, PORTS))
+    assert resumed.resumed
+    assert resumed.entries == interrupted.entries
+    assert scan_fingerprint(TARGETS, [22, 80], 1, resumed) == scan_fingerprint(TARGETS, [22, 80], 1, interrupted)
+
+    scheduler.commit(resumed)
+    after_commit = asyncio.run(RescanScheduler(state_path).plan(TARGETS, PORTS))
+    assert not after_commit.resumed
+    assert after_commit.entries == [] # Усі блоки щойно обійдено
+
+def test_pending_plan_not_reused_for_other_targets(tmp_path):
+    state_path = str(tmp_path / "rescan_state.json")
+    asyncio.run(RescanScheduler(state_path).plan(TARGETS, PORTS))
+    other = asyncio.run(RescanScheduler(state_path).plan(["10.0.5.0/24"], PORTS))
+    assert not other.resumed
+    assert [entry[1] for entry in other.entries] == ["4:167773440"]
+
+class StaticResolver:
+    def __init__(self, table):
+        self.table = table
+
+    async def resolve_many(self, hostnames):
+        return {hostname: self.table.get(hostname, []) for hostname in hostnames}
+
+class IndexClient:
+    """Відповідає на scroll-запит load_open_services фіксованими документами, запам'ятовуючи запити."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    async def search(self, query=None, **kwargs):
+        self.queries.append(query)
+        hits = [{"_source": document} for document in self.documents]
+        return {"_scroll_id": "scroll", "hits": {"hits": hits}}
+
+    async def scroll(self, **kwargs):
+        return {"_scroll_id": "scroll", "hits": {"hits": []}}
+
+    async def clear_scroll(self, **kwargs):
+        pass
+
+def test_open_services_limited_to_resolved_targets(tmp_path):
+    state_path = str(tmp_path / "rescan_state.json")
+    seen = "2020-01-01T00:00:00.000Z"
+    client = IndexClient([
+        {"ip_address": "198.51.100.7", "port": 22, "timestamp_last_seen": seen},
+        {"ip_address": "203.0.113.9", "port": 22, "timestamp_last_seen": seen}, # Поза цілями
+    ])
+    scheduler = RescanScheduler(state_path)
+    # Блок адреси цілі щойно обійдено - у плані лише сервіси
+    scheduler.blocks["4:3325256704"] = [2e9, 1, 0]
+    plan = asyncio.run(scheduler.plan(["target.example"], PORTS, client, "scan_results",
+                                      resolver=StaticResolver({"target.example": ["198.51.100.7"]}), now=2e9))
+    assert plan.entries == [("service", "198.51.100.7", [22])]
+    ip_filter = client.queries[0]["bool"]["filter"][-1]
+    assert ip_filter == {"terms": {"ip_address": ["198.51.100.7"]}}
+
+def test_unresolved_targets_skip_index_query(tmp_path):
+    client = IndexClient([{"ip_address": "203.0.113.9", "port": 22, "timestamp_last_seen": "2020-01-01T00:00:00.000Z"}])
+    plan = asyncio.run(RescanScheduler(str(tmp_path / "state.json")).plan(
+        ["missing.example"], PORTS, client, "scan_results", resolver=StaticResolver({})))
+    assert plan.entries == []
+    assert client.queries == []
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from src.serialization import encode_pairs
+from src.spool import Spool, iter_batches, load_offsets, replay_spool, segment_paths
+
+OPERATIONS = [
+    {"index": {"_index": "scan_results", "_id": "10.0.0.1-22"}}, {"ip_address": "10.0.0.1", "port": 22, "banner": "SSH-2.0-a"},
+    {"index": {"_index": "scan_results", "_id": "10.0.0.2-80"}}, {"ip_address": "10.0.0.2", "port": 80, "banner": "HTTP/1.1 200 OK"},
+]
+
+class RecordingClient:
+    """Приймає тіла bulk-запитів; другий елемент кожного запиту відхиляється з остаточною помилкою 400."""
+
+    def __init__(self):
+        self.bodies = []
+
+    def options(self, **kwargs):
+        return self
+
+    async def bulk(self, operations):
+        self.bodies.append(operations)
+        count = operations.count(b"\n") // 2
+        items = [{"index": {"status": 201}}] + [{"index": {"status": 400, "error": "mapper_parsing_exception"}}] * (count - 1)
+        return {"errors": count > 1, "items": items}
+
+async def write_spool(directory):
+    spool = Spool(directory)
+    await spool.append(b"".join(encode_pairs(OPERATIONS)))
+    await spool.close()
+
+def test_replay_sends_spooled_bytes_unchanged(tmp_path):
+    directory = str(tmp_path / "spool")
+    dead_letter_path = tmp_path / "dead.ndjson"
+    asyncio.run(write_spool(directory))
+    client = RecordingClient()
+    indexed = asyncio.run(replay_spool(client, directory, dead_letter_path=str(dead_letter_path)))
+    assert indexed == 1
+    assert client.bodies == [b"".join(encode_pairs(OPERATIONS))]
+    dead = [json.loads(line) for line in dead_letter_path.read_text().splitlines()]
+    assert [(entry["action"], entry["source"], entry["status"]) for entry in dead] == [(OPERATIONS[2], OPERATIONS[3], 400)]
+    path = segment_paths(directory)[0]
+    assert load_offsets(directory)[os.path.basename(path)] == os.path.getsize(path)
+
+def test_raw_batches_match_parsed(tmp_path):
+    directory = str(tmp_path / "spool")
+    asyncio.run(write_spool(directory))
+    path = segment_paths(directory)[0]
+    (_, parsed), = iter_batches(path)
+    (_, pairs), = iter_batches(path, raw=True)
+    assert parsed == OPERATIONS
+    assert pairs == encode_pairs(OPERATIONS)
@@ -0,0 +1,26 @@
+from src.timing import DEFAULT_MAX_TIMEOUT, RttEstimator
+
+def test_connect_timeout_backs_off_until_success():
+    timing = RttEstimator(min_timeout=0.1, max_timeout=5.0)
+    timing.observe("10.0.0.1", 0.2)
+    first = timing.connect_timeout("10.0.0.1")
+    timing.record_connect_timeout("10.0.0.1", first)
+    second = timing.connect_timeout("10.0.0.1")
+    assert second == first * 2
+    for _ in range(10):
+        timing.record_connect_timeout("10.0.0.1", timing.connect_timeout("10.0.0.1"))
+    assert timing.connect_timeout("10.0.0.1") == 5.0
+    timing.observe("10.0.0.1", 0.2) # Відповідь скидає відступ
+    assert timing.connect_timeout("10.0.0.1") < second
+
+def test_unmeasured_subnet_gets_max_timeout():
+    timing = RttEstimator()
+    timing.observe("192.168.1.10", 0.001) # Швидка LAN
+    assert timing.connect_timeout("203.0.113.5") == DEFAULT_MAX_TIMEOUT
+    timing.record_connect_timeout("203.0.113.5", DEFAULT_MAX_TIMEOUT)
+    assert timing.connect_timeout("203.0.113.5") == DEFAULT_MAX_TIMEOUT
+
+def test_host_without_samples_uses_subnet():
+    timing = RttEstimator(min_timeout=0.1)
+    timing.observe("10.0.0.1", 0.2)
+    assert timing.connect_timeout("10.0.0.2") == timing.connect_timeout("10.0.0.1")